@@ -1,5 +1,8 @@
 """Main FastAPI application for the AI Voice Policy Assistant."""
 
+import logging
+import logging.handlers
+import queue
 import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
@@ -11,10 +14,11 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 
-from api.routes import auth, chat, ws_audio, corpus, admin
+from api.routes import auth, chat, ws_audio, corpus, admin, batch
 from api.models.db import create_tables
 from api.services.cache import cache_service
 from api.services.llm import llm_service
+from api.services.rate_limit import rate_limit_service
 from api.services.stt import stt_service
 from api.services.vectorizer import vectorizer_service
 from api.utils.config import settings
@@ -63,11 +67,34 @@ embeddings_generated_total = Counter(
 limiter = Limiter(key_func=get_remote_address)
 
 
+def _start_log_listener() -> logging.handlers.QueueListener:
+    """
+    Put the root logger's handlers behind a queue drained by a listener thread,
+    so logging from the event loop never blocks on stream writes. The root
+    level comes from settings.log_level.
+    """
+    root = logging.getLogger()
+    root.setLevel(settings.log_level.upper())
+    handlers = list(root.handlers)
+    if not handlers:
+        # The queue bypasses logging's last-resort stderr handler, so give
+        # records somewhere to go
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handlers = [handler]
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    listener.start()
+    return listener
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
     # Startup
     print("Starting AI Voice Policy Assistant...")
+    log_listener = _start_log_listener()
     
     # Create database tables
     try:
@@ -83,6 +110,12 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Warning: Could not connect to cache: {e}")
     
+    try:
+        await rate_limit_service.connect()
+        print("Rate limit service connected")
+    except Exception as e:
+        print(f"Warning: Could not connect rate limit service: {e}")
+    
     try:
         await llm_service.connect()
         print("LLM service connected")
@@ -100,6 +133,12 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Warning: Error disconnecting cache service: {e}")
     
+    try:
+        await rate_limit_service.disconnect()
+        print("Rate limit service disconnected")
+    except Exception as e:
+        print(f"Warning: Error disconnecting rate limit service: {e}")
+    
     try:
         await llm_service.disconnect()
         print("LLM service disconnected")
@@ -117,6 +156,10 @@ async def lifespan(app: FastAPI):
         print("Vectorizer service closed")
     except Exception as e:
         print(f"Warning: Error closing vectorizer service: {e}")
+    
+    # Flush queued log records and hand the root logger its handlers back
+    log_listener.stop()
+    logging.getLogger().handlers = list(log_listener.handlers)
 
 
 # Create FastAPI app
@@ -214,6 +257,11 @@ app.include_router(
     tags=["Administration"]
 )
 
+app.include_router(
+    batch.router,
+    tags=["Batch"]
+)
+
 
 # Health check endpoint
 @app.get("/healthz", tags=["Health"])
@@ -338,5 +386,10 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=settings.debug,
-        log_level=settings.log_level.lower()
+        log_level=settings.log_level.lower(),
+        loop="uvloop",
+        http="httptools",
+        ws="websockets",
+        ws_max_size=1_048_576,  # Room for base64 voice chunks
+        ws_ping_interval=20
     )
@@ -1,12 +1,15 @@
 """Database connection and session management."""
 
+import logging
 from typing import Generator
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlmodel import SQLModel
 from api.utils.config import get_database_url
 
+logger = logging.getLogger(__name__)
+
 # Create database engine
 DATABASE_URL = get_database_url()
 engine = create_engine(
@@ -16,6 +19,20 @@ engine = create_engine(
     pool_recycle=300,
 )
 
+@event.listens_for(engine, "connect")
+def _register_vector_types(dbapi_connection, connection_record):
+    """Load pgvector columns as numpy arrays / HalfVector objects instead of strings."""
+    try:
+        if engine.dialect.driver == "psycopg":
+            from pgvector.psycopg import register_vector
+        else:
+            from pgvector.psycopg2 import register_vector
+        register_vector(dbapi_connection)
+    except Exception as e:
+        # e.g. the vector extension isn't installed yet; values stay as text
+        logger.warning(f"pgvector types not registered: {e}")
+
+
 # Create session factory
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -38,6 +55,9 @@ def get_db() -> Generator[Session, None, None]:
 
 def create_tables():
     """Create all database tables."""
+    with engine.begin() as conn:
+        # Needed by the trigram indexes on doc
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
     SQLModel.metadata.create_all(engine)
 
 
@@ -46,6 +66,28 @@ def drop_tables():
     SQLModel.metadata.drop_all(engine)
 
 
+def migrate_embeddings_to_halfvec():
+    """Convert an existing embedding.vector column to halfvec and rebuild its HNSW index."""
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_embedding_vector_hnsw"))
+        conn.execute(text(
+            "ALTER TABLE embedding ALTER COLUMN vector TYPE halfvec(384) USING vector::halfvec(384)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX ix_embedding_vector_hnsw ON embedding "
+            "USING hnsw (vector halfvec_ip_ops) WITH (m = 24, ef_construction = 128)"
+        ))
+
+
+def migrate_searchcache_params():
+    """Add the k and mmr_lambda columns to an existing searchcache table; older entries never match."""
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE searchcache ADD COLUMN IF NOT EXISTS k INTEGER NOT NULL DEFAULT 0"))
+        conn.execute(text(
+            "ALTER TABLE searchcache ADD COLUMN IF NOT EXISTS mmr_lambda DOUBLE PRECISION NOT NULL DEFAULT -1"
+        ))
+
+
 def get_db_session() -> Session:
     """Get a database session (for non-dependency usage)."""
     return SessionLocal()
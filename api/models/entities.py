@@ -3,8 +3,8 @@
 from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any
 from sqlmodel import SQLModel, Field, Relationship
-from pgvector.sqlalchemy import Vector
-from sqlalchemy import JSON
+from pgvector.sqlalchemy import HALFVEC
+from sqlalchemy import JSON, Index
 
 
 class User(SQLModel, table=True):
@@ -53,6 +53,11 @@ class Membership(SQLModel, table=True):
 
 class Doc(SQLModel, table=True):
     """Document entity for the policy corpus."""
+    __table_args__ = (
+        # Trigram indexes so ILIKE '%term%' text search can avoid a seq scan
+        Index("ix_doc_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_doc_text_trgm", "text", postgresql_using="gin", postgresql_ops={"text": "gin_trgm_ops"}),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     org_id: int = Field(foreign_key="org.id")
@@ -71,13 +76,23 @@ class Doc(SQLModel, table=True):
 
 class Embedding(SQLModel, table=True):
     """Vector embeddings for document chunks."""
+    __table_args__ = (
+        # Approximate nearest-neighbour index for inner-product (<#>) search over unit vectors
+        Index(
+            "ix_embedding_vector_hnsw",
+            "vector",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 24, "ef_construction": 128},
+            postgresql_ops={"vector": "halfvec_ip_ops"},
+        ),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     doc_id: int = Field(foreign_key="doc.id")
     chunk_text: str
-    chunk_start: int  # Token position in document
+    chunk_start: int  # Character offset in the document text
     chunk_end: int
-    vector: str = Field(sa_column=Vector(384))  # Dimension for all-MiniLM-L6-v2
+    vector: str = Field(sa_column=HALFVEC(384))  # Half precision; dimension for all-MiniLM-L6-v2
     model: str = Field(default="text-embedding-3-small")
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
@@ -105,6 +120,27 @@ class QueryLog(SQLModel, table=True):
     user: Optional[User] = Relationship(back_populates="query_logs")
 
 
+class SearchCache(SQLModel, table=True):
+    """Search results cached by query embedding, matched by similarity."""
+    __table_args__ = (
+        Index(
+            "ix_searchcache_query_vector_hnsw",
+            "query_vector",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"query_vector": "halfvec_ip_ops"},
+        ),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    org_id: int = Field(foreign_key="org.id", index=True)
+    query_vector: str = Field(sa_column=HALFVEC(384))
+    doc_ids: List[int] = Field(default_factory=list, sa_column=JSON)
+    k: int  # Results requested; the entry serves searches for up to this many
+    mmr_lambda: float  # Relevance vs diversity weight the results were ranked with
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 class RateLimit(SQLModel, table=True):
     """Rate limiting configuration per organization."""
     
@@ -1,7 +1,7 @@
 """Pydantic schemas for API requests and responses."""
 
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from pydantic import BaseModel, Field
 
 
@@ -25,6 +25,7 @@ class TokenResponse(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
     expires_in: int
+    organization_id: Optional[int] = None
 
 
 class RefreshTokenRequest(BaseModel):
@@ -78,6 +79,11 @@ class DocumentCreate(BaseModel):
     org_id: Optional[int] = None
 
 
+class DocumentBatchCreate(BaseModel):
+    """Schema for creating several documents in one request."""
+    docs: List[DocumentCreate] = Field(..., min_length=1, max_length=100)
+
+
 class DocumentResponse(BaseModel):
     """Schema for document responses."""
     id: int
@@ -96,6 +102,7 @@ class SearchRequest(BaseModel):
     k: int = Field(default=10, ge=1, le=50, description="Number of results")
     org_id: Optional[int] = None
     filters: Optional[Dict[str, Any]] = None
+    mmr_strength: Optional[float] = Field(default=None, ge=0.0, le=1.0, description="MMR relevance weight (1.0 skips diversity reranking)")
 
 
 class SearchResult(BaseModel):
@@ -140,6 +147,25 @@ class ResponseEnvelope(BaseModel):
     metrics: Optional[Dict[str, Any]] = None
 
 
+# Batch Schemas
+class BatchCall(BaseModel):
+    """One API call inside a batch request."""
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = "GET"
+    path: str = Field(..., pattern=r"^/(?!/)", description="API path, e.g. /corpus/search")
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    """Schema for running several API calls in one request."""
+    pipeline: List[BatchCall] = Field(..., min_length=1, max_length=20)
+
+
+class BatchCallResult(BaseModel):
+    """Status and decoded body of one batched call."""
+    status: int
+    body: Any = None
+
+
 # WebSocket Message Schemas
 class WSMessage(BaseModel):
     """Schema for WebSocket messages."""
@@ -1,11 +1,13 @@
 """Authentication routes for user management."""
 
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from sqlalchemy import exists
 from sqlalchemy.orm import Session
 
 from api.models.db import get_db
@@ -17,6 +19,10 @@ router = APIRouter()
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Payloads of recently verified tokens, keyed by the raw token string
+_verified_tokens: Dict[str, dict] = {}
+_VERIFIED_TOKENS_MAX = 1024
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token."""
@@ -40,6 +46,21 @@ def create_refresh_token(data: dict):
     return encoded_jwt
 
 
+def decode_token(token: str) -> dict:
+    """Decode and verify a JWT, reusing the payload of a recently verified token."""
+    payload = _verified_tokens.get(token)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    
+    # Unknown or expired token: full signature and claims verification
+    payload = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"])
+    if len(_verified_tokens) >= _VERIFIED_TOKENS_MAX:
+        # Evict the oldest entry (dicts preserve insertion order)
+        _verified_tokens.pop(next(iter(_verified_tokens)))
+    _verified_tokens[token] = payload
+    return payload
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return pwd_context.verify(plain_password, hashed_password)
@@ -62,7 +83,7 @@ async def get_current_user(
     )
     
     try:
-        payload = jwt.decode(credentials.credentials, settings.jwt_secret, algorithms=["HS256"])
+        payload = decode_token(credentials.credentials)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
@@ -80,8 +101,8 @@ async def get_current_user(
 async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     """User registration endpoint."""
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+    email_taken = db.query(exists().where(User.email == user_data.email)).scalar()
+    if email_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -121,7 +142,8 @@ async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     return TokenResponse(
         access_token=access_token,
         refresh_token=refresh_token,
-        expires_in=settings.jwt_expires_in
+        expires_in=settings.jwt_expires_in,
+        organization_id=org.id
     )
 
 
@@ -0,0 +1,62 @@
+"""Batch route for running several API calls in one round trip."""
+
+import asyncio
+from typing import List
+from urllib.parse import unquote
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+
+from api.models.entities import User
+from api.models.schemas import BatchRequest, BatchCallResult
+from api.routes.auth import get_current_user
+
+router = APIRouter()
+
+# Marks requests made by a batch; /batch refuses them, however the path was spelled
+BATCH_CALL_HEADER = "X-Batch-Call"
+
+
+def _is_batch_path(path: str) -> bool:
+    """Whether a call path routes to /batch (the app sees it percent-decoded)."""
+    return unquote(path.split("?", 1)[0]).rstrip("/") == "/batch"
+
+
+@router.post("/batch", response_model=List[BatchCallResult])
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Run the listed calls against this API concurrently and return their
+    results in order.
+    
+    Each call goes through the full app (auth, rate limiting, metrics) with
+    the caller's Authorization header, as if it had been sent on its own.
+    """
+    if BATCH_CALL_HEADER in request.headers or any(_is_batch_path(call.path) for call in batch.pipeline):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batches cannot be nested"
+        )
+    
+    headers = {
+        "Authorization": request.headers["authorization"],
+        BATCH_CALL_HEADER: "1"
+    }
+    
+    transport = httpx.ASGITransport(app=request.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://batch") as client:
+        responses = await asyncio.gather(*(
+            client.request(call.method, call.path, json=call.body, headers=headers)
+            for call in batch.pipeline
+        ))
+    
+    results = []
+    for response in responses:
+        if response.headers.get("content-type", "").startswith("application/json"):
+            body = response.json()
+        else:
+            body = response.text
+        results.append(BatchCallResult(status=response.status_code, body=body))
+    return results
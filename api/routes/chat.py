@@ -59,9 +59,6 @@ async def chat(
                 headers={"X-RateLimit-Reset": str(reset_time)}
             )
         
-        # Record the request
-        await rate_limit_service.record_request(request.org_id, request.user_id)
-        
         # Process the query through the orchestrator
         response = await orchestrator_service.handle_text_query(request)
         
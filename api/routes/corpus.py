@@ -4,15 +4,15 @@ import time
 import json
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.orm import Session, defer
+from sqlalchemy import desc, func
 import io
 import tempfile
 import os
 
 from api.models.db import get_db
 from api.models.entities import User, Doc, Embedding, Membership
-from api.models.schemas import DocumentCreate, DocumentResponse, SearchRequest, SearchResponse
+from api.models.schemas import DocumentCreate, DocumentBatchCreate, DocumentResponse, SearchRequest, SearchResponse
 from api.routes.auth import get_current_user
 from api.services.search import search_service
 from api.services.vectorizer import vectorizer_service
@@ -71,11 +71,10 @@ async def create_document(
         )
         
         db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
+        db.flush()  # INSERT ... RETURNING id; no refresh round trip needed
         
-        # Return the created document
-        return DocumentResponse(
+        # Build the response before commit expires the attributes
+        response = DocumentResponse(
             id=db_document.id,
             source=db_document.source,
             uri=db_document.uri,
@@ -85,6 +84,8 @@ async def create_document(
             created_at=db_document.created_at,
             updated_at=db_document.updated_at
         )
+        db.commit()
+        return response
         
     except HTTPException:
         raise
@@ -96,6 +97,71 @@ async def create_document(
         )
 
 
+@router.post("/docs:batch", response_model=List[DocumentResponse])
+async def create_documents_batch(
+    batch: DocumentBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Create several documents in the corpus with a single commit.
+    
+    Responses are returned in request order.
+    """
+    try:
+        # CRITICAL: Always get org_id from user's membership for security
+        membership = db.query(Membership).filter(
+            Membership.user_id == current_user.id
+        ).first()
+        
+        if not membership:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User is not a member of any organization"
+            )
+        
+        db_documents = [
+            Doc(
+                org_id=membership.org_id,
+                source=document.source,
+                uri=document.uri,
+                title=document.title,
+                text=document.text,
+                doc_metadata=json.dumps(document.metadata or {})
+            )
+            for document in batch.docs
+        ]
+        db.add_all(db_documents)
+        db.flush()  # Assigns ids
+        
+        # Build responses before commit expires the objects
+        responses = [
+            DocumentResponse(
+                id=db_document.id,
+                source=db_document.source,
+                uri=db_document.uri,
+                title=db_document.title,
+                text=db_document.text,
+                metadata=document.metadata or {},
+                created_at=db_document.created_at,
+                updated_at=db_document.updated_at
+            )
+            for db_document, document in zip(db_documents, batch.docs)
+        ]
+        db.commit()
+        
+        return responses
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error creating documents: {str(e)}"
+        )
+
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
     file: UploadFile = File(...),
@@ -172,11 +238,10 @@ async def upload_document(
         )
         
         db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
+        db.flush()  # INSERT ... RETURNING id; no refresh round trip needed
         
-        # Return the created document
-        return DocumentResponse(
+        # Build the response before commit expires the attributes
+        response = DocumentResponse(
             id=db_document.id,
             source=db_document.source,
             uri=db_document.uri,
@@ -186,6 +251,8 @@ async def upload_document(
             created_at=db_document.created_at,
             updated_at=db_document.updated_at
         )
+        db.commit()
+        return response
         
     except HTTPException:
         raise
@@ -307,6 +374,7 @@ async def list_documents(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     org_id: Optional[int] = None,
+    text_chars: Optional[int] = Query(None, ge=0, description="Truncate each document's text to this many characters"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -323,8 +391,11 @@ async def list_documents(
         # Users can only see documents from their own organization
         user_org_id = membership.org_id
         
-        # Build query - only user's organization
-        query = db.query(Doc).filter(Doc.org_id == user_org_id)
+        # Build query - only user's organization. The text is selected as its
+        # own column so a preview can be cut down in the database rather than
+        # shipping whole documents
+        text_column = Doc.text if text_chars is None else func.left(Doc.text, text_chars)
+        query = db.query(Doc, text_column).options(defer(Doc.text)).filter(Doc.org_id == user_org_id)
         
         # If org_id is specified, verify it's the user's organization
         if org_id and org_id != user_org_id:
@@ -343,12 +414,12 @@ async def list_documents(
                 source=doc.source,
                 uri=doc.uri,
                 title=doc.title,
-                text=doc.text,
+                text=doc_text,
                 metadata=json.loads(doc.doc_metadata) if doc.doc_metadata else {},
                 created_at=doc.created_at,
                 updated_at=doc.updated_at
             )
-            for doc in documents
+            for doc, doc_text in documents
         ]
         
     except Exception as e:
@@ -393,7 +464,8 @@ async def search_documents(
                 request.query,
                 k=request.k,
                 org_id=request.org_id,
-                filters=request.filters
+                filters=request.filters,
+                mmr_lambda=request.mmr_strength
             )
             print(f"Search completed successfully, got {len(search_results)} results")
             print(f"First result: {search_results[0] if search_results else 'No results'}")
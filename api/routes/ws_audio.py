@@ -3,15 +3,14 @@
 import json
 import asyncio
 from typing import Optional
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query, Request
+from fastapi.responses import HTMLResponse, Response
 
 from api.services.orchestrator import orchestrator_service
 from api.services.rate_limit import rate_limit_service
-from api.services.stt import stt_service
-from jose import jwt
+from api.services.stt import stt_service, StreamingAudioDecoder
 from jose.exceptions import JWTError
-from api.utils.config import settings
+from api.routes.auth import decode_token
 from api.models.db import get_db
 from api.models.entities import User, Membership
 from sqlalchemy.orm import Session
@@ -25,6 +24,8 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections: dict = {}  # session_id -> WebSocket
         self.audio_buffers: dict = {}  # session_id -> list of audio chunks
+        self.decoders: dict = {}  # session_id -> StreamingAudioDecoder for the current utterance
+        self.audio_formats: dict = {}  # session_id -> client format of the buffered audio
     
     async def connect(self, websocket: WebSocket, session_id: str):
         """Accept a new WebSocket connection."""
@@ -45,6 +46,10 @@ class ConnectionManager:
             del self.active_connections[session_id]
         if session_id in self.audio_buffers:
             del self.audio_buffers[session_id]
+        self.audio_formats.pop(session_id, None)
+        decoder = self.decoders.pop(session_id, None)
+        if decoder:
+            decoder.close()
     
     async def send_message(self, session_id: str, message: dict):
         """Send a message to a specific WebSocket connection."""
@@ -55,10 +60,26 @@ class ConnectionManager:
                 print(f"Error sending message to {session_id}: {e}")
                 self.disconnect(session_id)
     
-    def add_audio_chunk(self, session_id: str, audio_data: bytes):
+    def add_audio_chunk(self, session_id: str, audio_data: bytes, format: str = "wav"):
         """Add an audio chunk to the buffer for a session."""
         if session_id in self.audio_buffers:
             self.audio_buffers[session_id].append(audio_data)
+            self.audio_formats[session_id] = format
+            
+            # Decode container formats while the utterance is still arriving
+            decoder = self.decoders.get(session_id)
+            if decoder is None and StreamingAudioDecoder.supports(format):
+                decoder = self.decoders[session_id] = StreamingAudioDecoder(format)
+            if decoder:
+                decoder.feed(audio_data)
+    
+    def pop_decoder(self, session_id: str) -> Optional[StreamingAudioDecoder]:
+        """Detach the streaming decoder for a session's current utterance."""
+        return self.decoders.pop(session_id, None)
+    
+    def get_audio_format(self, session_id: str) -> Optional[str]:
+        """Client format of a session's buffered audio, if any arrived."""
+        return self.audio_formats.get(session_id)
     
     def get_audio_buffer(self, session_id: str) -> list:
         """Get the audio buffer for a session."""
@@ -68,229 +89,292 @@ class ConnectionManager:
         """Clear the audio buffer for a session."""
         if session_id in self.audio_buffers:
             self.audio_buffers[session_id].clear()
+        decoder = self.decoders.pop(session_id, None)
+        if decoder:
+            decoder.close()
 
 
 # Global connection manager
 manager = ConnectionManager()
 
 
-@router.get("/audio", response_class=HTMLResponse)
-async def get_audio_page():
-    """Serve a simple HTML page for testing WebSocket audio."""
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Voice Policy Assistant</title>
-        <style>
-            body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }
-            .controls { margin: 20px 0; }
-            button { padding: 10px 20px; margin: 5px; font-size: 16px; }
-            .recording { background-color: #ff4444; color: white; }
-            .transcript { margin: 20px 0; padding: 15px; background-color: #f5f5f5; border-radius: 5px; }
-            .response { margin: 20px 0; padding: 15px; background-color: #e8f5e8; border-radius: 5px; }
-            .status { margin: 10px 0; padding: 10px; background-color: #e3f2fd; border-radius: 5px; }
-            .error { background-color: #ffebee; color: #c62828; }
-        </style>
-    </head>
-    <body>
-        <h1>AI Voice Policy Assistant</h1>
-        <p>Click the microphone button and ask a question about policies or regulations.</p>
+# Static test page for the voice WebSocket, built once at import time
+_AUDIO_PAGE_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Voice Policy Assistant</title>
+    <style>
+        body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }
+        .controls { margin: 20px 0; }
+        button { padding: 10px 20px; margin: 5px; font-size: 16px; }
+        .recording { background-color: #ff4444; color: white; }
+        .transcript { margin: 20px 0; padding: 15px; background-color: #f5f5f5; border-radius: 5px; }
+        .response { margin: 20px 0; padding: 15px; background-color: #e8f5e8; border-radius: 5px; }
+        .status { margin: 10px 0; padding: 10px; background-color: #e3f2fd; border-radius: 5px; }
+        .error { background-color: #ffebee; color: #c62828; }
+    </style>
+</head>
+<body>
+    <h1>AI Voice Policy Assistant</h1>
+    <p>Click the microphone button and ask a question about policies or regulations.</p>
+    
+    <div class="controls">
+        <button id="startBtn">🎤 Start Recording</button>
+        <button id="stopBtn" disabled>⏹️ Stop Recording</button>
+        <button id="clearBtn">🗑️ Clear</button>
+    </div>
+    
+    <div id="status" class="status" style="display: none;"></div>
+    <div id="transcript" class="transcript" style="display: none;"></div>
+    <div id="response" class="response" style="display: none;"></div>
+    
+    <script>
+        let mediaRecorder;
+        let audioChunks = [];
+        let ws;
+        let sessionId = 'demo-' + Date.now();
         
-        <div class="controls">
-            <button id="startBtn">🎤 Start Recording</button>
-            <button id="stopBtn" disabled>⏹️ Stop Recording</button>
-            <button id="clearBtn">🗑️ Clear</button>
-        </div>
+        const startBtn = document.getElementById('startBtn');
+        const stopBtn = document.getElementById('stopBtn');
+        const clearBtn = document.getElementById('clearBtn');
+        const statusDiv = document.getElementById('status');
+        const transcriptDiv = document.getElementById('transcript');
+        const responseDiv = document.getElementById('response');
         
-        <div id="status" class="status" style="display: none;"></div>
-        <div id="transcript" class="transcript" style="display: none;"></div>
-        <div id="response" class="response" style="display: none;"></div>
+        function showStatus(message, isError = false) {
+            statusDiv.style.display = 'block';
+            statusDiv.textContent = message;
+            statusDiv.className = 'status ' + (isError ? 'error' : '');
+        }
         
-        <script>
-            let mediaRecorder;
-            let audioChunks = [];
-            let ws;
-            let sessionId = 'demo-' + Date.now();
-            
-            const startBtn = document.getElementById('startBtn');
-            const stopBtn = document.getElementById('stopBtn');
-            const clearBtn = document.getElementById('clearBtn');
-            const statusDiv = document.getElementById('status');
-            const transcriptDiv = document.getElementById('transcript');
-            const responseDiv = document.getElementById('response');
-            
-            function showStatus(message, isError = false) {
-                statusDiv.style.display = 'block';
-                statusDiv.textContent = message;
-                statusDiv.className = 'status ' + (isError ? 'error' : '');
-            }
-            
-            function showTranscript(text) {
-                transcriptDiv.style.display = 'block';
-                transcriptDiv.textContent = 'Transcript: ' + text;
-            }
-            
-            function showResponse(text) {
+        function showTranscript(text) {
+            transcriptDiv.style.display = 'block';
+            transcriptDiv.textContent = 'Transcript: ' + text;
+        }
+        
+        function showResponse(text) {
+            responseDiv.style.display = 'block';
+            responseDiv.textContent = 'Response: ' + text;
+        }
+        
+        function appendResponse(text) {
+            if (responseDiv.style.display === 'none') {
                 responseDiv.style.display = 'block';
                 responseDiv.textContent = 'Response: ' + text;
+            } else {
+                responseDiv.textContent += text;
             }
-            
-            function appendResponse(text) {
-                if (responseDiv.style.display === 'none') {
-                    responseDiv.style.display = 'block';
-                    responseDiv.textContent = 'Response: ' + text;
-                } else {
-                    responseDiv.textContent += text;
-                }
-            }
-            
-            startBtn.addEventListener('click', async () => {
-                try {
-                    const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-                    
-                    // Try to use a supported audio format
-                    const mimeTypes = [
-                        'audio/webm;codecs=opus',
-                        'audio/webm',
-                        'audio/ogg;codecs=opus',
-                        'audio/ogg'
-                    ];
-                    
-                    let selectedMimeType = null;
-                    for (const mimeType of mimeTypes) {
-                        if (MediaRecorder.isTypeSupported(mimeType)) {
-                            selectedMimeType = mimeType;
-                            break;
-                        }
-                    }
-                    
-                    if (!selectedMimeType) {
-                        throw new Error('No supported audio format found');
+        }
+        
+        startBtn.addEventListener('click', async () => {
+            try {
+                const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+                
+                // Try to use a supported audio format
+                const mimeTypes = [
+                    'audio/webm;codecs=opus',
+                    'audio/webm',
+                    'audio/ogg;codecs=opus',
+                    'audio/ogg'
+                ];
+                
+                let selectedMimeType = null;
+                for (const mimeType of mimeTypes) {
+                    if (MediaRecorder.isTypeSupported(mimeType)) {
+                        selectedMimeType = mimeType;
+                        break;
                     }
-                    
-                    console.log(`Using audio format: ${selectedMimeType}`);
-                    mediaRecorder = new MediaRecorder(stream, { mimeType: selectedMimeType });
-                    audioChunks = [];
-                    
-                    mediaRecorder.ondataavailable = (event) => {
-                        if (event.data.size > 0) {
-                            console.log('Audio data available, size:', event.data.size);
-                            // Convert audio data to base64 and send immediately
-                            const reader = new FileReader();
-                            reader.onload = () => {
-                                const base64Audio = reader.result.split(',')[1]; // Remove data:audio/webm;base64, prefix
-                                console.log('Sending audio chunk, data length:', base64Audio.length);
-                                
-                                if (ws && ws.readyState === WebSocket.OPEN) {
-                                    ws.send(JSON.stringify({
-                                        type: 'audio_chunk',
-                                        data: base64Audio,
-                                        format: 'webm',
-                                        sample_rate: 16000
-                                    }));
-                                    
-                                    // Send process_audio message to trigger transcription
-                                    setTimeout(() => {
-                                        if (ws && ws.readyState === WebSocket.OPEN) {
-                                            console.log('Sending process_audio message');
-                                            ws.send(JSON.stringify({
-                                                type: 'process_audio'
-                                            }));
-                                        }
-                                    }, 100);
-                                }
-                            };
-                            reader.readAsDataURL(event.data);
-                        }
-                    };
-                    
-                    mediaRecorder.start();
-                    startBtn.disabled = true;
-                    stopBtn.disabled = false;
-                    showStatus('Recording... Click stop when finished.');
-
-                    
-                } catch (error) {
-                    showStatus('Error accessing microphone: ' + error.message, true);
-                }
-            });
-            
-            stopBtn.addEventListener('click', () => {
-                if (mediaRecorder && mediaRecorder.state !== 'inactive') {
-                    mediaRecorder.stop();
-                    startBtn.disabled = false;
-                    stopBtn.disabled = true;
-                    showStatus('Processing audio...');
-                }
-            });
-            
-            clearBtn.addEventListener('click', () => {
-                transcriptDiv.style.display = 'none';
-                responseDiv.style.display = 'none';
-                statusDiv.style.display = 'none';
-            });
-            
-            // WebSocket connection
-            function connectWebSocket() {
-                // Get JWT token from localStorage (set after login)
-                const token = localStorage.getItem('jwt_token');
-                if (!token) {
-                    showStatus('Please log in first to use voice features', true);
-                    return;
                 }
                 
-                ws = new WebSocket(`ws://localhost:8000/ws/audio?session_id=${sessionId}&token=${token}`);
+                if (!selectedMimeType) {
+                    throw new Error('No supported audio format found');
+                }
                 
-                ws.onopen = () => {
-                    showStatus('Connected to voice assistant');
-                };
+                console.log(`Using audio format: ${selectedMimeType}`);
+                mediaRecorder = new MediaRecorder(stream, { mimeType: selectedMimeType });
+                audioChunks = [];
                 
-                ws.onmessage = (event) => {
-                    const message = JSON.parse(event.data);
-                    
-                    switch (message.type) {
-                        case 'connection_established':
-                            showStatus(message.data);
-                            break;
-                        case 'status':
-                            showStatus(message.data);
-                            break;
-                        case 'transcript':
-                            showTranscript(message.data);
-                            break;
-                        case 'token':
-                            appendResponse(message.data);
-                            break;
-                        case 'chat_response':
-                            showResponse(message.data);
-                            break;
-                        case 'final':
-                            showStatus('Response complete');
-                            break;
-                        case 'error':
-                            showStatus(message.data, true);
-                            break;
+                mediaRecorder.ondataavailable = (event) => {
+                    if (event.data.size > 0) {
+                        console.log('Audio data available, size:', event.data.size);
+                        // Convert audio data to base64 and send immediately
+                        const reader = new FileReader();
+                        reader.onload = () => {
+                            const base64Audio = reader.result.split(',')[1]; // Remove data:audio/webm;base64, prefix
+                            console.log('Sending audio chunk, data length:', base64Audio.length);
+                            
+                            if (ws && ws.readyState === WebSocket.OPEN) {
+                                // The chunk delivered after stop() ends the utterance;
+                                // flag it so the server starts transcription right away
+                                ws.send(JSON.stringify({
+                                    type: 'audio_chunk',
+                                    data: base64Audio,
+                                    format: 'webm',
+                                    sample_rate: 16000,
+                                    eos: mediaRecorder.state === 'inactive'
+                                }));
+                            }
+                        };
+                        reader.readAsDataURL(event.data);
                     }
                 };
                 
-                ws.onclose = () => {
-                    showStatus('Disconnected from voice assistant', true);
-                    setTimeout(connectWebSocket, 3000);
-                };
+                mediaRecorder.start();
+                startBtn.disabled = true;
+                stopBtn.disabled = false;
+                showStatus('Recording... Click stop when finished.');
+
                 
-                ws.onerror = (error) => {
-                    showStatus('WebSocket error: ' + error.message, true);
-                };
+            } catch (error) {
+                showStatus('Error accessing microphone: ' + error.message, true);
+            }
+        });
+        
+        stopBtn.addEventListener('click', () => {
+            if (mediaRecorder && mediaRecorder.state !== 'inactive') {
+                mediaRecorder.stop();
+                startBtn.disabled = false;
+                stopBtn.disabled = true;
+                showStatus('Processing audio...');
+            }
+        });
+        
+        clearBtn.addEventListener('click', () => {
+            transcriptDiv.style.display = 'none';
+            responseDiv.style.display = 'none';
+            statusDiv.style.display = 'none';
+        });
+        
+        // WebSocket connection
+        function connectWebSocket() {
+            // Get JWT token from localStorage (set after login)
+            const token = localStorage.getItem('jwt_token');
+            if (!token) {
+                showStatus('Please log in first to use voice features', true);
+                return;
             }
             
-            // Connect on page load
-            connectWebSocket();
-        </script>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+            ws = new WebSocket(`ws://localhost:8000/ws/audio?session_id=${sessionId}&token=${token}`);
+            
+            ws.onopen = () => {
+                showStatus('Connected to voice assistant');
+            };
+            
+            ws.onmessage = (event) => {
+                const message = JSON.parse(event.data);
+                
+                switch (message.type) {
+                    case 'connection_established':
+                        showStatus(message.data);
+                        break;
+                    case 'status':
+                        showStatus(message.data);
+                        break;
+                    case 'transcript':
+                        showTranscript(message.data);
+                        break;
+                    case 'token':
+                        appendResponse(message.data);
+                        break;
+                    case 'chat_response':
+                        showResponse(message.data);
+                        break;
+                    case 'final':
+                        showStatus('Response complete');
+                        break;
+                    case 'error':
+                        showStatus(message.data, true);
+                        break;
+                }
+            };
+            
+            ws.onclose = () => {
+                showStatus('Disconnected from voice assistant', true);
+                setTimeout(connectWebSocket, 3000);
+            };
+            
+            ws.onerror = (error) => {
+                showStatus('WebSocket error: ' + error.message, true);
+            };
+        }
+        
+        // Connect on page load
+        connectWebSocket();
+    </script>
+</body>
+</html>
+"""
+
+_AUDIO_PAGE_ETAG = '"audio-page-v2"'
+
+_AUDIO_PAGE = HTMLResponse(
+    content=_AUDIO_PAGE_HTML,
+    headers={
+        "Cache-Control": "public, max-age=3600",
+        "ETag": _AUDIO_PAGE_ETAG
+    }
+)
+
+
+@router.get("/audio", response_class=HTMLResponse)
+async def get_audio_page(request: Request):
+    """Serve a simple HTML page for testing WebSocket audio."""
+    if request.headers.get("if-none-match") == _AUDIO_PAGE_ETAG:
+        return Response(status_code=304, headers={"ETag": _AUDIO_PAGE_ETAG})
+    return _AUDIO_PAGE
+
+
+async def _process_audio_buffer(session_id: str, org_id: int, user_id: int):
+    """Run the buffered audio for a session through the orchestrator."""
+    audio_chunks = manager.get_audio_buffer(session_id)
+    
+    if not audio_chunks:
+        await manager.send_message(session_id, {
+            "type": "error",
+            "data": "No audio data to process",
+            "timestamp": asyncio.get_event_loop().time()
+        })
+        return
+    
+    # Prefer PCM decoded while recording; fall back to the raw container bytes
+    decoder = manager.pop_decoder(session_id)
+    pcm = await decoder.finish() if decoder else None
+    if pcm is not None:
+        audio_input = pcm
+        print(f"DEBUG: Processing {len(audio_chunks)} audio chunks, {len(pcm)} decoded samples")
+    else:
+        audio_input = b"".join(audio_chunks)
+        print(f"DEBUG: Processing {len(audio_chunks)} audio chunks, total size: {len(audio_input)} bytes")
+    
+    # Process through orchestrator
+    try:
+        # Use the full orchestrator for real AI responses
+        await manager.send_message(session_id, {
+            "type": "status",
+            "data": "Processing your voice query with AI...",
+            "timestamp": asyncio.get_event_loop().time()
+        })
+        
+        # Use the orchestrator for full AI processing with real org_id
+        async for response_chunk in orchestrator_service.handle_voice_query(
+            audio_input,
+            org_id=org_id,  # Real organization ID from authentication
+            user_id=user_id,  # Real user ID from authentication
+            session_id=session_id,
+            audio_format=manager.get_audio_format(session_id)  # Lets STT decode the container bytes
+        ):
+            await manager.send_message(session_id, response_chunk)
+            
+    except Exception as e:
+        await manager.send_message(session_id, {
+            "type": "error",
+            "data": f"Error processing audio: {str(e)}",
+            "timestamp": asyncio.get_event_loop().time()
+        })
+    
+    # Clear audio buffer after processing
+    manager.clear_audio_buffer(session_id)
 
 
 @router.websocket("/audio")
@@ -313,8 +397,8 @@ async def websocket_audio(
         try:
             # Decode JWT token to get user ID
             
-            # Decode token
-            payload = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"])
+            # Decode token (verified payloads are cached across reconnects)
+            payload = decode_token(token)
             user_id = int(payload.get("sub"))
             if not user_id:
                 await websocket.close(code=4001, reason="Invalid token")
@@ -387,7 +471,8 @@ async def websocket_audio(
                 if message_type == "audio_chunk":
                     # Handle audio chunk
                     audio_data_base64 = message.get("data", "")
-                    format_type = message.get("format", "wav")
+                    # Browsers may send a full MIME subtype, e.g. "webm;codecs=opus"
+                    format_type = message.get("format", "wav").split(";")[0]
                     sample_rate = message.get("sample_rate", 16000)
                     
                     print(f"DEBUG: Received audio chunk - base64 data length: {len(audio_data_base64)}, format: {format_type}, sample_rate: {sample_rate}")
@@ -399,7 +484,7 @@ async def websocket_audio(
                         print(f"DEBUG: Decoded audio data length: {len(audio_data)} bytes")
                         
                         # Add to audio buffer
-                        manager.add_audio_chunk(session_id, audio_data)
+                        manager.add_audio_chunk(session_id, audio_data, format_type)
                     except Exception as e:
                         print(f"DEBUG: Error decoding base64 audio data: {e}")
                         await manager.send_message(session_id, {
@@ -409,6 +494,12 @@ async def websocket_audio(
                         })
                         continue
                     
+                    # Last chunk of the utterance: process without waiting for a
+                    # separate process_audio message
+                    if message.get("eos"):
+                        await _process_audio_buffer(session_id, org_id, user_id)
+                        continue
+                    
                     # Send acknowledgment
                     await manager.send_message(session_id, {
                         "type": "audio_received",
@@ -418,48 +509,7 @@ async def websocket_audio(
                     
                 elif message_type == "process_audio":
                     # Process accumulated audio
-                    audio_chunks = manager.get_audio_buffer(session_id)
-                    
-                    if not audio_chunks:
-                        await manager.send_message(session_id, {
-                            "type": "error",
-                            "data": "No audio data to process",
-                            "timestamp": asyncio.get_event_loop().time()
-                        })
-                        continue
-                    
-                    # Combine audio chunks
-                    combined_audio = b"".join(audio_chunks)
-                    print(f"DEBUG: Processing {len(audio_chunks)} audio chunks, total size: {len(combined_audio)} bytes")
-                    
-                    # Process through orchestrator
-                    try:
-
-                        # Use the full orchestrator for real AI responses
-                        await manager.send_message(session_id, {
-                            "type": "status",
-                            "data": "Processing your voice query with AI...",
-                            "timestamp": asyncio.get_event_loop().time()
-                        })
-                        
-                        # Use the orchestrator for full AI processing with real org_id
-                        async for response_chunk in orchestrator_service.handle_voice_query(
-                            combined_audio,
-                            org_id=org_id,  # Real organization ID from authentication
-                            user_id=user_id,  # Real user ID from authentication
-                            session_id=session_id
-                        ):
-                            await manager.send_message(session_id, response_chunk)
-                            
-                    except Exception as e:
-                        await manager.send_message(session_id, {
-                            "type": "error",
-                            "data": f"Error processing audio: {str(e)}",
-                            "timestamp": asyncio.get_event_loop().time()
-                        })
-                    
-                    # Clear audio buffer after processing
-                    manager.clear_audio_buffer(session_id)
+                    await _process_audio_buffer(session_id, org_id, user_id)
                     
                 elif message_type == "ping":
                     # Handle ping for connection health
@@ -1,12 +1,56 @@
 """Redis cache service for response, embedding, and search caching."""
 
+import asyncio
 import hashlib
 import json
+import os
 import pickle
+import time
+from collections import OrderedDict
 from typing import Optional, Any, Dict, List
+import numpy as np
 import redis.asyncio as redis
 from api.utils.config import get_redis_url, settings
 
+# Key prefixes mirrored in the in-process cache and tracked for invalidation
+TRACKED_PREFIXES = ("response_cache:", "embedding_cache:", "search_cache:")
+
+
+class LocalCache:
+    """Small in-process LRU cache with a per-entry TTL."""
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return a live entry, or None if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any):
+        """Store an entry, evicting the least recently used one if full."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def delete(self, key: str):
+        """Drop an entry if present."""
+        self._data.pop(key, None)
+    
+    def clear(self):
+        """Drop all entries."""
+        self._data.clear()
+
 
 class CacheService:
     """Redis-based caching service for various data types."""
@@ -15,76 +59,199 @@ class CacheService:
         self.redis_url = get_redis_url()
         self.redis: Optional[redis.Redis] = None
         
+        # L1 cache in front of Redis; kept coherent across workers by Redis
+        # client-side tracking (see _start_invalidation_listener)
+        self.local = LocalCache(maxsize=1024, ttl=60.0)
+        self._tracking: Optional[redis.Redis] = None
+        self._invalidation_task: Optional[asyncio.Task] = None
+        
     async def connect(self):
         """Connect to Redis."""
         if not self.redis:
             self.redis = redis.from_url(self.redis_url, decode_responses=False)
             await self.redis.ping()
+            try:
+                await self._start_invalidation_listener()
+            except Exception as e:
+                # L1 entries still expire on their TTL without tracking
+                print(f"Warning: Redis client-side tracking unavailable: {e}")
     
     async def disconnect(self):
         """Disconnect from Redis."""
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            self._invalidation_task = None
+        if self._tracking:
+            await self._tracking.close()
+            self._tracking = None
         if self.redis:
             await self.redis.close()
             self.redis = None
+        self.local.clear()
+    
+    async def _start_invalidation_listener(self):
+        """Subscribe to Redis invalidation pushes for the tracked key prefixes."""
+        client_name = f"l1-invalidation-{os.getpid()}-{id(self)}"
+        listener = redis.from_url(self.redis_url, decode_responses=False, client_name=client_name)
+        pubsub = listener.pubsub()
+        await pubsub.subscribe("__redis__:invalidate")
+        
+        # Find the connection ID of the subscriber to redirect invalidations to
+        clients = await listener.client_list(_type="pubsub")
+        redirect_id = next(c["id"] for c in clients if c.get("name") == client_name)
+        
+        # Broadcast mode: any write to a tracked prefix invalidates it here
+        self._tracking = redis.from_url(self.redis_url, single_connection_client=True)
+        args = ["CLIENT", "TRACKING", "ON", "REDIRECT", redirect_id, "BCAST"]
+        for prefix in TRACKED_PREFIXES:
+            args += ["PREFIX", prefix]
+        await self._tracking.execute_command(*args)
+        
+        self._invalidation_task = asyncio.create_task(self._listen_for_invalidations(listener, pubsub))
+    
+    async def _listen_for_invalidations(self, listener: redis.Redis, pubsub):
+        """Evict L1 entries as Redis reports their keys changed."""
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                keys = message.get("data")
+                if not keys or not isinstance(keys, list):
+                    # A null payload means the whole keyspace was flushed
+                    self.local.clear()
+                    continue
+                for key in keys:
+                    self.local.delete(key.decode() if isinstance(key, bytes) else key)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await pubsub.close()
+            await listener.close()
+    
+    async def _get_cached(self, key: str) -> Optional[Any]:
+        """Read a pickled value through the L1 cache."""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        data = await self.redis.get(key)
+        if data:
+            value = pickle.loads(data)
+            self.local.set(key, value)
+            return value
+        return None
     
     def _hash_key(self, data: str) -> str:
         """Generate a hash for cache keys."""
         return hashlib.sha256(data.encode()).hexdigest()
     
+    def make_response_key(self, query: str, org_id: int) -> str:
+        """
+        Response cache key for a query within an organization.
+        
+        Compute it once per request and pass it to the *_by_key methods to
+        avoid hashing the query twice.
+        """
+        digest = hashlib.blake2b(query.encode(), digest_size=16).hexdigest()
+        return f"response_cache:{org_id}:{digest}"
+    
     async def get_response_cache(self, query: str, org_id: int) -> Optional[Dict[str, Any]]:
         """Get cached response for a query within an organization."""
+        return await self.get_response_cache_by_key(self.make_response_key(query, org_id))
+    
+    async def get_response_cache_by_key(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached response by its make_response_key key."""
         await self.connect()
-        key = f"response_cache:{org_id}:{self._hash_key(query)}"
-        data = await self.redis.get(key)
-        if data:
-            return pickle.loads(data)
-        return None
+        return await self._get_cached(key)
     
     async def set_response_cache(self, query: str, response: Dict[str, Any], org_id: int, ttl: Optional[int] = None) -> bool:
         """Cache a response for a query within an organization."""
+        return await self.set_response_cache_by_key(self.make_response_key(query, org_id), response, ttl)
+    
+    async def set_response_cache_by_key(self, key: str, response: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Cache a response under its make_response_key key."""
         await self.connect()
-        key = f"response_cache:{org_id}:{self._hash_key(query)}"
         ttl = ttl or settings.response_cache_ttl
         data = pickle.dumps(response)
+        self.local.delete(key)
         return await self.redis.setex(key, ttl, data)
     
-    async def get_embedding_cache(self, text: str) -> Optional[List[float]]:
-        """Get cached embedding for text."""
+    def _embedding_key(self, text: str) -> str:
+        """Cache key for an embedding stored as raw float32 bytes."""
+        return f"embedding_cache:f32:{self._hash_key(text)}"
+    
+    async def get_embedding_cache(self, text: str) -> Optional[np.ndarray]:
+        """Get cached embedding for text as a float32 array."""
+        return (await self.get_embedding_cache_many([text]))[0]
+    
+    async def get_embedding_cache_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Get cached embeddings for several texts in a single Redis round trip."""
         await self.connect()
-        key = f"embedding_cache:{self._hash_key(text)}"
-        data = await self.redis.get(key)
-        if data:
-            return pickle.loads(data)
-        return None
+        keys = [self._embedding_key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [self.local.get(key) for key in keys]
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            raws = await self.redis.mget([keys[i] for i in missing])
+            for i, raw in zip(missing, raws):
+                if raw:
+                    embedding = np.frombuffer(raw, dtype=np.float32)
+                    self.local.set(keys[i], embedding)
+                    results[i] = embedding
+        
+        return results
     
-    async def set_embedding_cache(self, text: str, embedding: List[float]) -> bool:
+    async def set_embedding_cache(self, text: str, embedding: np.ndarray) -> bool:
         """Cache an embedding for text (no TTL for embeddings)."""
         await self.connect()
-        key = f"embedding_cache:{self._hash_key(text)}"
-        data = pickle.dumps(embedding)
+        key = self._embedding_key(text)
+        data = np.asarray(embedding, dtype=np.float32).tobytes()
+        self.local.delete(key)
         return await self.redis.set(key, data)
     
-    async def get_search_cache(self, query: str, org_id: int) -> Optional[List[int]]:
+    async def set_embedding_cache_many(self, items: Dict[str, np.ndarray]) -> bool:
+        """Cache several embeddings (text -> vector) with a single MSET."""
+        if not items:
+            return True
+        await self.connect()
+        mapping = {}
+        for text, embedding in items.items():
+            key = self._embedding_key(text)
+            mapping[key] = np.asarray(embedding, dtype=np.float32).tobytes()
+            self.local.delete(key)
+        return await self.redis.mset(mapping)
+    
+    def _search_key(self, query: str, org_id: int, k: int, mmr_lambda: float) -> str:
+        """Search cache key; results depend on k and the MMR weight as well as the query."""
+        return f"search_cache:{org_id}:{k}:{mmr_lambda}:{self._hash_key(query)}"
+    
+    async def get_search_cache(self, query: str, org_id: int, k: int, mmr_lambda: float) -> Optional[List[int]]:
         """Get cached search results for a query within an organization."""
         await self.connect()
-        key = f"search_cache:{org_id}:{self._hash_key(query)}"
-        data = await self.redis.get(key)
-        if data:
-            return pickle.loads(data)
-        return None
+        return await self._get_cached(self._search_key(query, org_id, k, mmr_lambda))
     
-    async def set_search_cache(self, query: str, doc_ids: List[int], org_id: int, ttl: Optional[int] = None) -> bool:
+    async def set_search_cache(
+        self,
+        query: str,
+        doc_ids: List[int],
+        org_id: int,
+        k: int,
+        mmr_lambda: float,
+        ttl: Optional[int] = None
+    ) -> bool:
         """Cache search results for a query within an organization."""
         await self.connect()
-        key = f"search_cache:{org_id}:{self._hash_key(query)}"
+        key = self._search_key(query, org_id, k, mmr_lambda)
         ttl = ttl or settings.search_cache_ttl
         data = pickle.dumps(doc_ids)
+        self.local.delete(key)
         return await self.redis.setex(key, ttl, data)
     
     async def invalidate_cache(self, pattern: str) -> int:
         """Invalidate cache keys matching a pattern."""
         await self.connect()
         keys = await self.redis.keys(pattern)
+        for key in keys:
+            self.local.delete(key.decode())
         if keys:
             return await self.redis.delete(*keys)
         return 0
@@ -104,6 +271,7 @@ class CacheService:
     async def clear_all_caches(self) -> bool:
         """Clear all caches (use with caution!)."""
         await self.connect()
+        self.local.clear()
         return await self.redis.flushdb()
 
 
@@ -0,0 +1,56 @@
+"""
+Text chunking for embedding.
+Pure Python with no model or numpy imports; fully annotated so it also builds
+with mypyc (`mypyc api/services/chunking.py`) if a compiled copy is wanted.
+"""
+
+import re
+from bisect import bisect_left
+from typing import Iterator, List, Tuple
+
+_SPACE = re.compile(" ")
+
+
+def chunk_spans(text: str, chunk_size: int = 800, overlap: int = 100) -> Iterator[Tuple[int, int]]:
+    """Lazily yield the (start, end) offsets of overlapping chunks, whitespace trimmed."""
+    n = len(text)
+    if n <= chunk_size:
+        yield 0, n
+        return
+    
+    # Word boundaries, found in one scan; each window bisects into them
+    spaces = [match.start() for match in _SPACE.finditer(text)]
+    
+    start = 0
+    
+    while True:
+        end = start + chunk_size
+        
+        if end < n:
+            # Break after the last space in the window, provided the next
+            # window (end - overlap) still moves forward; otherwise cut hard
+            i = bisect_left(spaces, end) - 1
+            if i >= 0 and spaces[i] + 1 - overlap > start:
+                end = spaces[i] + 1
+        
+        # Trim by moving the offsets rather than copying and stripping
+        s, e = start, min(end, n)
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if s < e:
+            yield s, e
+        
+        if end >= n:
+            return
+        
+        # Move start position with overlap
+        start = max(start + 1, end - overlap)
+
+
+def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    """Split text into overlapping chunks for embedding."""
+    if len(text) <= chunk_size:
+        return [text]
+    return [text[s:e] for s, e in chunk_spans(text, chunk_size, overlap)]
@@ -1,19 +1,110 @@
 """LLM service for OpenAI API integration with fallback and circuit breaker."""
 
 import asyncio
+import hashlib
+import json
+import logging
 import time
-from typing import AsyncIterator, Optional, Dict, Any, List
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple
+import httpx
 import openai
 from openai import AsyncOpenAI
-import pybreaker
+from api.services.cache import LocalCache
+from api.services.semantic_cache import semantic_cache
+from api.utils.circuit_breaker import AsyncCircuitBreaker, CircuitBreakerError
 from api.utils.config import get_openai_config, settings
 
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # Import mock service for development/testing
 try:
     from api.services.mock_ai_service import MockAIService
 except ImportError:
     MockAIService = None
 
+logger = logging.getLogger(__name__)
+
+# Token batching window for streamed completions
+STREAM_BATCH_CHARS = 256
+STREAM_BATCH_SECONDS = 0.02
+
+# Start the fallback model in parallel once the primary has gone this many
+# times its typical time-to-first-token without producing one
+HEDGE_FACTOR = 1.5
+
+# Shown to users when neither model could answer
+ERROR_RESPONSE = "Error: Unable to generate response. Please try again later."
+
+# Static system prompt. Keep it byte-identical across requests (no interpolation)
+# so provider-side prompt prefix caching applies to it.
+SYSTEM_PROMPT = """You are an AI document assistant that helps users understand and interact with their private documents. 
+Always provide accurate, helpful information based on the context provided from their uploaded documents.
+
+Guidelines:
+- Be concise but comprehensive
+- Cite specific sources from their documents when possible
+- If you're unsure about something, say so
+- Focus on practical insights and actionable information
+- Use clear, professional language
+- Respect the privacy and confidentiality of their documents
+- Only reference information from the documents they've uploaded"""
+
+
+@lru_cache(maxsize=1024)
+def _render_context(results: Tuple[Tuple[str, str, str], ...]) -> str:
+    """Render (title, source, snippet) tuples into the context message."""
+    parts = ["Relevant context:\n"]
+    for i, (title, source, snippet) in enumerate(results, 1):
+        parts.append(f"{i}. {title}\n   Source: {source}\n   Content: {snippet}...\n\n")
+    return "".join(parts)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Tokenizer for a model (cl100k_base for models tiktoken doesn't know).
+    
+    Loading may download the BPE file, so this is warmed off the event loop
+    at startup. A failed load is cached as None rather than retried per call.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer for {model}, counting words instead: {e}")
+        return None
+
+
+def _count_tokens(text: str, model: str) -> int:
+    """Count tokens in text, falling back to a word count without a tokenizer."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text.split())  # Rough token count
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class LLMUnavailableError(Exception):
+    """Raised when neither the primary nor the fallback model produced a response."""
+
+
+class _FallbackFailed(Exception):
+    """Raised by the hedged stream when the fallback model already ran and failed."""
+
 
 class LLMService:
     """Service for LLM interactions with fallback and circuit breaker."""
@@ -27,26 +118,50 @@ class LLMService:
         self.timeout = settings.openai_timeout
         
         # Circuit breaker for primary model
-        self.primary_breaker = pybreaker.CircuitBreaker(
+        self.primary_breaker = AsyncCircuitBreaker(
             fail_max=3,
             reset_timeout=60,
             exclude=[openai.AuthenticationError, openai.RateLimitError]
         )
         
         # Circuit breaker for fallback model
-        self.fallback_breaker = pybreaker.CircuitBreaker(
+        self.fallback_breaker = AsyncCircuitBreaker(
             fail_max=2,
             reset_timeout=30,
             exclude=[openai.AuthenticationError, openai.RateLimitError]
         )
+        
+        # Moving average of the primary model's time to first token (seconds)
+        self._primary_ttft = settings.llm_hedge_delay_ms / 1000
+        
+        # Exact-match response cache, checked before the semantic cache
+        self._exact_cache = LocalCache(maxsize=512, ttl=settings.response_cache_ttl)
+        
+        # Strong references to fire-and-forget tasks so they aren't garbage collected
+        self._bg_tasks: set[asyncio.Task] = set()
+    
+    def _on_bg_task_done(self, task: asyncio.Task):
+        """Drop a finished background task and report any failure."""
+        self._bg_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Background task failed", exc_info=task.exception())
     
     async def connect(self):
-        """Initialize OpenAI client."""
+        """Initialize OpenAI client and load the tokenizer."""
+        await asyncio.to_thread(_get_encoding, self.primary_model)
         if not self.client and self.config["api_key"]:
+            # One pooled HTTP client for the process so completions reuse
+            # warm TLS connections (multiplexed over HTTP/2 when h2 is installed)
+            http_client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+                timeout=self.timeout
+            )
             self.client = AsyncOpenAI(
                 api_key=self.config["api_key"],
                 base_url=self.config["base_url"],
-                timeout=self.timeout
+                timeout=self.timeout,
+                http_client=http_client
             )
     
     async def disconnect(self):
@@ -59,7 +174,8 @@ class LLMService:
         self, 
         messages: List[Dict[str, str]], 
         context: Optional[List[Dict[str, Any]]] = None,
-        org_id: Optional[int] = None
+        org_id: Optional[int] = None,
+        raise_on_error: bool = False
     ) -> AsyncIterator[str]:
         """
         Stream chat completion with context from search results.
@@ -68,6 +184,8 @@ class LLMService:
             messages: List of message dictionaries
             context: List of search results to include as context
             org_id: Organization ID for logging
+            raise_on_error: Raise LLMUnavailableError instead of yielding an
+                error message when no model can answer
             
         Yields:
             Token strings as they arrive
@@ -76,7 +194,7 @@ class LLMService:
         
         # Check if we should use mock mode
         if settings.mock_mode and MockAIService:
-            print("🔧 Using mock AI service for chat")
+            logger.info("🔧 Using mock AI service for chat")
             mock_service = MockAIService()
             
             # Get the user's message
@@ -87,7 +205,7 @@ class LLMService:
             if context:
                 context_text = " ".join([result.get("snippet", "")[:100] for result in context[:3]])
             
-            mock_response = mock_service.generate_chat_response(user_message, context_text)
+            mock_response = await mock_service.generate_chat_response(user_message, context_text)
             response_text = mock_response["response"]
             
             # Simulate streaming by yielding characters
@@ -96,120 +214,239 @@ class LLMService:
                 await asyncio.sleep(0.01)  # Small delay to simulate streaming
             return
         
+        tokens: List[str] = []
         try:
             # Ensure we're connected
             if not self.client:
                 await self.connect()
             
-            # Build system message with context
-            system_message = self._build_system_message(context)
-            all_messages = [{"role": "system", "content": system_message}] + messages
+            # Static guidelines go first so the provider can reuse the cached
+            # prompt prefix; the per-query context follows as its own message
+            context_message = self._build_context_message(context)
+            all_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+            if context_message:
+                all_messages.append({"role": "system", "content": context_message})
+            all_messages += messages
+            
+            # Replay identical conversations (same org, messages and context) verbatim
+            exact_key = hashlib.sha256(
+                json.dumps([org_id, all_messages], separators=(",", ":")).encode()
+            ).hexdigest()
+            cached_chunks = self._exact_cache.get(exact_key)
+            if cached_chunks is not None:
+                for chunk in cached_chunks:
+                    yield chunk
+                return
+            
+            # Serve paraphrases of earlier questions (same org, same context) from cache
+            user_message = messages[-1]["content"] if messages else ""
+            context_hash = hashlib.sha256((context_message or "").encode()).hexdigest()
+            use_semantic_cache = settings.enable_semantic_cache and bool(user_message)
+            if use_semantic_cache:
+                cached_response = await semantic_cache.lookup(user_message, org_id, context_hash)
+                if cached_response:
+                    for i in range(0, len(cached_response), 20):
+                        yield cached_response[i:i + 20]
+                        await asyncio.sleep(0)
+                    return
             
-            # Try primary model first
+            # Try primary model first (hedged with the fallback if it is slow to start)
             try:
-                async for token in self._stream_with_model(
-                    all_messages, 
-                    self.primary_model,
-                    self.primary_breaker
-                ):
+                async for token in self._hedged_stream(all_messages):
+                    tokens.append(token)
                     yield token
+                if tokens:
+                    self._exact_cache.set(exact_key, tokens)
+                if use_semantic_cache and tokens:
+                    await semantic_cache.store(user_message, "".join(tokens), org_id, context_hash)
                 return
                 
-            except (pybreaker.CircuitBreakerError, Exception) as e:
-                print(f"Primary model failed: {e}")
+            except (CircuitBreakerError, Exception) as e:
+                logger.warning("Primary model failed", exc_info=e)
                 
-                # Try fallback model if enabled
-                if settings.enable_fallback_llm:
+                # Try fallback model if enabled and the hedge hasn't already
+                if settings.enable_fallback_llm and not isinstance(e, _FallbackFailed):
                     try:
+                        tokens = []
                         async for token in self._stream_with_model(
                             all_messages, 
                             self.fallback_model,
                             self.fallback_breaker
                         ):
+                            tokens.append(token)
                             yield token
+                        if tokens:
+                            self._exact_cache.set(exact_key, tokens)
+                        if use_semantic_cache and tokens:
+                            await semantic_cache.store(user_message, "".join(tokens), org_id, context_hash)
                         return
                         
                     except Exception as fallback_error:
-                        print(f"Fallback model also failed: {fallback_error}")
-                        yield f"Error: Unable to generate response. Please try again later."
+                        logger.error("Fallback model also failed", exc_info=fallback_error)
+                        if raise_on_error:
+                            raise LLMUnavailableError(ERROR_RESPONSE) from fallback_error
+                        yield ERROR_RESPONSE
                         return
                 else:
-                    yield f"Error: Unable to generate response. Please try again later."
+                    if raise_on_error:
+                        raise LLMUnavailableError(ERROR_RESPONSE) from e
+                    yield ERROR_RESPONSE
                     return
                     
         finally:
-            # Log the interaction
+            # Log in the background so the stream closes without waiting on it
             latency_ms = int((time.time() - start_time) * 1000)
-            await self._log_interaction(messages, context, latency_ms, org_id)
+            task = asyncio.create_task(
+                self._log_interaction(messages, context, latency_ms, org_id, completion="".join(tokens))
+            )
+            self._bg_tasks.add(task)
+            task.add_done_callback(self._on_bg_task_done)
+    
+    async def _hedged_stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Stream from the primary model, racing the fallback model if the
+        primary is slow to produce its first token.
+        
+        Whichever model yields first is streamed to completion and the other
+        is cancelled. Errors are only raised once no model is left running,
+        as _FallbackFailed if the fallback was among them.
+        """
+        start = time.monotonic()
+        primary = self._stream_with_model(messages, self.primary_model, self.primary_breaker)
+        primary_task = asyncio.ensure_future(primary.__anext__())
+        streams = {primary_task: primary}
+        
+        done, _ = await asyncio.wait({primary_task}, timeout=self._primary_ttft * HEDGE_FACTOR)
+        if not done and settings.enable_fallback_llm:
+            logger.info("Primary model slow to respond; hedging with fallback model")
+            fallback = self._stream_with_model(messages, self.fallback_model, self.fallback_breaker)
+            streams[asyncio.ensure_future(fallback.__anext__())] = fallback
+        
+        winner = None
+        pending = set(streams)
+        try:
+            while winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        winner = task
+                        break
+                if winner is None and not pending:
+                    if len(streams) > 1:
+                        raise _FallbackFailed("Primary and fallback models both failed") from error
+                    raise error
+        finally:
+            # Cancel the losers and close their streams
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task, stream in streams.items():
+                if task is not winner:
+                    if task.done() and not task.cancelled():
+                        task.exception()  # mark retrieved
+                    await stream.aclose()
+        
+        # Track the primary's time to first token. When the fallback won, the
+        # wait so far is a lower bound on it; counting that too lets a
+        # persistently slow primary raise the estimate until hedging stops
+        if winner is primary_task or primary_task in pending:
+            ttft = time.monotonic() - start
+            self._primary_ttft = 0.8 * self._primary_ttft + 0.2 * ttft
+        
+        if winner.exception() is not None:
+            return  # Empty completion
+        yield winner.result()
+        try:
+            async for token in streams[winner]:
+                yield token
+        except Exception as e:
+            if winner is primary_task:
+                raise
+            raise _FallbackFailed("Fallback model failed mid-stream") from e
     
     async def _stream_with_model(
         self, 
         messages: List[Dict[str, str]], 
         model: str,
-        breaker: pybreaker.CircuitBreaker
+        breaker: AsyncCircuitBreaker
     ) -> AsyncIterator[str]:
         """Stream completion with a specific model using circuit breaker."""
+        if not self.client:
+            await self.connect()
         
-        @breaker
-        async def _make_request():
-            if not self.client:
-                await self.connect()
-            
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=0.7,
-                stream=True
-            )
-            
+        # Only opening the stream is guarded; that is where failures surface
+        response = await breaker.call(
+            self.client.chat.completions.create,
+            model=model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=0.7,
+            stream=True
+        )
+        
+        # Coalesce tokens into small time/size windows so downstream sends
+        # one event per batch instead of one per token
+        buffer: List[str] = []
+        buffered = 0
+        last_flush = time.monotonic()
+        try:
             async for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                buffer.append(delta)
+                buffered += len(delta)
+                now = time.monotonic()
+                if buffered >= STREAM_BATCH_CHARS or now - last_flush >= STREAM_BATCH_SECONDS:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    buffered = 0
+                    last_flush = now
+        except Exception:
+            # Hand over what already arrived before surfacing the failure
+            if buffer:
+                yield "".join(buffer)
+                buffer.clear()
+            raise
         
-        async for token in _make_request():
-            yield token
+        if buffer:
+            yield "".join(buffer)
     
-    def _build_system_message(self, context: Optional[List[Dict[str, Any]]] = None) -> str:
-        """Build system message with context from search results."""
-        base_message = """You are an AI document assistant that helps users understand and interact with their private documents. 
-        Always provide accurate, helpful information based on the context provided from their uploaded documents.
-        
-        Guidelines:
-        - Be concise but comprehensive
-        - Cite specific sources from their documents when possible
-        - If you're unsure about something, say so
-        - Focus on practical insights and actionable information
-        - Use clear, professional language
-        - Respect the privacy and confidentiality of their documents
-        - Only reference information from the documents they've uploaded"""
+    def _build_context_message(self, context: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+        """Build the message carrying context from search results, if any."""
+        if not context:
+            return None
         
-        if context:
-            context_text = "\n\nRelevant context:\n"
-            for i, result in enumerate(context[:5], 1):  # Limit to top 5 results
-                context_text += f"{i}. {result.get('title', 'Untitled')}\n"
-                context_text += f"   Source: {result.get('source', 'Unknown')}\n"
-                context_text += f"   Content: {result.get('snippet', result.get('text', ''))[:300]}...\n\n"
-            
-            base_message += context_text
-        
-        return base_message
+        # Limit to top 5 results, in ranked order
+        return _render_context(tuple(
+            (
+                result.get('title', 'Untitled'),
+                result.get('source', 'Unknown'),
+                result.get('snippet', result.get('text', ''))[:300],
+            )
+            for result in context[:5]
+        ))
     
     async def _log_interaction(
         self, 
         messages: List[Dict[str, str]], 
         context: Optional[List[Dict[str, Any]]], 
         latency_ms: int,
-        org_id: Optional[int]
+        org_id: Optional[int],
+        completion: str = ""
     ):
         """Log the interaction for analytics."""
         # This would typically save to the database
-        # For now, just print to console
+        # For now, just log it
         input_text = messages[-1]["content"] if messages else ""
-        tokens_in = len(input_text.split())  # Rough token count
-        tokens_out = 0  # Would need to count actual tokens
+        tokens_in = _count_tokens(input_text, self.primary_model)
+        tokens_out = _count_tokens(completion, self.primary_model)
         
-        print(f"LLM Interaction - Input: {input_text[:100]}..., Latency: {latency_ms}ms, Org: {org_id}")
+        logger.info(
+            "LLM Interaction - Input: %s..., Tokens: %d in / %d out, Latency: %dms, Org: %s",
+            input_text[:100], tokens_in, tokens_out, latency_ms, org_id
+        )
     
     async def chat(
         self, 
@@ -227,10 +464,13 @@ class LLMService:
             
         Returns:
             Complete response string
+            
+        Raises:
+            LLMUnavailableError: If neither the primary nor the fallback model answered
         """
         # Check if we should use mock mode
         if settings.mock_mode and MockAIService:
-            print("🔧 Using mock AI service for chat")
+            logger.info("🔧 Using mock AI service for chat")
             mock_service = MockAIService()
             
             # Get the user's message
@@ -241,16 +481,39 @@ class LLMService:
             if context:
                 context_text = " ".join([result.get("snippet", "")[:100] for result in context[:3]])
             
-            mock_response = mock_service.generate_chat_response(user_message, context_text)
+            mock_response = await mock_service.generate_chat_response(user_message, context_text)
             return mock_response["response"]
         
         # For real API calls, collect streaming response
         response_text = ""
-        async for token in self.stream_chat(messages, context, org_id):
+        async for token in self.stream_chat(messages, context, org_id, raise_on_error=True):
             response_text += token
         
         return response_text
     
+    def stream_chat_single(
+        self,
+        text: str,
+        *,
+        context: Optional[List[Dict[str, Any]]] = None,
+        org_id: Optional[int] = None,
+        raise_on_error: bool = False
+    ) -> AsyncIterator[str]:
+        """Stream a completion for a single user message (see stream_chat)."""
+        return self.stream_chat(
+            [{"role": "user", "content": text}], context, org_id, raise_on_error=raise_on_error
+        )
+    
+    async def chat_single(
+        self,
+        text: str,
+        *,
+        context: Optional[List[Dict[str, Any]]] = None,
+        org_id: Optional[int] = None
+    ) -> str:
+        """Complete a single user message (see chat)."""
+        return await self.chat([{"role": "user", "content": text}], context, org_id)
+    
     async def get_models(self) -> List[Dict[str, Any]]:
         """Get available models from OpenAI."""
         try:
@@ -267,7 +530,7 @@ class LLMService:
                 for model in models.data
             ]
         except Exception as e:
-            print(f"Error fetching models: {e}")
+            logger.warning("Error fetching models: %s", e)
             return []
     
     async def get_usage_stats(self) -> Dict[str, Any]:
@@ -3,63 +3,123 @@ Mock AI Service for Development and Testing
 Provides fake AI responses without requiring real API keys
 """
 
+import asyncio
 import random
+import re
 import time
+import zlib
+from collections import deque
 from typing import List, Dict, Any
 import json
+import numpy as np
+from api.utils.config import settings
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Keywords per message category, highest priority first
+CLASSIFIER_KEYWORDS = [
+    ("healthcare", ["healthcare", "patient", "hipaa", "medical", "clinical"]),
+    ("policy", ["policy", "policies", "guidelines", "procedures", "rules"]),
+    ("technology", ["technical", "code", "implementation", "architecture", "development", "software"]),
+    ("document", ["document", "file", "content", "text"]),
+]
+
+
+def _build_classifier():
+    """Compile the keyword table into a single-pass matcher."""
+    if ahocorasick:
+        automaton = ahocorasick.Automaton()
+        for priority, (category, words) in enumerate(CLASSIFIER_KEYWORDS):
+            for word in words:
+                automaton.add_word(word, (priority, category))
+        automaton.make_automaton()
+        return automaton
+    
+    # One alternation group per category; the matched group names the category.
+    # Wrapped in a lookahead so overlapping keywords are all reported.
+    return re.compile("(?=" + "|".join(
+        f"(?P<{category}>{'|'.join(map(re.escape, words))})"
+        for category, words in CLASSIFIER_KEYWORDS
+    ) + ")")
+
+
+_CLASSIFIER = _build_classifier()
+_CATEGORY_PRIORITY = {category: priority for priority, (category, _) in enumerate(CLASSIFIER_KEYWORDS)}
+
+_EMBEDDING_POOL = None
+
+
+def _embedding_pool() -> np.ndarray:
+    """Lazily generate a fixed pool of random unit vectors (1536 dimensions like OpenAI)."""
+    global _EMBEDDING_POOL
+    if _EMBEDDING_POOL is None:
+        # Gaussian samples normalize to directions uniform on the sphere
+        pool = np.random.default_rng(0).standard_normal((4096, 1536), dtype=np.float32)
+        pool /= np.linalg.norm(pool, axis=1, keepdims=True)
+        _EMBEDDING_POOL = pool
+    return _EMBEDDING_POOL
+
+
+# Mock chat responses per message category, shared by every instance
+MOCK_CHAT_RESPONSES = {
+    "document": [
+        "Based on the document content, I can see that this appears to be a comprehensive analysis covering multiple key areas. The main points include strategic planning, resource allocation, and performance metrics.",
+        "The document outlines several important considerations for project management. Key highlights include timeline constraints, budget requirements, and stakeholder expectations.",
+        "From reviewing this document, I've identified several critical insights about organizational structure and operational procedures."
+    ],
+    "general": [
+        "I'd be happy to help you with that question. Could you provide more context about what you're looking for?",
+        "That's an interesting topic. Let me break down the key concepts and provide some insights.",
+        "I understand your question. Here are some relevant points to consider based on the available information."
+    ],
+    "technical": [
+        "From a technical perspective, this involves several key components including data processing, API integration, and system architecture considerations.",
+        "The technical implementation requires careful attention to performance optimization, error handling, and scalability factors.",
+        "This technical challenge can be approached through multiple methodologies, each with their own trade-offs and benefits."
+    ],
+    "policy": [
+        "Based on your organization's policy documents, I can see several key guidelines that apply to your question. The policies emphasize compliance, safety, and professional conduct.",
+        "Your company's policy framework addresses this topic through established procedures and guidelines. Key areas include risk management and quality assurance.",
+        "The policy documents outline specific requirements and best practices for this situation. It's important to follow the established protocols."
+    ],
+    "healthcare": [
+        "According to your healthcare organization's policies, patient privacy and HIPAA compliance are paramount. The documents emphasize secure handling of sensitive information.",
+        "Your healthcare policies outline specific protocols for patient care, safety measures, and regulatory compliance requirements.",
+        "The policy documents detail procedures for maintaining patient confidentiality and ensuring quality care standards."
+    ],
+    "technology": [
+        "Your technology development standards emphasize code quality, testing practices, and deployment procedures. The documents outline best practices for software development.",
+        "Based on your technical documentation, the approach should focus on scalability, maintainability, and security considerations.",
+        "Your development standards highlight the importance of following established patterns and maintaining consistent code quality."
+    ]
+}
+
 
 class MockAIService:
     """Mock AI service that simulates OpenAI API responses"""
     
     def __init__(self, mock_mode: bool = True):
         self.mock_mode = mock_mode
-        self.conversation_history = []
+        self.conversation_history = deque(maxlen=settings.mock_history_maxlen)
         
         # Mock responses for different types of questions
-        self.mock_responses = {
-            "document": [
-                "Based on the document content, I can see that this appears to be a comprehensive analysis covering multiple key areas. The main points include strategic planning, resource allocation, and performance metrics.",
-                "The document outlines several important considerations for project management. Key highlights include timeline constraints, budget requirements, and stakeholder expectations.",
-                "From reviewing this document, I've identified several critical insights about organizational structure and operational procedures."
-            ],
-            "general": [
-                "I'd be happy to help you with that question. Could you provide more context about what you're looking for?",
-                "That's an interesting topic. Let me break down the key concepts and provide some insights.",
-                "I understand your question. Here are some relevant points to consider based on the available information."
-            ],
-            "technical": [
-                "From a technical perspective, this involves several key components including data processing, API integration, and system architecture considerations.",
-                "The technical implementation requires careful attention to performance optimization, error handling, and scalability factors.",
-                "This technical challenge can be approached through multiple methodologies, each with their own trade-offs and benefits."
-            ],
-            "policy": [
-                "Based on your organization's policy documents, I can see several key guidelines that apply to your question. The policies emphasize compliance, safety, and professional conduct.",
-                "Your company's policy framework addresses this topic through established procedures and guidelines. Key areas include risk management and quality assurance.",
-                "The policy documents outline specific requirements and best practices for this situation. It's important to follow the established protocols."
-            ],
-            "healthcare": [
-                "According to your healthcare organization's policies, patient privacy and HIPAA compliance are paramount. The documents emphasize secure handling of sensitive information.",
-                "Your healthcare policies outline specific protocols for patient care, safety measures, and regulatory compliance requirements.",
-                "The policy documents detail procedures for maintaining patient confidentiality and ensuring quality care standards."
-            ],
-            "technology": [
-                "Your technology development standards emphasize code quality, testing practices, and deployment procedures. The documents outline best practices for software development.",
-                "Based on your technical documentation, the approach should focus on scalability, maintainability, and security considerations.",
-                "Your development standards highlight the importance of following established patterns and maintaining consistent code quality."
-            ]
-        }
+        self.mock_responses = MOCK_CHAT_RESPONSES
     
-    def generate_chat_response(self, message: str, context: str = "", **kwargs) -> Dict[str, Any]:
+    async def generate_chat_response(self, message: str, context: str = "", **kwargs) -> Dict[str, Any]:
         """Generate a mock chat response"""
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
         # Simulate processing time
-        time.sleep(random.uniform(0.5, 2.0))
+        await asyncio.sleep(random.uniform(0.5, 2.0))
         
         # Determine response type based on message content
         response_type = self._classify_message(message)
-        response_text = random.choice(self.mock_responses[response_type])
+        templates = self.mock_responses[response_type]
+        response_text = templates[random.randrange(len(templates))]
         
         # Add some context if provided
         if context:
@@ -95,37 +155,36 @@ class MockAIService:
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        # Generate random embedding vector (1536 dimensions like OpenAI)
-        embedding = [random.uniform(-1, 1) for _ in range(1536)]
-        
-        # Normalize the vector
-        magnitude = sum(x*x for x in embedding) ** 0.5
-        normalized_embedding = [x/magnitude for x in embedding]
-        
-        return normalized_embedding
+        # Same text always maps to the same pooled unit vector
+        pool = _embedding_pool()
+        index = zlib.crc32(text.encode()) % len(pool)
+        return pool[index].tolist()
     
     def _classify_message(self, message: str) -> str:
         """Classify message type for appropriate mock response"""
         message_lower = message.lower()
         
-        if any(word in message_lower for word in ["healthcare", "patient", "hipaa", "medical", "clinical"]):
-            return "healthcare"
-        elif any(word in message_lower for word in ["policy", "policies", "guidelines", "procedures", "rules"]):
-            return "policy"
-        elif any(word in message_lower for word in ["technical", "code", "implementation", "architecture", "development", "software"]):
-            return "technology"
-        elif any(word in message_lower for word in ["document", "file", "content", "text"]):
-            return "document"
+        # Scan once and keep the highest-priority category seen; stop early on the top one
+        best = None
+        if ahocorasick:
+            matches = (match for _, match in _CLASSIFIER.iter(message_lower))
         else:
-            return "general"
+            matches = ((_CATEGORY_PRIORITY[m.lastgroup], m.lastgroup) for m in _CLASSIFIER.finditer(message_lower))
+        for priority, category in matches:
+            if best is None or priority < best[0]:
+                best = (priority, category)
+                if priority == 0:
+                    break
+        
+        return best[1] if best else "general"
     
     def get_conversation_history(self) -> List[Dict[str, Any]]:
         """Get stored conversation history"""
-        return self.conversation_history
+        return list(self.conversation_history)
     
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
 
 # Mock response templates for different scenarios
 MOCK_RESPONSES = {
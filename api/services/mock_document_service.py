@@ -3,22 +3,106 @@ Mock Document Processing Service for Development and Testing
 Simulates document processing without requiring real file uploads
 """
 
+import asyncio
+import bisect
 import random
-import time
-from typing import Dict, Any, List
+import re
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Set
 from datetime import datetime, timedelta
+from api.utils.config import settings
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokenize(text: str) -> Set[str]:
+    """Lowercased alphanumeric terms in text."""
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def _trigrams(text: str) -> Set[str]:
+    """All 3-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Mock extracted content by file type
+CONTENT_TEMPLATES = {
+    "pdf": "This is a mock PDF document content for development purposes. It contains sample text that would normally be extracted from a real PDF file.",
+    "docx": "Mock Word document content. This simulates the text that would be extracted from a real .docx file during processing.",
+    "txt": "Plain text document content for testing. This represents the extracted text from a simple text file.",
+    "md": "# Mock Markdown Document\n\nThis is a sample markdown file with various formatting elements for testing purposes."
+}
+DEFAULT_CONTENT = "Mock document content for development and testing."
+
 
 class MockDocumentService:
     """Mock document service for development and testing"""
     
-    def __init__(self, mock_mode: bool = True):
+    def __init__(self, mock_mode: bool = True, upload_delay_ms: Optional[int] = None):
         self.mock_mode = mock_mode
-        self.documents = []
+        # Upper bound on the simulated upload processing time (0 disables it)
+        if upload_delay_ms is None:
+            upload_delay_ms = settings.mock_upload_delay_ms
+        self.upload_delay = upload_delay_ms / 1000
+        # Documents by id (insertion ordered), plus a per-organization index
+        self.documents: Dict[int, Dict[str, Any]] = {}
+        self._by_org: Dict[int, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        
+        # Inverted index for search: term -> doc ids, the sorted vocabulary
+        # (for prefix lookups) and each doc's terms (for removal)
+        self._index: Dict[str, Set[int]] = defaultdict(set)
+        self._vocabulary: List[str] = []
+        self._doc_terms: Dict[int, Set[str]] = {}
+        
+        # Lowercased search text and its trigrams per doc, computed once at
+        # insert for the substring fallback
+        self._haystacks: Dict[int, tuple] = {}
+        self._doc_trigrams: Dict[int, Set[str]] = {}
+        
         self.document_counter = 1
         
         # Initialize with some mock documents
         self._initialize_mock_documents()
     
+    def _insert(self, doc: Dict[str, Any]):
+        """Add a document to the store and its organization index."""
+        self.documents[doc["id"]] = doc
+        self._by_org[doc["organization_id"]][doc["id"]] = doc
+        
+        haystack = (doc["title"].lower(), doc["content"].lower(), doc["filename"].lower())
+        self._haystacks[doc["id"]] = haystack
+        self._doc_trigrams[doc["id"]] = set().union(*map(_trigrams, haystack))
+        
+        terms = _tokenize(f"{doc['title']} {doc['content']} {doc['filename']}")
+        self._doc_terms[doc["id"]] = terms
+        for term in terms:
+            if term not in self._index:
+                bisect.insort(self._vocabulary, term)
+            self._index[term].add(doc["id"])
+    
+    def _remove(self, doc: Dict[str, Any]):
+        """Drop a document from the store and all indexes."""
+        self.documents.pop(doc["id"], None)
+        self._by_org[doc["organization_id"]].pop(doc["id"], None)
+        self._haystacks.pop(doc["id"], None)
+        self._doc_trigrams.pop(doc["id"], None)
+        
+        for term in self._doc_terms.pop(doc["id"], ()):
+            postings = self._index[term]
+            postings.discard(doc["id"])
+            if not postings:
+                del self._index[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+    
+    def _match_prefix(self, prefix: str) -> Set[int]:
+        """Ids of documents containing a term that starts with prefix."""
+        ids: Set[int] = set()
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            ids |= self._index[self._vocabulary[i]]
+            i += 1
+        return ids
+    
     def _initialize_mock_documents(self):
         """Initialize with sample mock documents"""
         sample_docs = [
@@ -45,48 +129,45 @@ class MockDocumentService:
             }
         ]
         
-        for doc in sample_docs:
-            self.documents.append({
+        # One clock read and one batch of random ages for all sample docs
+        now = datetime.now()
+        ages = random.choices(range(1, 31), k=len(sample_docs))
+        for doc, age_days in zip(sample_docs, ages):
+            self._insert({
                 "id": self.document_counter,
                 "filename": doc["filename"],
                 "title": doc["title"],
                 "file_size": doc["file_size"],
                 "content": doc["content"],
                 "file_type": doc["file_type"],
-                "upload_date": datetime.now() - timedelta(days=random.randint(1, 30)),
+                "upload_date": now - timedelta(days=age_days),
                 "organization_id": 1,
                 "user_id": 1,
                 "status": "processed"
             })
             self.document_counter += 1
     
-    def upload_document(self, filename: str, file_content: bytes = None, **kwargs) -> Dict[str, Any]:
-        """Mock document upload"""
+    async def upload_document(self, filename: str, file_content: bytes = None, **kwargs) -> Dict[str, Any]:
+        """Mock document upload (async; callers must await it)"""
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        # Simulate processing time
-        time.sleep(random.uniform(1.0, 3.0))
+        # Simulate processing time without blocking the event loop
+        if self.upload_delay:
+            await asyncio.sleep(random.uniform(0, self.upload_delay))
         
         # Generate mock document data
         file_size = random.randint(100000, 5000000)
-        file_type = filename.split('.')[-1] if '.' in filename else 'txt'
-        
-        # Mock content based on file type
-        content_templates = {
-            "pdf": "This is a mock PDF document content for development purposes. It contains sample text that would normally be extracted from a real PDF file.",
-            "docx": "Mock Word document content. This simulates the text that would be extracted from a real .docx file during processing.",
-            "txt": "Plain text document content for testing. This represents the extracted text from a simple text file.",
-            "md": "# Mock Markdown Document\n\nThis is a sample markdown file with various formatting elements for testing purposes."
-        }
+        base, dot, extension = filename.rpartition('.')
+        file_type = extension if dot else 'txt'
         
-        content = content_templates.get(file_type, "Mock document content for development and testing.")
+        content = CONTENT_TEMPLATES.get(file_type, DEFAULT_CONTENT)
         
         # Create new document
         new_doc = {
             "id": self.document_counter,
             "filename": filename,
-            "title": filename.replace(f".{file_type}", "").replace("_", " ").title(),
+            "title": (base if dot else filename).replace("_", " ").title(),
             "file_size": file_size,
             "content": content,
             "file_type": file_type,
@@ -96,7 +177,7 @@ class MockDocumentService:
             "status": "processed"
         }
         
-        self.documents.append(new_doc)
+        self._insert(new_doc)
         self.document_counter += 1
         
         return {
@@ -112,8 +193,7 @@ class MockDocumentService:
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        # Filter by organization
-        org_docs = [doc for doc in self.documents if doc["organization_id"] == organization_id]
+        org_docs = list(self._by_org.get(organization_id, {}).values())
         
         return {
             "documents": org_docs,
@@ -125,7 +205,7 @@ class MockDocumentService:
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        doc = next((d for d in self.documents if d["id"] == document_id), None)
+        doc = self.documents.get(document_id)
         if not doc:
             raise Exception("Document not found")
         
@@ -136,11 +216,11 @@ class MockDocumentService:
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        doc = next((d for d in self.documents if d["id"] == document_id), None)
+        doc = self.documents.get(document_id)
         if not doc:
             raise Exception("Document not found")
         
-        self.documents.remove(doc)
+        self._remove(doc)
         
         return {
             "message": "Document deleted successfully",
@@ -152,38 +232,59 @@ class MockDocumentService:
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        # Simple mock search
-        query_lower = query.lower()
-        results = []
+        org_docs = self._by_org.get(organization_id, {})
+        if not org_docs:
+            return []
+        
+        # Every query term must prefix-match a term in the title, content or filename
+        terms = _tokenize(query)
+        matches = set(org_docs) if terms else set()
+        for term in sorted(terms, key=len, reverse=True):  # Most selective first
+            matches &= self._match_prefix(term)
+            if not matches:
+                break
         
-        for doc in self.documents:
-            if doc["organization_id"] == organization_id:
-                if (query_lower in doc["title"].lower() or 
-                    query_lower in doc["content"].lower() or
-                    query_lower in doc["filename"].lower()):
-                    results.append(doc)
+        if not matches:
+            matches = self._substring_matches(query.lower(), org_docs)
         
-        return results
+        return [org_docs[doc_id] for doc_id in sorted(matches)]
+    
+    def _substring_matches(self, query_lower: str, org_docs: Dict[int, Dict[str, Any]]) -> Set[int]:
+        """
+        Fallback for queries the term index can't answer (mid-word fragments,
+        punctuation): plain substring match against the pre-lowercased text.
+        """
+        if not query_lower:
+            return set()
+        query_trigrams = _trigrams(query_lower)
+        matches = set()
+        for doc_id in org_docs:
+            # Cheap rejection: the doc must contain every trigram of the query
+            if not query_trigrams <= self._doc_trigrams[doc_id]:
+                continue
+            if any(query_lower in field for field in self._haystacks[doc_id]):
+                matches.add(doc_id)
+        return matches
     
     def get_document_stats(self, organization_id: int = 1) -> Dict[str, Any]:
         """Get mock document statistics"""
         if not self.mock_mode:
             raise Exception("Mock service is disabled")
         
-        org_docs = [doc for doc in self.documents if doc["organization_id"] == organization_id]
-        
-        total_size = sum(doc["file_size"] for doc in org_docs)
-        file_types = {}
-        
-        for doc in org_docs:
-            file_type = doc["file_type"]
-            file_types[file_type] = file_types.get(file_type, 0) + 1
+        # One pass over the organization's documents
+        file_types = defaultdict(int)
+        total_size = 0
+        count = 0
+        for doc in self._by_org.get(organization_id, {}).values():
+            total_size += doc["file_size"]
+            file_types[doc["file_type"]] += 1
+            count += 1
         
         return {
-            "total_documents": len(org_docs),
+            "total_documents": count,
             "total_size_bytes": total_size,
-            "file_type_distribution": file_types,
-            "average_file_size": total_size // len(org_docs) if org_docs else 0
+            "file_type_distribution": dict(file_types),
+            "average_file_size": total_size // count if count else 0
         }
 
 # Mock document templates for testing
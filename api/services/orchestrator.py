@@ -1,16 +1,40 @@
 """Core orchestrator service for coordinating voice interactions."""
 
+import asyncio
+import re
 import time
-from typing import AsyncIterator, Optional, Dict, Any, List
+from typing import AsyncIterator, Optional, Dict, Any, List, Tuple, Union
+import numpy as np
 from api.services.cache import cache_service
 from api.services.search import search_service
-from api.services.llm import llm_service
+from api.services.llm import llm_service, LLMUnavailableError
 from api.services.stt import stt_service
 from api.services.vectorizer import vectorizer_service
 from api.services.rate_limit import rate_limit_service
 from api.models.schemas import ChatRequest, ChatResponse, ResponseEnvelope
 
 
+_WORD_RE = re.compile(r"\S+")
+
+
+def _word_count(text: str) -> int:
+    """Rough token count: whitespace-separated words, without building a list."""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+
+def _project_sources(search_results: List[Dict[str, Any]], n: int = 5) -> List[Dict[str, Any]]:
+    """Reduce the top n search results to the fields returned as sources."""
+    return [
+        {
+            "title": result.get("title", "Untitled"),
+            "source": result.get("source", ""),
+            "snippet": result.get("snippet", ""),
+            "score": result.get("score", 0)
+        }
+        for result in search_results[:n]
+    ]
+
+
 class OrchestratorService:
     """Main orchestrator service for voice interactions."""
     
@@ -20,19 +44,21 @@ class OrchestratorService:
         
     async def handle_voice_query(
         self, 
-        audio_data: bytes,
+        audio_data: Union[bytes, np.ndarray],
         org_id: Optional[int] = None,
         user_id: Optional[int] = None,
-        session_id: Optional[str] = None
+        session_id: Optional[str] = None,
+        audio_format: Optional[str] = None
     ) -> AsyncIterator[Dict[str, Any]]:
         """
         Handle a voice query end-to-end.
         
         Args:
-            audio_data: Raw audio data
+            audio_data: Raw audio data, or 16 kHz mono PCM decoded while streaming
             org_id: Organization ID
             user_id: User ID
             session_id: Session ID for tracking
+            audio_format: Client audio format (wav, webm, pcm, ...); None detects it
             
         Yields:
             Streaming response data
@@ -47,12 +73,14 @@ class OrchestratorService:
                 "timestamp": time.time()
             }
             
-            transcription = await stt_service.transcribe_audio(audio_data)
+            transcription = await stt_service.transcribe_audio(audio_data, audio_format)
+            # Events emitted back-to-back within a step share one timestamp
+            now = time.time()
             if transcription.get("error"):
                 yield {
                     "type": "error",
                     "data": f"Transcription failed: {transcription['error']}",
-                    "timestamp": time.time()
+                    "timestamp": now
                 }
                 return
             
@@ -64,38 +92,38 @@ class OrchestratorService:
                 "data": transcript_text,
                 "confidence": confidence,
                 "is_final": True,
-                "timestamp": time.time()
+                "timestamp": now
             }
             
-            # Step 2: Check rate limits
-            if org_id:
-                allowed, remaining, reset_time = await rate_limit_service.check_rate_limit(org_id, user_id)
-                if not allowed:
-                    yield {
-                        "type": "error",
-                        "data": f"Rate limit exceeded. Try again in {reset_time} seconds.",
-                        "timestamp": time.time()
-                    }
-                    return
-                
-                # Record the request
-                await rate_limit_service.record_request(org_id, user_id)
+            # Steps 2-3: Check rate limits and the response cache (independent
+            # Redis round trips, so overlap them)
+            response_key = cache_service.make_response_key(transcript_text, org_id)
+            (allowed, remaining, reset_time), cached_response = await asyncio.gather(
+                self._check_rate_limit(org_id, user_id),
+                cache_service.get_response_cache_by_key(response_key)
+            )
+            now = time.time()
+            if not allowed:
+                yield {
+                    "type": "error",
+                    "data": f"Rate limit exceeded. Try again in {reset_time} seconds.",
+                    "timestamp": now
+                }
+                return
             
-            # Step 3: Check cache for response
             yield {
                 "type": "status",
                 "data": "Searching for relevant information...",
-                "timestamp": time.time()
+                "timestamp": now
             }
             
-            cached_response = await cache_service.get_response_cache(transcript_text, org_id)
             if cached_response:
                 yield {
                     "type": "chat_response",
                     "data": cached_response["response"],
                     "sources": cached_response.get("sources", []),
                     "cached": True,
-                    "timestamp": time.time()
+                    "timestamp": now
                 }
                 return
             
@@ -105,7 +133,7 @@ class OrchestratorService:
                 yield {
                     "type": "error",
                     "data": "Organization ID is required for security",
-                    "timestamp": time.time()
+                    "timestamp": now
                 }
                 return
             
@@ -116,66 +144,70 @@ class OrchestratorService:
                 org_id=org_id
             )
             
+            now = time.time()
             if not search_results:
                 yield {
                     "type": "status",
                     "data": "No relevant documents found. Generating response...",
-                    "timestamp": time.time()
+                    "timestamp": now
             }
             
             # Step 5: Generate LLM response with context
             yield {
                 "type": "status",
                 "data": "Generating response...",
-                "timestamp": time.time()
+                "timestamp": now
             }
             
-            # Prepare context for LLM
-            context = self._prepare_context(search_results)
-            
             # Stream LLM response
             response_text = ""
             sources = []
             
-            async for token in llm_service.stream_chat(
-                [{"role": "user", "content": transcript_text}],
-                context=search_results,
-                org_id=org_id
-            ):
-                response_text += token
+            # Re-read the clock every 16 tokens rather than per token
+            token_count = 0
+            try:
+                async for token in llm_service.stream_chat_single(
+                    transcript_text,
+                    context=search_results,
+                    org_id=org_id,
+                    raise_on_error=True
+                ):
+                    if (token_count & 15) == 0:
+                        now = time.time()
+                    token_count += 1
+                    response_text += token
+                    yield {
+                        "type": "token",
+                        "data": token,
+                        "timestamp": now
+                    }
+            except LLMUnavailableError as e:
                 yield {
-                    "type": "token",
-                    "data": token,
+                    "type": "error",
+                    "data": str(e),
                     "timestamp": time.time()
                 }
+                return
             
             # Step 6: Cache the response
-            if response_text and not response_text.startswith("Error:"):
-                # Extract sources from search results
-                sources = [
-                    {
-                        "title": result.get("title", "Untitled"),
-                        "source": result.get("source", ""),
-                        "snippet": result.get("snippet", ""),
-                        "score": result.get("score", 0)
-                    }
-                    for result in search_results[:5]  # Top 5 sources
-                ]
+            if response_text:
+                # Same list goes into the cache entry and the final event
+                sources = _project_sources(search_results)
                 
                 # Cache the response (organization-scoped)
-                await cache_service.set_response_cache(
-                    transcript_text,
+                await cache_service.set_response_cache_by_key(
+                    response_key,
                     {
                         "response": response_text,
                         "sources": sources,
                         "org_id": org_id,
                         "user_id": user_id
-                    },
-                    org_id
+                    }
                 )
             
             # Step 7: Final response
-            latency_ms = int((time.time() - start_time) * 1000)
+            now = time.time()
+            latency_ms = int((now - start_time) * 1000)
             
             yield {
                 "type": "final",
@@ -187,7 +219,7 @@ class OrchestratorService:
                     "latency_ms": latency_ms,
                     "cached": False
                 },
-                "timestamp": time.time()
+                "timestamp": now
             }
             
         except Exception as e:
@@ -214,27 +246,22 @@ class OrchestratorService:
         start_time = time.time()
         
         try:
-            # Check rate limits
-            if request.org_id:
-                allowed, remaining, reset_time = await rate_limit_service.check_rate_limit(
-                    request.org_id, 
-                    request.user_id
-                )
-                if not allowed:
-                    raise Exception(f"Rate limit exceeded. Try again in {reset_time} seconds.")
-                
-                # Record the request
-                await rate_limit_service.record_request(request.org_id, request.user_id)
+            # Check rate limits and cache (organization-scoped) concurrently
+            response_key = cache_service.make_response_key(request.text, request.org_id)
+            (allowed, remaining, reset_time), cached_response = await asyncio.gather(
+                self._check_rate_limit(request.org_id, request.user_id),
+                cache_service.get_response_cache_by_key(response_key)
+            )
+            if not allowed:
+                raise Exception(f"Rate limit exceeded. Try again in {reset_time} seconds.")
             
-            # Check cache (organization-scoped)
-            cached_response = await cache_service.get_response_cache(request.text, request.org_id)
             if cached_response:
                 latency_ms = int((time.time() - start_time) * 1000)
                 return ChatResponse(
                     response=cached_response["response"],
                     sources=cached_response.get("sources", []),
-                    tokens_in=len(request.text.split()),
-                    tokens_out=len(cached_response["response"].split()),
+                    tokens_in=_word_count(request.text),
+                    tokens_out=_word_count(cached_response["response"]),
                     cached=True,
                     latency_ms=latency_ms
                 )
@@ -250,39 +277,32 @@ class OrchestratorService:
                 org_id=request.org_id
             )
             
-            # Generate LLM response
-            response_text = ""
+            # Generate LLM response; only successful answers are cached
+            succeeded = False
             try:
-                response_text = await llm_service.chat(
-                    [{"role": "user", "content": request.text}],
+                response_text = await llm_service.chat_single(
+                    request.text,
                     context=search_results,
                     org_id=request.org_id
                 )
             except Exception as e:
                 response_text = f"Error generating response: {str(e)}"
+            else:
+                succeeded = bool(response_text)
             
             # Prepare sources (even if empty)
-            sources = [
-                {
-                    "title": result.get("title", "Untitled"),
-                    "source": result.get("source", ""),
-                    "snippet": result.get("snippet", ""),
-                    "score": result.get("score", 0)
-                }
-                for result in search_results[:5]
-            ]
+            sources = _project_sources(search_results)
             
             # Cache response (organization-scoped)
-            if response_text and not response_text.startswith("Error:"):
-                await cache_service.set_response_cache(
-                    request.text,
+            if succeeded:
+                await cache_service.set_response_cache_by_key(
+                    response_key,
                     {
                         "response": response_text,
                         "sources": sources,
                         "org_id": request.org_id,
                         "user_id": request.user_id
-                    },
-                    request.org_id
+                    }
                 )
             
             # Calculate metrics
@@ -291,8 +311,8 @@ class OrchestratorService:
             return ChatResponse(
                 response=response_text,
                 sources=sources,
-                tokens_in=len(request.text.split()),
-                tokens_out=len(response_text.split()),
+                tokens_in=_word_count(request.text),
+                tokens_out=_word_count(response_text),
                 cached=False,
                 latency_ms=latency_ms
             )
@@ -301,13 +321,19 @@ class OrchestratorService:
             print(f"Text query error: {e}")
             raise e
     
+    async def _check_rate_limit(self, org_id: Optional[int], user_id: Optional[int]) -> Tuple[bool, int, int]:
+        """Rate limit check; requests without an org are not limited here."""
+        if not org_id:
+            return True, 0, 0
+        return await rate_limit_service.check_rate_limit(org_id, user_id)
+    
     def _prepare_context(self, search_results: List[Dict[str, Any]]) -> str:
         """Prepare context string from search results for LLM."""
         if not search_results:
             return ""
         
         context_parts = []
-        total_length = 0
+        remaining = self.max_context_length
         
         for result in search_results:
             # Create context entry
@@ -317,12 +343,12 @@ class OrchestratorService:
             
             entry = f"Title: {title}\nSource: {source}\nContent: {content}\n"
             
-            # Check if adding this entry would exceed context limit
-            if total_length + len(entry) > self.max_context_length:
+            # Stop once the next entry would exceed the context limit
+            if len(entry) > remaining:
                 break
             
             context_parts.append(entry)
-            total_length += len(entry)
+            remaining -= len(entry)
         
         return "\n".join(context_parts)
     
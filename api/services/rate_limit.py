@@ -1,10 +1,80 @@
 """Rate limiting service using Redis sliding window implementation."""
 
+import asyncio
 import time
 from typing import Optional, Tuple
 import redis.asyncio as redis
+from api.services.cache import LocalCache
 from api.utils.config import get_redis_url, settings
 
+# Pub/sub channel announcing org rate limit changes to every worker
+CONFIG_INVALIDATION_CHANNEL = "rl:config:invalidate"
+
+# Per-second counters bucketed in one hash: field "c:<second % window>" holds
+# the count and "t:<second % window>" the second it belongs to, so buckets left
+# over from a previous minute are recognized and dropped lazily.
+RATE_LIMIT_WINDOW = 60
+RATE_LIMIT_TTL = 120
+
+# Atomically sum the live buckets, decide, and record the request.
+# KEYS[1] = bucket hash; ARGV = now (whole seconds), window, rpm, burst, ttl
+# Returns {allowed, remaining, reset_seconds}
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local rpm = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+local ttl = tonumber(ARGV[5])
+
+local fields = {}
+local raw = redis.call('HGETALL', key)
+for i = 1, #raw, 2 do
+    fields[raw[i]] = tonumber(raw[i + 1])
+end
+
+local count = 0
+local oldest = now
+local stale = {}
+for b = 0, window - 1 do
+    local ts = fields['t:' .. b]
+    if ts then
+        if now - ts < window then
+            count = count + (fields['c:' .. b] or 0)
+            if ts < oldest then
+                oldest = ts
+            end
+        else
+            table.insert(stale, 'c:' .. b)
+            table.insert(stale, 't:' .. b)
+            fields['t:' .. b] = nil
+        end
+    end
+end
+if #stale > 0 then
+    redis.call('HDEL', key, unpack(stale))
+end
+
+if count >= rpm or count >= burst then
+    -- Seconds until the oldest live bucket leaves the window (never negative)
+    return {0, 0, math.max(0, oldest + window - now)}
+end
+
+local b = now % window
+if fields['t:' .. b] == now then
+    redis.call('HINCRBY', key, 'c:' .. b, 1)
+else
+    redis.call('HSET', key, 'c:' .. b, 1, 't:' .. b, now)
+end
+redis.call('EXPIRE', key, ttl)
+return {1, math.max(0, rpm - count - 1), window}
+"""
+
+
+def _rate_limit_key(org_id: int, user_id: Optional[int] = None) -> str:
+    """Bucket hash key for an org (and optionally a user within it)."""
+    return f"rl:{org_id}:{user_id}" if user_id else f"rl:{org_id}"
+
 
 class RateLimitService:
     """Rate limiting service using Redis sliding window."""
@@ -12,17 +82,40 @@ class RateLimitService:
     def __init__(self):
         self.redis_url = get_redis_url()
         self.redis: Optional[redis.Redis] = None
+        self._check_script = None
+        
+        # Per-org (rpm, burst), cached briefly so lookups don't hit the
+        # config store on every request
+        self._org_limits_cache = LocalCache(maxsize=4096, ttl=30.0)
+        self._invalidation_task: Optional[asyncio.Task] = None
         
     async def connect(self):
         """Connect to Redis."""
         if not self.redis:
-            self.redis = redis.from_url(self.redis_url, decode_responses=True)
+            # Shared pool created once at app startup; health checks keep
+            # idle pooled connections usable. At the cap a check waits for a
+            # free connection rather than failing with "Too many connections"
+            pool = redis.BlockingConnectionPool.from_url(
+                self.redis_url,
+                decode_responses=True,
+                max_connections=64,
+                timeout=5,
+                health_check_interval=30
+            )
+            self.redis = redis.Redis(connection_pool=pool)
             await self.redis.ping()
+            # Runs via EVALSHA, falling back to EVAL if the script cache is cold
+            self._check_script = self.redis.register_script(SLIDING_WINDOW_LUA)
+            self._invalidation_task = asyncio.create_task(self._listen_for_config_invalidations())
     
     async def disconnect(self):
         """Disconnect from Redis."""
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            self._invalidation_task = None
         if self.redis:
-            await self.redis.close()
+            # The client doesn't own a pool it was handed, so close that too
+            await self.redis.close(close_connection_pool=True)
             self.redis = None
     
     async def check_rate_limit(
@@ -33,12 +126,17 @@ class RateLimitService:
         burst: Optional[int] = None
     ) -> Tuple[bool, int, int]:
         """
-        Check if request is within rate limits.
+        Check if request is within rate limits and, if so, record it.
+        
+        Counting the live per-second buckets, the allow/deny decision and
+        recording happen in one atomic Lua script.
         
         Returns:
             Tuple of (allowed, remaining_requests, reset_time)
         """
-        await self.connect()
+        # Connected at startup; only reconnect if that failed
+        if self.redis is None:
+            await self.connect()
         
         # Get rate limit config for org
         if rpm is None or burst is None:
@@ -46,94 +144,64 @@ class RateLimitService:
             rpm = rpm or org_rpm
             burst = burst or org_burst
         
-        # Create key for this org/user combination
-        key = f"rate_limit:{org_id}"
-        if user_id:
-            key += f":{user_id}"
-        
-        current_time = int(time.time())
-        window_start = current_time - 60  # 1 minute window
-        
-        # Get current requests in window
-        pipe = self.redis.pipeline()
-        pipe.zremrangebyscore(key, 0, window_start)  # Remove expired entries
-        pipe.zcard(key)  # Count remaining entries
-        pipe.zrange(key, 0, -1)  # Get all timestamps
-        pipe.expire(key, 120)  # Set expiry
+        allowed, remaining, reset_time = await self._check_script(
+            keys=[_rate_limit_key(org_id, user_id)],
+            args=[int(time.time()), RATE_LIMIT_WINDOW, rpm, burst, RATE_LIMIT_TTL]
+        )
         
-        results = await pipe.execute()
-        current_requests = results[1]
-        timestamps = results[2]
-        
-        # Check if we're within burst limit
-        if current_requests >= burst:
-            # Check if we can remove old requests to make room
-            if timestamps and current_time - int(timestamps[0]) >= 60:
-                # Oldest request is more than 1 minute old, allow
-                pass
-            else:
-                # Still within burst limit, deny
-                return False, 0, 60 - (current_time - int(timestamps[0]) if timestamps else 0)
-        
-        # Check if we're within RPM limit
-        if current_requests >= rpm:
-            # Check if we can remove old requests to make room
-            if timestamps and current_time - int(timestamps[0]) >= 60:
-                # Oldest request is more than 1 minute old, allow
-                pass
-            else:
-                # Still within RPM limit, deny
-                return False, 0, 60 - (current_time - int(timestamps[0]) if timestamps else 0)
-        
-        # Allow request
-        remaining = max(0, rpm - current_requests)
-        reset_time = 60 - (current_time - window_start)
-        
-        return True, remaining, reset_time
+        return bool(allowed), int(remaining), int(reset_time)
     
-    async def record_request(
-        self, 
-        org_id: int, 
-        user_id: Optional[int] = None
-    ) -> bool:
-        """Record a request for rate limiting."""
-        await self.connect()
-        
-        key = f"rate_limit:{org_id}"
-        if user_id:
-            key += f":{user_id}"
-        
-        current_time = int(time.time())
-        
-        # Add current timestamp to sorted set
-        await self.redis.zadd(key, {str(current_time): current_time})
-        await self.redis.expire(key, 120)  # 2 minute expiry
-        
-        return True
+    async def _listen_for_config_invalidations(self):
+        """Drop cached org limits when any worker announces a change."""
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(CONFIG_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    self._org_limits_cache.delete(int(message["data"]))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Cached limits still expire on their TTL
+            print(f"Warning: Rate limit config invalidation listener stopped: {e}")
+        finally:
+            await pubsub.close()
     
     async def _get_org_rate_limits(self, org_id: int) -> Tuple[int, int]:
         """Get rate limit configuration for an organization."""
-        # This would typically query the database
-        # For now, return defaults
-        return settings.default_rpm, settings.default_burst
+        limits = self._org_limits_cache.get(org_id)
+        if limits is None:
+            # This would typically query the database
+            # For now, use defaults
+            limits = (settings.default_rpm, settings.default_burst)
+            self._org_limits_cache.set(org_id, limits)
+        return limits
     
     async def set_org_rate_limits(self, org_id: int, rpm: int, burst: int) -> bool:
         """Set rate limit configuration for an organization."""
         # This would typically update the database
-        # For now, just return success
+        # Drop the cached entry here and in every other worker
+        self._org_limits_cache.delete(org_id)
+        if self.redis is None:
+            await self.connect()
+        await self.redis.publish(CONFIG_INVALIDATION_CHANNEL, org_id)
         return True
     
     async def get_rate_limit_stats(self, org_id: int) -> dict:
         """Get rate limiting statistics for an organization."""
-        await self.connect()
+        if self.redis is None:
+            await self.connect()
         
-        key = f"rate_limit:{org_id}"
         current_time = int(time.time())
-        window_start = current_time - 60
-        
-        # Get current requests in window
-        await self.redis.zremrangebyscore(key, 0, window_start)
-        current_requests = await self.redis.zcard(key)
+        window_start = current_time - RATE_LIMIT_WINDOW
+        
+        # Sum the buckets that still fall inside the window
+        buckets = await self.redis.hgetall(_rate_limit_key(org_id))
+        current_requests = sum(
+            int(buckets.get(f"c:{b}", 0))
+            for b in range(RATE_LIMIT_WINDOW)
+            if current_time - int(buckets.get(f"t:{b}", window_start)) < RATE_LIMIT_WINDOW
+        )
         
         org_rpm, org_burst = await self._get_org_rate_limits(org_id)
         
@@ -0,0 +1,31 @@
+"""Shared thread pool for blocking model inference (embeddings, speech-to-text)."""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+CUDA_AVAILABLE = torch is not None and torch.cuda.is_available()
+
+# One inference at a time per core; a GPU serializes work anyway
+N_INFERENCE = 1 if CUDA_AVAILABLE else (os.cpu_count() or 1)
+
+EXECUTOR = ThreadPoolExecutor(max_workers=N_INFERENCE, thread_name_prefix="inference")
+INFERENCE_SEM = asyncio.Semaphore(N_INFERENCE)
+
+# Several concurrent calls each spawning a full set of torch intra-op threads
+# oversubscribes the CPU; give each call one thread instead
+if torch is not None and N_INFERENCE > 1:
+    torch.set_num_threads(1)
+
+
+async def run_inference(func: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking model call on the inference pool, waiting for a free slot."""
+    async with INFERENCE_SEM:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(EXECUTOR, func, *args)
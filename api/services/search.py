@@ -1,16 +1,54 @@
 """Semantic search service using pgvector and MMR reranking."""
 
 import json
+import logging
+import re
+from collections import Counter
 import numpy as np
+from prometheus_client import Gauge
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
-from sqlalchemy import text
+from sqlalchemy import select, text
 from sqlalchemy.orm import Session
 from api.models.db import get_db_session
-from api.models.entities import Doc, Embedding
+from api.models.entities import Doc, Embedding, SearchCache
 from api.services.cache import cache_service
 from api.services.vectorizer import vectorizer_service
 from api.utils.config import settings
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+hnsw_ef_search_gauge = Gauge(
+    'hnsw_ef_search',
+    'HNSW ef_search used for the most recent vector search'
+)
+
+# Name of the HNSW index on embedding.vector (see entities.Embedding)
+HNSW_INDEX = "ix_embedding_vector_hnsw"
+
+def _vector_literal(vector) -> str:
+    """pgvector text literal for a query vector."""
+    return "[" + ",".join(map(str, vector)) + "]"
+
+
+# Words ignored when turning a query into search terms
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should', 'may', 'might', 'can',
+    'what', 'how', 'why', 'when', 'where', 'who'
+})
+MIN_TERM_LEN = 3
+
+# orjson parses float-heavy vector strings several times faster; its
+# JSONDecodeError subclasses json.JSONDecodeError, so callers catch either
+_json_loads = orjson.loads if orjson else json.loads
+
 
 class SearchService:
     """Semantic search service with vector similarity and MMR reranking."""
@@ -19,13 +57,15 @@ class SearchService:
         self.embed_dims = settings.embed_dims
         self.default_k = 10
         self.mmr_lambda = 0.7  # Diversity vs relevance balance
+        self.mmr_shortlist = 20  # Most query-similar candidates MMR chooses among
     
     async def search(
         self, 
         query: str, 
         k: int = 10, 
         org_id: Optional[int] = None,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        mmr_lambda: Optional[float] = None
     ) -> List[Dict[str, Any]]:
         """
         Perform semantic search with MMR reranking.
@@ -35,193 +75,390 @@ class SearchService:
             k: Number of results to return
             org_id: Organization ID for filtering
             filters: Additional metadata filters
+            mmr_lambda: Relevance vs diversity weight (defaults to self.mmr_lambda;
+                1.0 ranks by relevance only)
             
         Returns:
             List of search results with scores and metadata
         """
+        # One pooled connection serves every query this search makes
+        db = get_db_session()
+        try:
+            lam = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+            return await self._search(db, query, k, org_id, filters, lam)
+        finally:
+            db.close()
+    
+    async def _search(
+        self,
+        db: Session,
+        query: str,
+        k: int,
+        org_id: Optional[int],
+        filters: Optional[Dict[str, Any]],
+        mmr_lambda: float
+    ) -> List[Dict[str, Any]]:
+        """Search pipeline for search(), running on the given session."""
         # Check cache first (organization-scoped)
-        cached_results = await cache_service.get_search_cache(query, org_id)
+        cached_results = await cache_service.get_search_cache(query, org_id, k, mmr_lambda)
         if cached_results:
             # Get full document details from cache
-            docs = await self._get_documents_by_ids(cached_results[:k])
+            docs = await self._get_documents_by_ids(db, cached_results[:k])
             return self._format_search_results(docs, query)
         
         # Generate query embedding
         query_embedding = await vectorizer_service.get_embedding(query)
-        if not query_embedding:
+        if query_embedding is None:
             return []
         
+        # Then for results of a sufficiently similar earlier query (paraphrases)
+        if org_id:
+            cached_doc_ids = self._semantic_cache_lookup(db, query_embedding, org_id, k, mmr_lambda)
+            if cached_doc_ids:
+                docs = await self._get_documents_by_ids(db, cached_doc_ids[:k])
+                return self._format_search_results(docs, query)
+        
         # Perform vector similarity search
         similar_embeddings = await self._vector_search(
+            db,
             query_embedding, 
-            k * 2,  # Get more results for MMR
+            max(k, min(k * 4, 50)),  # Get more results for MMR
             org_id,
             filters,
             query  # Pass the original query text
         )
         
-        if not similar_embeddings:
-            return []
-        
         # Apply MMR reranking only if we have vector data
-        if similar_embeddings and len(similar_embeddings) > 0 and "vector" in similar_embeddings[0]:
+        from_vectors = not similar_embeddings or "vector" in similar_embeddings[0]
+        if from_vectors:
             reranked_results = self._mmr_rerank(
                 query_embedding, 
                 similar_embeddings, 
-                k
+                k,
+                mmr_lambda
             )
         else:
             # For text search, just take the first k results
             reranked_results = similar_embeddings[:k]
         
+        # Documents the worker hasn't embedded yet are only found by text search;
+        # top up a short vector result with them
+        if from_vectors and len(reranked_results) < k:
+            seen = {result["doc_id"] for result in reranked_results}
+            text_results = await self._text_search(db, query, k, org_id, filters)
+            reranked_results += [
+                result for result in text_results if result["doc_id"] not in seen
+            ][:k - len(reranked_results)]
+        
+        if not reranked_results:
+            return []
+        
         # Cache results (organization-scoped)
         doc_ids = [result["doc_id"] for result in reranked_results]
-        await cache_service.set_search_cache(query, doc_ids, org_id)
+        await cache_service.set_search_cache(query, doc_ids, org_id, k, mmr_lambda)
+        if org_id and doc_ids:
+            self._semantic_cache_store(db, query_embedding, org_id, doc_ids, k, mmr_lambda)
         
         return reranked_results
     
     async def _vector_search(
         self, 
-        query_vector: List[float], 
+        db: Session,
+        query_vector: np.ndarray, 
         k: int,
         org_id: Optional[int] = None,
         filters: Optional[Dict[str, Any]] = None,
         query_text: str = ""
     ) -> List[Dict[str, Any]]:
         """Perform vector similarity search using pgvector."""
-        db = get_db_session()
+        # CRITICAL: Always filter by organization ID for security
+        if not org_id:
+            logger.warning("No org_id provided for search - this is a security risk!")
+            return []
+        
         try:
-            # For now, skip vector search and use text search directly
-            # TODO: Fix pgvector integration later
-            print("Using text search (vector search temporarily disabled)")
-            try:
-                result = await self._text_search(query_text, k, org_id, filters)
-                print(f"Text search returned {len(result)} results")
-                print(f"First result structure: {result[0] if result else 'No results'}")
-                return result
-            except Exception as e:
-                print(f"Text search failed: {e}")
-                import traceback
-                traceback.print_exc()
-                return []
-        finally:
-            db.close()
+            # Ordering by the bare distance expression (ascending) is what lets
+            # Postgres use the HNSW index; the similarity column is derived from it.
+            # Embeddings are unit length, so negative inner product (<#>) ranks
+            # like cosine distance without the per-row norms
+            query = text("""
+                SELECT
+                    e.id,
+                    e.doc_id,
+                    e.chunk_text,
+                    e.vector,
+                    d.title,
+                    d.doc_metadata,
+                    -(e.vector <#> CAST(:q AS halfvec)) AS similarity
+                FROM embedding e
+                JOIN doc d ON d.id = e.doc_id
+                WHERE d.org_id = :org_id
+                ORDER BY e.vector <#> CAST(:q AS halfvec)
+                LIMIT :k
+            """)
+            params = {
+                "q": _vector_literal(query_vector),
+                "org_id": org_id,
+                "k": k,
+            }
+            
+            # Candidate list size for the HNSW graph walk (this transaction only).
+            # All orgs share one index and the org filter applies after the walk,
+            # so it is sized to the whole index; iterative scan keeps walking
+            # until k rows pass the filter, so a small org's results aren't
+            # crowded out by other orgs' neighbours (pgvector >= 0.8; older
+            # versions ignore the setting)
+            ef_search = self._hnsw_params(self._get_index_size(db))["ef_search"]
+            db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+            db.execute(text("SET LOCAL hnsw.iterative_scan = strict_order"))
+            hnsw_ef_search_gauge.set(ef_search)
+            rows = db.execute(query, params).fetchall()
+            
+            return [
+                {
+                    "id": row.id,
+                    "score": float(row.similarity),
+                    "snippet": row.chunk_text,
+                    "metadata": self._safe_parse_metadata(row.doc_metadata),
+                    "doc_id": row.doc_id,
+                    "title": row.title,
+                    "vector": row.vector,
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            logger.warning("Vector search failed, falling back to text search: %s", e)
+            db.rollback()
+            return await self._text_search(db, query_text, k, org_id, filters)
+    
+    def _semantic_cache_lookup(
+        self,
+        db: Session,
+        query_vector: np.ndarray,
+        org_id: int,
+        k: int,
+        mmr_lambda: float
+    ) -> Optional[List[int]]:
+        """
+        Doc ids cached for the nearest earlier query, if it is similar enough and fresh.
+        
+        Only entries ranked with the same lambda for at least k results qualify.
+        """
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.search_semantic_cache_ttl)
+            row = db.execute(
+                text("""
+                    SELECT doc_ids, -(query_vector <#> CAST(:q AS halfvec)) AS similarity
+                    FROM searchcache
+                    WHERE org_id = :org_id AND created_at > :cutoff
+                      AND k >= :k AND mmr_lambda = :mmr_lambda
+                    ORDER BY query_vector <#> CAST(:q AS halfvec)
+                    LIMIT 1
+                """),
+                {
+                    "q": _vector_literal(query_vector),
+                    "org_id": org_id,
+                    "cutoff": cutoff,
+                    "k": k,
+                    "mmr_lambda": mmr_lambda,
+                }
+            ).first()
+            if row and row.similarity >= settings.search_semantic_cache_threshold:
+                return row.doc_ids
+            return None
+        except Exception as e:
+            logger.warning("Semantic search cache lookup failed: %s", e)
+            db.rollback()
+            return None
+    
+    def _semantic_cache_store(
+        self,
+        db: Session,
+        query_vector: np.ndarray,
+        org_id: int,
+        doc_ids: List[int],
+        k: int,
+        mmr_lambda: float
+    ):
+        """Remember a query's results under its embedding, pruning the org's expired entries."""
+        try:
+            db.execute(
+                text("DELETE FROM searchcache WHERE org_id = :org_id AND created_at < :cutoff"),
+                {
+                    "org_id": org_id,
+                    "cutoff": datetime.now(timezone.utc) - timedelta(seconds=settings.search_semantic_cache_ttl),
+                }
+            )
+            db.add(SearchCache(
+                org_id=org_id, query_vector=query_vector, doc_ids=doc_ids, k=k, mmr_lambda=mmr_lambda
+            ))
+            db.commit()
+        except Exception as e:
+            logger.warning("Semantic search cache store failed: %s", e)
+            db.rollback()
+    
+    def invalidate_semantic_cache_for_doc(self, db: Session, doc_id: int, org_id: int) -> int:
+        """
+        Drop cached searches whose query lies close to any chunk of a changed document.
+        
+        Returns the number of entries removed; the caller commits.
+        """
+        result = db.execute(
+            text("""
+                DELETE FROM searchcache c
+                WHERE c.org_id = :org_id
+                  AND (
+                      c.created_at < :cutoff
+                      OR EXISTS (
+                          SELECT 1 FROM embedding e
+                          WHERE e.doc_id = :doc_id
+                            AND -(e.vector <#> c.query_vector) >= :threshold
+                      )
+                  )
+            """),
+            {
+                "org_id": org_id,
+                "doc_id": doc_id,
+                "threshold": settings.search_cache_invalidation_threshold,
+                "cutoff": datetime.now(timezone.utc) - timedelta(seconds=settings.search_semantic_cache_ttl),
+            }
+        )
+        return result.rowcount
+    
+    def _get_index_size(self, db: Session) -> int:
+        """Planner estimate of the vectors in the HNSW index (0 before its first ANALYZE)."""
+        count = db.execute(
+            text("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = :index"),
+            {"index": HNSW_INDEX}
+        ).scalar()
+        return count or 0
+    
+    def _hnsw_params(self, count: int) -> Dict[str, int]:
+        """
+        HNSW search parameters for a corpus of the given size.
+        
+        Small corpora reach good recall with a narrow search; larger ones need
+        a wider candidate list. hnsw_ef_search is the setting for mid-size corpora.
+        """
+        if count < 100_000:
+            return {"m": 16, "ef_construction": 64, "ef_search": 40}
+        if count < 1_000_000:
+            return {"m": 24, "ef_construction": 128, "ef_search": settings.hnsw_ef_search}
+        return {"m": 32, "ef_construction": 200, "ef_search": 200}
     
     async def _text_search(
         self, 
+        db: Session,
         query_text: str, 
         k: int,
         org_id: Optional[int] = None,
         filters: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """Fallback text-based search when vector search fails."""
-        db = get_db_session()
-        try:
-            # Build the base query
-            base_query = """
-                SELECT 
-                    d.id,
-                    d.id as doc_id,
-                    d.text as chunk_text,
-                    0 as chunk_start,
-                    LENGTH(d.text) as chunk_end,
-                    '[]'::text as vector,
-                    d.title,
-                    d.source,
-                    d.doc_metadata,
-                    0.5 as similarity
-                FROM doc d
-                WHERE 1=1
-            """
-            
-            # Build conditions
-            conditions = []
-            params = {}
-            
-            # CRITICAL: Always filter by organization ID for security
-            if not org_id:
-                print("WARNING: No org_id provided for search - this is a security risk!")
-                return []
-            
-            # Ensure organization filter is always applied
-            conditions.append("d.org_id = :org_id")
-            params["org_id"] = org_id
+        # Build the base query
+        base_query = """
+            SELECT 
+                d.id,
+                d.id as doc_id,
+                d.text as chunk_text,
+                0 as chunk_start,
+                LENGTH(d.text) as chunk_end,
+                '[]'::text as vector,
+                d.title,
+                d.source,
+                d.doc_metadata,
+                0.5 as similarity
+            FROM doc d
+            WHERE 1=1
+        """
+        
+        # Build conditions
+        conditions = []
+        params = {}
+        
+        # CRITICAL: Always filter by organization ID for security
+        if not org_id:
+            logger.warning("No org_id provided for search - this is a security risk!")
+            return []
+        
+        # Ensure organization filter is always applied
+        conditions.append("d.org_id = :org_id")
+        params["org_id"] = org_id
+        
+        # Add text search using the actual query text
+        if query_text:
+            # Extract key words from query (simple approach), minus common words
+            words = query_text.lower().split()
+            search_terms = [word for word in words if len(word) >= MIN_TERM_LEN and word not in STOP_WORDS]
             
-            # Add text search using the actual query text
-            if query_text:
-                # Extract key words from query (simple approach)
-                words = query_text.lower().split()
-                # Filter out common words
-                stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'can', 'what', 'how', 'why', 'when', 'where', 'who'}
-                search_terms = [word for word in words if word not in stop_words and len(word) > 2]
+            if search_terms:
+                # Build search condition
+                # Bound parameters (never interpolate user text); the
+                # pg_trgm GIN indexes on title/text serve '%term%' patterns
+                search_conditions = []
+                for i, term in enumerate(search_terms[:3]):  # Use up to 3 terms
+                    search_conditions.append(f"(d.title ILIKE :t{i} OR d.text ILIKE :t{i})")
+                    params[f"t{i}"] = f"%{term}%"
                 
-                if search_terms:
-                    # Build search condition
-                    search_conditions = []
-                    for term in search_terms[:3]:  # Use up to 3 terms
-                        search_conditions.append(f"(d.title ILIKE '%{term}%' OR d.text ILIKE '%{term}%')")
-                    
-                    if search_conditions:
-                        conditions.append("(" + " OR ".join(search_conditions) + ")")
-            
-            # Combine all conditions
-            if conditions:
-                base_query += " AND " + " AND ".join(conditions)
-            
-            # Add ORDER BY and LIMIT
-            base_query += " ORDER BY d.created_at DESC LIMIT :k"
-            params["k"] = k
-            
-            # Execute the query
-            query = text(base_query)
-            result = db.execute(query, params)
-            rows = result.fetchall()
-            
-            # Format results to match SearchResult schema EXACTLY
-            formatted_results = []
-            for row in rows:
-                try:
-                    # Map database fields to SearchResult schema fields
-                    formatted_result = {
-                        "id": row.id,                    # SearchResult.id
-                        "score": float(row.similarity),  # SearchResult.score
-                        "snippet": row.chunk_text,       # SearchResult.snippet
-                        "metadata": self._safe_parse_metadata(row.doc_metadata),  # SearchResult.metadata
-                        "doc_id": row.doc_id,            # SearchResult.doc_id
-                        "title": row.title               # SearchResult.title
-                    }
-                    formatted_results.append(formatted_result)
-                    print(f"DEBUG: Formatted result: {formatted_result}")
-                except Exception as e:
-                    print(f"ERROR formatting result: {e}")
-                    continue
-            
-            print(f"DEBUG: Returning {len(formatted_results)} formatted results")
-            return formatted_results
-        finally:
-            db.close()
+                if search_conditions:
+                    conditions.append("(" + " OR ".join(search_conditions) + ")")
+        
+        # Combine all conditions
+        if conditions:
+            base_query += " AND " + " AND ".join(conditions)
+        
+        # Add ORDER BY and LIMIT
+        base_query += " ORDER BY d.created_at DESC LIMIT :k"
+        params["k"] = k
+        
+        # Execute the query
+        query = text(base_query)
+        result = db.execute(query, params)
+        rows = result.fetchall()
+        
+        # Format results to match SearchResult schema EXACTLY
+        formatted_results = []
+        for row in rows:
+            try:
+                # Map database fields to SearchResult schema fields
+                formatted_result = {
+                    "id": row.id,                    # SearchResult.id
+                    "score": float(row.similarity),  # SearchResult.score
+                    "snippet": row.chunk_text,       # SearchResult.snippet
+                    "metadata": self._safe_parse_metadata(row.doc_metadata),  # SearchResult.metadata
+                    "doc_id": row.doc_id,            # SearchResult.doc_id
+                    "title": row.title               # SearchResult.title
+                }
+                formatted_results.append(formatted_result)
+                logger.debug("Formatted result: %s", formatted_result)
+            except Exception:
+                logger.exception("Error formatting text search result")
+                continue
+        
+        logger.debug("Returning %d formatted results", len(formatted_results))
+        return formatted_results
     
     def _safe_parse_metadata(self, metadata_str: str) -> Dict[str, Any]:
         """Safely parse metadata string to dictionary."""
-        print(f"DEBUG: Parsing metadata: '{metadata_str}' (type: {type(metadata_str)})")
+        if isinstance(metadata_str, dict):
+            # JSON columns already come back decoded
+            return metadata_str
         
         if not metadata_str or metadata_str in ['{}', 'null', 'None']:
-            print(f"DEBUG: Returning empty dict for: '{metadata_str}'")
             return {}
         
         try:
-            result = json.loads(metadata_str)
-            print(f"DEBUG: Successfully parsed metadata: {result}")
-            return result
+            return _json_loads(metadata_str)
         except (json.JSONDecodeError, TypeError) as e:
-            print(f"Warning: Could not parse metadata '{metadata_str}': {e}")
+            logger.warning("Could not parse metadata %r: %s", metadata_str, e)
             return {}
     
     def _mmr_rerank(
         self, 
-        query_vector: List[float], 
+        query_vector: np.ndarray, 
         candidates: List[Dict[str, Any]], 
-        k: int
+        k: int,
+        mmr_lambda: Optional[float] = None
     ) -> List[Dict[str, Any]]:
         """
         Apply Maximal Marginal Relevance (MMR) reranking.
@@ -232,95 +469,114 @@ class SearchService:
         if not candidates:
             return []
         
-        # Convert vectors to numpy arrays for efficient computation
-        query_vec = np.array(query_vector)
-        candidate_vectors = []
-        for c in candidates:
+        # Decode straight into one contiguous float32 buffer; rows that fail to
+        # parse (or have the wrong dimension) are masked out afterwards
+        C = np.empty((len(candidates), self.embed_dims), dtype=np.float32)
+        valid_mask = np.zeros(len(candidates), dtype=bool)
+        for i, c in enumerate(candidates):
             try:
-                if isinstance(c["vector"], str):
-                    vector_data = json.loads(c["vector"])
+                vector = c["vector"]
+                if isinstance(vector, str):
+                    C[i] = _json_loads(vector)
+                elif hasattr(vector, "to_numpy"):
+                    # pgvector HalfVector / Vector loaded by the registered adapter
+                    C[i] = vector.to_numpy()
                 else:
-                    vector_data = c["vector"]
-                candidate_vectors.append(np.array(vector_data))
+                    C[i] = vector
+                valid_mask[i] = True
             except (json.JSONDecodeError, ValueError, TypeError):
                 # Skip invalid vectors
                 continue
         
-        if not candidate_vectors:
+        if not valid_mask.any():
             return []
+        valid = np.flatnonzero(valid_mask)
+        if len(valid) < len(candidates):
+            C = C[valid_mask]
         
-        # Calculate cosine similarities to query
-        similarities_to_query = [
-            np.dot(query_vec, vec) / (np.linalg.norm(query_vec) * np.linalg.norm(vec))
-            for vec in candidate_vectors
-        ]
+        # The vectorizer emits unit-length embeddings, so cosine similarity
+        # is a plain dot product
+        q = np.asarray(query_vector, dtype=np.float32)
         
-        # Initialize selected documents
-        selected = []
-        remaining = list(range(len(candidates)))
+        similarities_to_query = C @ q
+        lam = self.mmr_lambda if mmr_lambda is None else mmr_lambda
         
-        # Select first document (most similar to query)
-        first_idx = np.argmax(similarities_to_query)
-        selected.append(first_idx)
-        remaining.remove(first_idx)
+        # Nothing to diversify: plain relevance order
+        if len(C) <= k or lam >= 0.999:
+            order = np.argsort(-similarities_to_query)[:k]
+            return self._reranked(candidates, valid, similarities_to_query, order)
         
-        # Select remaining documents using MMR
-        for _ in range(min(k - 1, len(remaining))):
-            if not remaining:
-                break
-            
-            mmr_scores = []
-            for idx in remaining:
-                # Relevance to query
-                relevance = similarities_to_query[idx]
-                
-                # Diversity from selected documents
-                diversity = 0
-                if selected:
-                    similarities_to_selected = [
-                        np.dot(candidate_vectors[idx], candidate_vectors[sel_idx]) / 
-                        (np.linalg.norm(candidate_vectors[idx]) * np.linalg.norm(candidate_vectors[sel_idx]))
-                        for sel_idx in selected
-                    ]
-                    diversity = 1 - max(similarities_to_selected)
-                
-                # MMR score
-                mmr_score = self.mmr_lambda * relevance + (1 - self.mmr_lambda) * diversity
-                mmr_scores.append((idx, mmr_score))
-            
-            # Select document with highest MMR score
-            best_idx = max(mmr_scores, key=lambda x: x[1])[0]
-            selected.append(best_idx)
-            remaining.remove(best_idx)
+        # Shortlist the candidates closest to the query (O(N) partial sort);
+        # MMR at this lambda rarely picks anything further down
+        shortlist = max(self.mmr_shortlist, k)
+        if len(C) > shortlist:
+            top = np.argpartition(-similarities_to_query, shortlist - 1)[:shortlist]
+            C = C[top]
+            similarities_to_query = similarities_to_query[top]
+            valid = valid[top]
+        
+        # Pairwise similarities for the shortlist in one matrix product
+        sim_matrix = C @ C.T
+        
+        # Greedy MMR selection; rows no longer alive (already selected) score -inf
+        relevance = lam * similarities_to_query
+        max_sim = np.full(len(C), -np.inf, dtype=np.float32)
+        alive = np.ones(len(C), dtype=bool)
+        
+        best = int(np.argmax(similarities_to_query))
+        selected = [best]
+        alive[best] = False
+        for _ in range(min(k, len(C)) - 1):
+            # Track each row's highest similarity to anything selected so far
+            np.maximum(max_sim, sim_matrix[best], out=max_sim)
+            mmr_scores = relevance + (1 - lam) * (1 - max_sim)
+            mmr_scores[~alive] = -np.inf
+            best = int(mmr_scores.argmax())
+            selected.append(best)
+            alive[best] = False
         
-        # Return reranked results
+        return self._reranked(candidates, valid, similarities_to_query, selected)
+    
+    def _reranked(
+        self,
+        candidates: List[Dict[str, Any]],
+        valid: np.ndarray,
+        similarities_to_query: np.ndarray,
+        order
+    ) -> List[Dict[str, Any]]:
+        """Copies of the chosen candidates in order, scored by query similarity."""
         reranked = []
-        for idx in selected:
-            candidate = candidates[idx].copy()
-            candidate["mmr_score"] = similarities_to_query[idx]
+        for idx in order:
+            candidate = candidates[valid[idx]].copy()
+            candidate.pop("vector", None)  # Only needed for reranking
+            candidate["mmr_score"] = float(similarities_to_query[idx])
             reranked.append(candidate)
         
         return reranked
     
-    async def _get_documents_by_ids(self, doc_ids: List[int]) -> List[Dict[str, Any]]:
+    async def _get_documents_by_ids(self, db: Session, doc_ids: List[int]) -> List[Dict[str, Any]]:
         """Get document details by IDs."""
-        db = get_db_session()
-        try:
-            docs = db.query(Doc).filter(Doc.id.in_(doc_ids)).all()
-            return [
-                {
-                    "id": doc.id,
-                    "title": doc.title,
-                    "source": doc.source,
-                    "text": doc.text,
-                    "metadata": self._safe_parse_metadata(doc.doc_metadata),
-                    "similarity": 1.0,  # Cached results get max similarity
-                    "mmr_score": 1.0
-                }
-                for doc in docs
-            ]
-        finally:
-            db.close()
+        # Only the columns we return, in one IN query
+        rows = db.execute(
+            select(Doc.id, Doc.title, Doc.source, Doc.text, Doc.doc_metadata)
+            .where(Doc.id.in_(doc_ids))
+        ).all()
+        by_id = {row.id: row for row in rows}
+        
+        # Reassemble in the cached ranking order
+        return [
+            {
+                "id": doc.id,
+                "title": doc.title,
+                "source": doc.source,
+                "text": doc.text,
+                "metadata": self._safe_parse_metadata(doc.doc_metadata),
+                "similarity": 1.0,  # Cached results get max similarity
+                "mmr_score": 1.0
+            }
+            for doc in (by_id.get(doc_id) for doc_id in doc_ids)
+            if doc is not None
+        ]
     
     def _format_search_results(
         self, 
@@ -354,19 +610,35 @@ class SearchService:
             return text
         
         # Simple snippet creation - find query terms and create context
-        query_terms = query.lower().split()
+        query_terms = list(dict.fromkeys(
+            term for term in query.lower().split() if term not in STOP_WORDS
+        ))
         text_lower = text.lower()
         
-        # Find the best position for snippet
+        # Find the best position for snippet: the window containing the most
+        # distinct query terms. One regex scan finds every term occurrence,
+        # then the windows slide over the sorted hits.
         best_pos = 0
-        best_score = 0
-        
-        for i in range(0, len(text) - max_length, max_length // 2):
-            window = text_lower[i:i + max_length]
-            score = sum(1 for term in query_terms if term in window)
-            if score > best_score:
-                best_score = score
-                best_pos = i
+        if query_terms:
+            pattern = re.compile("(?=(" + "|".join(map(re.escape, query_terms)) + "))")
+            hits = [(m.start(), m.group(1)) for m in pattern.finditer(text_lower)]
+            
+            in_window = Counter()
+            lo = hi = 0
+            best_score = 0
+            for i in range(0, len(text) - max_length, max_length // 2):
+                while hi < len(hits) and hits[hi][0] < i + max_length:
+                    in_window[hits[hi][1]] += 1
+                    hi += 1
+                while lo < hi and hits[lo][0] < i:
+                    term = hits[lo][1]
+                    in_window[term] -= 1
+                    if not in_window[term]:
+                        del in_window[term]
+                    lo += 1
+                if len(in_window) > best_score:
+                    best_score = len(in_window)
+                    best_pos = i
         
         snippet = text[best_pos:best_pos + max_length]
         
@@ -0,0 +1,83 @@
+"""Semantic response cache keyed by query embeddings."""
+
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+from api.services.vectorizer import vectorizer_service
+from api.utils.config import settings
+
+
+class _Bucket:
+    """Cached responses sharing one organization and context."""
+    
+    def __init__(self, dims: int):
+        self.vectors = np.empty((0, dims), dtype=np.float32)  # Unit-length query embeddings
+        self.expires = np.empty(0, dtype=np.float64)
+        self.responses: List[str] = []
+
+
+class SemanticCache:
+    """In-process cache that serves stored LLM responses for paraphrased queries."""
+    
+    def __init__(self, max_entries: int = 512, max_buckets: int = 1024):
+        self.threshold = settings.semantic_cache_threshold
+        self.ttl = settings.response_cache_ttl
+        self.max_entries = max_entries  # Per organization/context bucket
+        self.max_buckets = max_buckets  # Least recently used buckets are evicted past this
+        self._buckets: "OrderedDict[Tuple[Optional[int], str], _Bucket]" = OrderedDict()
+    
+    async def lookup(self, query: str, org_id: Optional[int], context_hash: str) -> Optional[str]:
+        """Return a cached response for a query similar enough to a previous one."""
+        key = (org_id, context_hash)
+        bucket = self._buckets.get(key)
+        if bucket is None or not bucket.responses:
+            return None
+        self._buckets.move_to_end(key)
+        
+        query_vector = await self._embed(query)
+        if query_vector is None:
+            return None
+        
+        # Inner product equals cosine similarity for unit vectors
+        similarities = bucket.vectors @ query_vector
+        similarities[bucket.expires < time.time()] = -1.0
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return bucket.responses[best]
+        return None
+    
+    async def store(self, query: str, response: str, org_id: Optional[int], context_hash: str):
+        """Remember the response generated for a query."""
+        query_vector = await self._embed(query)
+        if query_vector is None:
+            return
+        
+        key = (org_id, context_hash)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(len(query_vector))
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        
+        bucket.vectors = np.vstack([bucket.vectors, query_vector])[-self.max_entries:]
+        bucket.expires = np.append(bucket.expires, time.time() + self.ttl)[-self.max_entries:]
+        bucket.responses = (bucket.responses + [response])[-self.max_entries:]
+    
+    def clear(self):
+        """Drop all cached responses."""
+        self._buckets.clear()
+    
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed a query as a unit-length float32 vector."""
+        embedding = await vectorizer_service.get_embedding(text)
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache()
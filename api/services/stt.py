@@ -2,18 +2,142 @@
 
 import asyncio
 import io
-import tempfile
-from typing import Optional, Dict, Any, List
-import whisper
+import threading
+from functools import partial
+from typing import Optional, Dict, Any, List, Union
+import numpy as np
+from faster_whisper import WhisperModel
+from api.services.runtime import run_inference
 from api.utils.config import settings
 
+# PyAV is optional; without it audio is buffered and decoded per utterance
+try:
+    import av
+except ImportError:
+    av = None
+
+# soundfile decodes WAV/FLAC/OGG in memory; without it faster-whisper decodes them with PyAV
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def _resample(pcm: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Resample mono float32 PCM to Whisper's 16 kHz."""
+    if sample_rate == WHISPER_SAMPLE_RATE:
+        return pcm
+    if librosa is not None:
+        return librosa.resample(pcm, orig_sr=sample_rate, target_sr=WHISPER_SAMPLE_RATE)
+    # Linear interpolation is adequate for speech
+    n_out = int(round(len(pcm) * WHISPER_SAMPLE_RATE / sample_rate))
+    positions = np.linspace(0, len(pcm) - 1, n_out)
+    return np.interp(positions, np.arange(len(pcm)), pcm).astype(np.float32)
+
+# Client format names -> PyAV demuxer names
+STREAMING_FORMATS = {"webm": "matroska", "ogg": "ogg"}
+
+
+class _ChunkPipe(io.RawIOBase):
+    """Blocking file-like reader over audio chunks as they arrive."""
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._eof = False
+        self._cond = threading.Condition()
+    
+    def readable(self) -> bool:
+        return True
+    
+    def write_chunk(self, data: bytes):
+        """Append a chunk and wake the reader."""
+        with self._cond:
+            self._buffer += data
+            self._cond.notify()
+    
+    def finish(self):
+        """Signal that no more chunks will arrive."""
+        with self._cond:
+            self._eof = True
+            self._cond.notify()
+    
+    def readinto(self, b) -> int:
+        with self._cond:
+            while not self._buffer and not self._eof:
+                self._cond.wait()
+            n = min(len(b), len(self._buffer))
+            b[:n] = self._buffer[:n]
+            del self._buffer[:n]
+            return n
+
+
+class StreamingAudioDecoder:
+    """Decode a WebM/Ogg Opus stream to 16 kHz mono PCM while it is still arriving."""
+    
+    def __init__(self, format: str, sample_rate: int = 16000):
+        self.container_format = STREAMING_FORMATS[format]
+        self.sample_rate = sample_rate
+        self._pipe = _ChunkPipe()
+        self._frames: List[np.ndarray] = []
+        self._error: Optional[Exception] = None
+        
+        # The demuxer blocks on the pipe, so it gets its own thread
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    @staticmethod
+    def supports(format: str) -> bool:
+        """Whether chunks in this format can be decoded incrementally."""
+        return av is not None and format in STREAMING_FORMATS
+    
+    def feed(self, data: bytes):
+        """Queue a chunk of container bytes for decoding."""
+        self._pipe.write_chunk(data)
+    
+    def _run(self):
+        try:
+            with av.open(self._pipe, mode="r", format=self.container_format) as container:
+                resampler = av.AudioResampler(format="flt", layout="mono", rate=self.sample_rate)
+                for frame in container.decode(audio=0):
+                    for resampled in resampler.resample(frame):
+                        self._frames.append(resampled.to_ndarray().reshape(-1))
+                # Flush samples buffered inside the resampler
+                for resampled in resampler.resample(None):
+                    self._frames.append(resampled.to_ndarray().reshape(-1))
+        except Exception as e:
+            self._error = e
+    
+    async def finish(self) -> Optional[np.ndarray]:
+        """Close the stream and return the decoded PCM, or None if decoding failed."""
+        self._pipe.finish()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._thread.join)
+        
+        if self._error is not None:
+            print(f"Streaming audio decode error: {self._error}")
+            return None
+        if not self._frames:
+            return None
+        return np.concatenate(self._frames).astype(np.float32, copy=False)
+    
+    def close(self):
+        """Stop decoding without collecting the result."""
+        self._pipe.finish()
+
 
 class STTService:
     """Speech-to-Text service with multiple provider support."""
     
     def __init__(self):
         self.provider = settings.stt_provider
-        self.whisper_model: Optional[whisper.Whisper] = None
+        self.whisper_model: Optional[WhisperModel] = None
         self.gcp_client = None
         
         # Whisper model configuration
@@ -22,8 +146,8 @@ class STTService:
         
     async def transcribe_audio(
         self, 
-        audio_data: bytes, 
-        format: str = "pcm",
+        audio_data: Union[bytes, np.ndarray], 
+        format: Optional[str] = None,
         sample_rate: int = 16000,
         language: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -31,8 +155,8 @@ class STTService:
         Transcribe audio data to text.
         
         Args:
-            audio_data: Raw audio bytes
-            format: Audio format (pcm, wav, mp3, etc.)
+            audio_data: Raw audio bytes, or 16 kHz mono float32 PCM samples
+            format: Audio format (pcm, wav, mp3, etc.); None detects it from the data
             sample_rate: Audio sample rate
             language: Language code (optional)
             
@@ -59,7 +183,7 @@ class STTService:
     async def transcribe_stream(
         self, 
         audio_chunks: List[bytes],
-        format: str = "pcm",
+        format: Optional[str] = None,
         sample_rate: int = 16000,
         language: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -91,41 +215,24 @@ class STTService:
     
     async def _transcribe_whisper(
         self, 
-        audio_data: bytes, 
-        format: str,
+        audio_data: Union[bytes, np.ndarray], 
+        format: Optional[str],
         sample_rate: int,
         language: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Transcribe using OpenAI Whisper."""
+        """Transcribe using Whisper (faster-whisper)."""
         try:
             # Ensure model is loaded
             await self._ensure_whisper_model()
             
-            # Save audio to temporary file
-            with tempfile.NamedTemporaryFile(suffix=f".{format}", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
+            language = language or self.whisper_language
             
-            try:
-                # Run transcription in thread pool
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(
-                    None,
-                    lambda: self.whisper_model.transcribe(temp_file_path, language=language or self.whisper_language)
-                )
-                
-                return {
-                    "text": result["text"].strip(),
-                    "confidence": result.get("confidence", 0.0),
-                    "language": result.get("language", language or "en"),
-                    "segments": result.get("segments", []),
-                    "provider": "whisper"
-                }
-                
-            finally:
-                # Clean up temporary file
-                import os
-                os.unlink(temp_file_path)
+            # Decode in memory where possible; anything else is handed to
+            # faster-whisper as a file object and decoded there
+            pcm = self._decode_audio(audio_data, format, sample_rate)
+            audio = pcm if pcm is not None else io.BytesIO(audio_data)
+            
+            return await run_inference(self._run_whisper, audio, language)
                 
         except Exception as e:
             print(f"Whisper transcription error: {e}")
@@ -137,10 +244,65 @@ class STTService:
                 "provider": "whisper"
             }
     
+    def _decode_audio(
+        self,
+        audio_data: Union[bytes, np.ndarray],
+        format: Optional[str],
+        sample_rate: int
+    ) -> Optional[np.ndarray]:
+        """
+        Decode audio to 16 kHz mono float32 PCM without touching disk.
+        
+        Bytes are only read as raw samples when the caller says "pcm"; any
+        other or unknown format is sniffed from its header. Returns None for
+        containers soundfile can't read (e.g. m4a, webm); faster-whisper
+        decodes those itself.
+        """
+        # Already-decoded PCM goes straight to the model
+        if isinstance(audio_data, np.ndarray):
+            return audio_data
+        
+        if format == "pcm":
+            # Raw 16-bit little-endian samples (a trailing odd byte is dropped)
+            pcm = np.frombuffer(audio_data, dtype=np.int16, count=len(audio_data) // 2).astype(np.float32) / 32768.0
+            return _resample(pcm, sample_rate)
+        
+        if soundfile is None:
+            return None
+        try:
+            pcm, file_rate = soundfile.read(io.BytesIO(audio_data), dtype="float32", always_2d=False)
+        except Exception:
+            return None
+        if pcm.ndim > 1:
+            pcm = pcm.mean(axis=1)
+        return _resample(pcm, file_rate)
+    
+    def _run_whisper(self, audio: Union[np.ndarray, io.BytesIO], language: str) -> Dict[str, Any]:
+        """Transcribe with faster-whisper (blocking; run in a worker thread)."""
+        segments, info = self.whisper_model.transcribe(
+            audio,
+            language=language,
+            beam_size=1,
+            vad_filter=True  # Skip silence
+        )
+        # Segments are produced lazily as decoding runs
+        segments = list(segments)
+        
+        return {
+            "text": "".join(segment.text for segment in segments).strip(),
+            "confidence": float(np.exp(np.mean([segment.avg_logprob for segment in segments]))) if segments else 0.0,
+            "language": info.language or language,
+            "segments": [
+                {"id": segment.id, "start": segment.start, "end": segment.end, "text": segment.text}
+                for segment in segments
+            ],
+            "provider": "whisper"
+        }
+    
     async def _transcribe_gcp(
         self, 
         audio_data: bytes, 
-        format: str,
+        format: Optional[str],
         sample_rate: int,
         language: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -158,12 +320,10 @@ class STTService:
     async def _ensure_whisper_model(self):
         """Ensure Whisper model is loaded."""
         if self.whisper_model is None:
-            # Load model in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            self.whisper_model = await loop.run_in_executor(
-                None,
-                whisper.load_model,
-                self.whisper_model_size
+            # Load model in thread pool to avoid blocking.
+            # CTranslate2 INT8 weights: same model, less memory, faster CPU inference
+            self.whisper_model = await run_inference(
+                partial(WhisperModel, self.whisper_model_size, device="auto", compute_type="int8")
             )
     
     async def get_supported_formats(self) -> List[str]:
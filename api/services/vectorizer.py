@@ -1,10 +1,13 @@
 """Vector embedding service using sentence-transformers."""
 
 import asyncio
-from typing import List, Optional
+from functools import partial
+from typing import List, Optional, Tuple
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from api.services.cache import cache_service
+from api.services.chunking import chunk_spans, chunk_text  # noqa: F401  (re-exported)
+from api.services.runtime import N_INFERENCE, run_inference
 from api.utils.config import settings
 
 
@@ -17,22 +20,29 @@ class VectorizerService:
         self.embed_dims = settings.embed_dims
         self.batch_size = settings.embed_batch_size
         
-    async def get_embedding(self, text: str) -> Optional[List[float]]:
-        """Get embedding for a single text string."""
+        # Concurrent single-text requests are coalesced into one encode call:
+        # the consumer waits up to batch_window seconds for a batch to fill
+        self.max_batch = 32
+        self.batch_window = 0.005
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        
+    async def get_embedding(self, text: str) -> Optional[np.ndarray]:
+        """Get the unit-length float32 embedding for a single text string."""
         # Check cache first
         cached_embedding = await cache_service.get_embedding_cache(text)
-        if cached_embedding:
+        if cached_embedding is not None:
             return cached_embedding
         
         # Generate new embedding
-        embedding = await self._generate_embedding(text)
-        if embedding:
+        embedding = await self._submit(text)
+        if embedding is not None:
             # Cache the embedding
             await cache_service.set_embedding_cache(text, embedding)
         
         return embedding
     
-    async def get_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+    async def get_embeddings_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
         """Get embeddings for a batch of texts."""
         if not texts:
             return []
@@ -42,9 +52,9 @@ class VectorizerService:
         uncached_texts = []
         uncached_indices = []
         
-        for i, text in enumerate(texts):
-            cached = await cache_service.get_embedding_cache(text)
-            if cached:
+        cached_embeddings = await cache_service.get_embedding_cache_many(texts)
+        for i, (text, cached) in enumerate(zip(texts, cached_embeddings)):
+            if cached is not None:
                 embeddings.append(cached)
             else:
                 embeddings.append(None)
@@ -55,59 +65,71 @@ class VectorizerService:
         if uncached_texts:
             new_embeddings = await self._generate_embeddings_batch(uncached_texts)
             
-            # Cache new embeddings and update results
+            # Update results and cache new embeddings in one round trip
+            to_cache = {}
             for i, (text, embedding) in enumerate(zip(uncached_texts, new_embeddings)):
-                if embedding:
-                    await cache_service.set_embedding_cache(text, embedding)
+                if embedding is not None:
+                    to_cache[text] = embedding
                     embeddings[uncached_indices[i]] = embedding
+            await cache_service.set_embedding_cache_many(to_cache)
         
         return embeddings
     
-    async def _generate_embedding(self, text: str) -> Optional[List[float]]:
-        """Generate embedding for a single text string."""
-        try:
-            # Ensure model is loaded
-            await self._ensure_model_loaded()
-            
-            # Run embedding generation in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            embedding = await loop.run_in_executor(
-                None, 
-                self.model.encode, 
-                text
-            )
-            
-            # Convert to list and normalize
-            embedding_list = embedding.tolist()
-            return self._normalize_embedding(embedding_list)
+    async def _submit(self, text: str) -> Optional[np.ndarray]:
+        """Queue a text for the next micro-batch and wait for its embedding."""
+        if self._batch_task is None or self._batch_task.done():
+            self._queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._batch_worker())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _batch_worker(self):
+        """Drain queued texts into batches and embed each batch with one encode call."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
             
-        except Exception as e:
-            print(f"Error generating embedding: {e}")
-            return None
+            embeddings = await self._generate_embeddings_batch([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
     
-    async def _generate_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+    async def _generate_embeddings_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
         """Generate embeddings for a batch of texts."""
         try:
             # Ensure model is loaded
             await self._ensure_model_loaded()
             
-            # Run batch embedding generation in thread pool
-            loop = asyncio.get_event_loop()
-            embeddings = await loop.run_in_executor(
-                None,
-                self.model.encode,
-                texts,
-                batch_size=self.batch_size
-            )
-            
-            # Convert to list format and normalize
-            results = []
-            for embedding in embeddings:
-                embedding_list = embedding.tolist()
-                normalized = self._normalize_embedding(embedding_list)
-                results.append(normalized)
+            # Each inference call runs on one torch thread (see runtime) and
+            # releases the GIL, so a large batch is split into one shard per
+            # inference slot to use every core; small batches stay one call
+            shard_size = max(self.batch_size, -(-len(texts) // N_INFERENCE))
+            shards = await asyncio.gather(*(
+                run_inference(
+                    partial(
+                        self.model.encode,
+                        texts[i:i + shard_size],
+                        batch_size=self.batch_size,
+                        convert_to_numpy=True,
+                        normalize_embeddings=True
+                    )
+                )
+                for i in range(0, len(texts), shard_size)
+            ))
+            embeddings = shards[0] if len(shards) == 1 else np.concatenate(shards)
             
-            return results
+            # Rows of one contiguous float32 matrix; no per-element Python floats
+            return list(embeddings.astype(np.float32, copy=False))
             
         except Exception as e:
             print(f"Error generating batch embeddings: {e}")
@@ -117,21 +139,7 @@ class VectorizerService:
         """Ensure the embedding model is loaded."""
         if self.model is None:
             # Load model in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            self.model = await loop.run_in_executor(
-                None,
-                SentenceTransformer,
-                self.model_name
-            )
-    
-    def _normalize_embedding(self, embedding: List[float]) -> List[float]:
-        """Normalize embedding vector to unit length."""
-        embedding_array = np.array(embedding)
-        norm = np.linalg.norm(embedding_array)
-        if norm > 0:
-            normalized = embedding_array / norm
-            return normalized.tolist()
-        return embedding
+            self.model = await run_inference(SentenceTransformer, self.model_name)
     
     async def get_model_info(self) -> dict:
         """Get information about the loaded embedding model."""
@@ -147,6 +155,9 @@ class VectorizerService:
     
     async def close(self):
         """Clean up resources."""
+        if self._batch_task:
+            self._batch_task.cancel()
+            self._batch_task = None
         if self.model:
             # Clear model from memory
             del self.model
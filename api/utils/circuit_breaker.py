@@ -0,0 +1,114 @@
+"""Asyncio-native circuit breaker for guarding calls to external services."""
+
+import time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Iterable, Optional, Tuple, Type
+
+
+class BreakerState(str, Enum):
+    """Circuit breaker states."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitBreakerError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class AsyncCircuitBreaker:
+    """
+    Circuit breaker for coroutines.
+
+    Closed: calls pass through; consecutive failures are counted and the
+    circuit opens after fail_max of them. Open: calls are rejected until
+    reset_timeout has elapsed, then a single probe call is let through
+    (half-open). A successful probe closes the circuit, a failed one
+    reopens it.
+
+    State only changes between awaits on the event loop thread, so no
+    lock is needed.
+    """
+
+    def __init__(
+        self,
+        fail_max: int = 5,
+        reset_timeout: float = 60,
+        exclude: Optional[Iterable[Type[BaseException]]] = None
+    ):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.exclude: Tuple[Type[BaseException], ...] = tuple(exclude or ())
+
+        self.state = BreakerState.CLOSED
+        self.fail_counter = 0
+        self.opened_at = 0.0
+        self.last_failure_time: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def current_state(self) -> str:
+        """Current state name, e.g. for health checks."""
+        if self.state is BreakerState.OPEN and self._reset_due():
+            return BreakerState.HALF_OPEN.value
+        return self.state.value
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Await func(*args, **kwargs) according to the breaker state."""
+        if self.state is BreakerState.CLOSED:
+            # Fast path: no bookkeeping beyond the outcome
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                self._on_failure(e)
+                raise
+            self.fail_counter = 0
+            return result
+
+        if self.state is BreakerState.OPEN:
+            if not self._reset_due():
+                raise CircuitBreakerError("Circuit breaker is open")
+            self.state = BreakerState.HALF_OPEN
+
+        # Half-open: only one probe at a time
+        if self._probe_in_flight:
+            raise CircuitBreakerError("Circuit breaker is half-open; probe in progress")
+        self._probe_in_flight = True
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if self._is_excluded(e):
+                self._close()
+            else:
+                self._open()
+            raise
+        finally:
+            self._probe_in_flight = False
+        self._close()
+        return result
+
+    def _reset_due(self) -> bool:
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def _is_excluded(self, error: Exception) -> bool:
+        return isinstance(error, self.exclude)
+
+    def _on_failure(self, error: Exception):
+        """Count a failure in the closed state, tripping the breaker at fail_max."""
+        if self._is_excluded(error):
+            # Excluded errors (e.g. auth, rate limits) say nothing about service health
+            self.fail_counter = 0
+            return
+        self.fail_counter += 1
+        self.last_failure_time = time.time()
+        if self.fail_counter >= self.fail_max:
+            self._open()
+
+    def _open(self):
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+        self.last_failure_time = time.time()
+
+    def _close(self):
+        self.state = BreakerState.CLOSED
+        self.fail_counter = 0
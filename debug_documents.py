@@ -3,31 +3,48 @@
 Debug script to troubleshoot document processing and search issues.
 """
 
-import requests
+import asyncio
+import httpx
 import json
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 class DocumentDebugger:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
-        self.session = requests.Session()
+        # One pooled client; concurrent requests share its connection(s)
+        self.client = httpx.AsyncClient(base_url=base_url, http2=HTTP2_AVAILABLE, timeout=30.0)
         self.token = None
+    
+    async def close(self):
+        """Close the HTTP client."""
+        await self.client.aclose()
         
-    def login(self, email: str, password: str) -> bool:
+    async def login(self, email: str, password: str) -> bool:
         """Login and get token."""
         login_data = {"email": email, "password": password}
-        response = self.session.post(f"{self.base_url}/auth/login", json=login_data)
+        response = await self.client.post("/auth/login", json=login_data)
         
         if response.status_code == 200:
             self.token = response.json()["access_token"]
-            self.session.headers.update({"Authorization": f"Bearer {self.token}"})
+            self.client.headers["Authorization"] = f"Bearer {self.token}"
             print(f"✅ Logged in as {email}")
             return True
         else:
             print(f"❌ Login failed: {response.status_code} - {response.text}")
             return False
     
-    def upload_test_document(self, title: str, text: str, source: str = "internal") -> bool:
+    async def upload_test_document(self, title: str, text: str, source: str = "internal") -> bool:
         """Upload a test document."""
         doc_data = {
             "title": title,
@@ -36,7 +53,7 @@ class DocumentDebugger:
             "metadata": {"test": True, "timestamp": time.time()}
         }
         
-        response = self.session.post(f"{self.base_url}/corpus/doc", json=doc_data)
+        response = await self.client.post("/corpus/doc", json=doc_data)
         
         if response.status_code in [200, 201]:
             doc_id = response.json()["id"]
@@ -46,12 +63,15 @@ class DocumentDebugger:
             print(f"❌ Document upload failed: {response.status_code} - {response.text}")
             return False
     
-    def search_documents(self, query: str) -> bool:
+    async def search_documents(self, query: str) -> bool:
         """Search for documents."""
         search_data = {"query": query, "k": 10}
         
-        response = self.session.post(f"{self.base_url}/corpus/search", json=search_data)
+        response = await self.client.post("/corpus/search", json=search_data)
         
+        # Output is printed only once the response is in, so concurrent
+        # searches don't interleave their lines
+        print(f"\nSearching for: '{query}'")
         if response.status_code == 200:
             results = response.json()["results"]
             print(f"✅ Search successful for '{query}': {len(results)} results")
@@ -66,12 +86,13 @@ class DocumentDebugger:
             print(f"❌ Search failed: {response.status_code} - {response.text}")
             return False
     
-    def list_documents(self) -> bool:
+    async def list_documents(self) -> bool:
         """List all documents."""
-        response = self.session.get(f"{self.base_url}/corpus/docs")
+        # Only the first rows and a text preview are printed, so that is all we ask for
+        response = await self.client.get("/corpus/docs", params={"limit": 20, "text_chars": 50})
         
         if response.status_code == 200:
-            docs = response.json()
+            docs = orjson.loads(response.content) if orjson else response.json()
             print(f"✅ Document list: {len(docs)} documents")
             
             for doc in docs:
@@ -83,12 +104,13 @@ class DocumentDebugger:
             print(f"❌ Document list failed: {response.status_code} - {response.text}")
             return False
     
-    def test_chat(self, question: str) -> bool:
+    async def test_chat(self, question: str) -> bool:
         """Test chat functionality."""
         chat_data = {"text": question}
         
-        response = self.session.post(f"{self.base_url}/chat/", json=chat_data)
+        response = await self.client.post("/chat/", json=chat_data)
         
+        print(f"\nAsking: '{question}'")
         if response.status_code == 200:
             result = response.json()
             print(f"✅ Chat successful")
@@ -100,14 +122,13 @@ class DocumentDebugger:
             print(f"❌ Chat failed: {response.status_code} - {response.text}")
             return False
 
-def main():
-    debugger = DocumentDebugger()
+async def run(debugger: "DocumentDebugger"):
     
     print("🔍 Document Processing Debug Tool")
     print("=" * 50)
     
     # Test with a known user (from test_api.py)
-    if not debugger.login("test@example.com", "testpassword123"):
+    if not await debugger.login("test@example.com", "testpassword123"):
         print("❌ Cannot proceed without login")
         return
     
@@ -115,7 +136,7 @@ def main():
     
     # List existing documents
     print("\n1. Listing existing documents:")
-    debugger.list_documents()
+    await debugger.list_documents()
     
     # Upload a substantial test document
     print("\n2. Uploading substantial test document:")
@@ -124,15 +145,15 @@ def main():
         "text": """This comprehensive company policy handbook contains detailed information about our organization's policies and procedures. It covers employee conduct guidelines, workplace safety protocols, data security policies, company benefits, remote work policies, expense reimbursement procedures, professional development opportunities, and much more. This document is confidential and contains proprietary information specific to our company. It should not be shared with external parties or competitors. The handbook is regularly updated to reflect current best practices and legal requirements.""",
         "source": "internal"
     }
-    debugger.upload_test_document(**test_doc)
+    await debugger.upload_test_document(**test_doc)
     
     # Wait a moment for processing
     print("\n⏳ Waiting for document processing...")
-    time.sleep(2)
+    await asyncio.sleep(2)
     
     # List documents again
     print("\n3. Listing documents after upload:")
-    debugger.list_documents()
+    await debugger.list_documents()
     
     # Test search with specific terms
     print("\n4. Testing search functionality:")
@@ -143,9 +164,8 @@ def main():
         "data security policies"
     ]
     
-    for query in search_queries:
-        print(f"\nSearching for: '{query}'")
-        debugger.search_documents(query)
+    # Independent queries: issue them together
+    await asyncio.gather(*[debugger.search_documents(q) for q in search_queries])
     
     # Test chat functionality
     print("\n5. Testing chat functionality:")
@@ -155,9 +175,14 @@ def main():
         "What safety protocols are mentioned?"
     ]
     
-    for question in chat_questions:
-        print(f"\nAsking: '{question}'")
-        debugger.test_chat(question)
+    await asyncio.gather(*[debugger.test_chat(q) for q in chat_questions])
+
+async def main():
+    debugger = DocumentDebugger()
+    try:
+        await run(debugger)
+    finally:
+        await debugger.close()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
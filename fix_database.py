@@ -10,7 +10,7 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'api'))
 
 from api.models.db import engine, drop_tables, create_tables
-from api.models.entities import SQLModel
+import api.models.entities  # noqa: F401  (registers the tables on SQLModel.metadata)
 
 def fix_database():
     """Drop and recreate all tables with proper schema."""
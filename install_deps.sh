@@ -95,13 +95,13 @@ pip install sqlmodel sqlalchemy python-dotenv
 pip install redis aioredis
 pip install httpx openai
 pip install sentence-transformers
-pip install openai-whisper
+pip install faster-whisper
 pip install opentelemetry-api opentelemetry-sdk
 pip install prometheus-client
-pip install pybreaker slowapi
+pip install slowapi
 pip install pytest pytest-asyncio
 pip install ruff mypy
-pip install pydantic pydantic-settings python-dateutil
+pip install pydantic msgspec python-dateutil
 
 # Try to install psycopg2-binary (PostgreSQL adapter)
 print_status "Installing PostgreSQL adapter..."
@@ -9,38 +9,185 @@ for testing and demonstration purposes.
 import os
 import sys
 import json
+import mmap
 import asyncio
 import httpx
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, Iterator, List, Dict, Any, Optional, Tuple
 
 # Add the project root to the Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from api.models.entities import Doc
-from api.models.db import get_db_session
-from api.services.vectorizer import vectorizer_service
+# The database and embedding stack (SQLModel, torch) is only imported by the
+# direct-to-DB path, so the API path and --help start quickly
+if TYPE_CHECKING:
+    from api.models.entities import Doc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _json_body(data: Any) -> bytes:
+    """Encode a request body straight to bytes."""
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+def _load_json_file(file_path: Path) -> Any:
+    """Parse a JSON file."""
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+ParsedFile = Tuple[str, str, Dict[str, Any], Optional[str]]
+
+
+def _parse_json_file(file_path: Path, file_size: int) -> ParsedFile:
+    """A JSON file containing document data."""
+    data = _load_json_file(file_path)
+    
+    # Validate required fields
+    required_fields = ["title", "text"]
+    for field in required_fields:
+        if field not in data:
+            raise ValueError(f"Missing required field: {field}")
+    
+    return data["title"], data["text"], data.get("metadata", {}), data.get("uri")
+
+
+def _parse_text_file(file_path: Path, file_size: int) -> ParsedFile:
+    """A plain text or markdown file."""
+    # The text is decoded straight from a read-only mapping (empty files
+    # can't be mapped)
+    if file_size:
+        with file_path.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            content = str(mm, 'utf-8')
+    else:
+        content = ""
+    
+    # Extract title from filename or first line
+    title = file_path.stem.replace('_', ' ').title()
+    metadata = {
+        "file_type": file_path.suffix,
+        "file_size": file_size,
+        "ingested_by": "corpus_ingester"
+    }
+    return title, content, metadata, None
+
+
+# Parser per lowercased file extension
+FILE_PARSERS = {
+    ".json": _parse_json_file,
+    ".txt": _parse_text_file,
+    ".md": _parse_text_file,
+}
+
+
+@lru_cache(maxsize=4096)
+def _load_file(path: str, mtime_ns: int, file_size: int) -> ParsedFile:
+    """
+    Parse a corpus file into (title, text, metadata, uri).
+    
+    Cached per (path, mtime, size), so both ingestion paths share one parse
+    of an unchanged file and an edited file is read again. The returned
+    metadata dict is shared; don't mutate it.
+    """
+    file_path = Path(path)
+    file_extension = file_path.suffix.lower()
+    parse = FILE_PARSERS.get(file_extension)
+    if parse is None:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+    return parse(file_path, file_size)
+
+
+log = logging.getLogger("ingest")
+
+# Without --verbose, progress is logged once per this many documents
+PROGRESS_EVERY = 100
+
+# API endpoints, relative to the client's base URL
+DOC_PATH = "/corpus/doc"
+BATCH_PATH = "/corpus/docs:batch"
+
+# Documents per batch request, and requests in flight at once
+BATCH_SIZE = 32
+MAX_CONCURRENCY = 16
+
+# Documents inserted per transaction when writing straight to the database
+DB_BATCH_SIZE = 500
+
+
+def iter_files(root) -> Iterator[os.DirEntry]:
+    """Recursively yield the regular files under root (symlinked dirs are not followed)."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path)
+            elif entry.is_file():
+                yield entry
+
+
+class BatchEndpointUnavailable(Exception):
+    """The API has no bulk document endpoint."""
 
 
 class CorpusIngester:
     """Handles ingestion of policy documents into the corpus."""
     
-    def __init__(self, api_base_url: str = "http://localhost:8000", api_token: str = None):
+    def __init__(self, api_base_url: str = "http://localhost:8000", api_token: str = None, verbose: bool = False):
         self.api_base_url = api_base_url
         self.api_token = api_token
-        self.client = httpx.AsyncClient(timeout=30.0)
-        
+        self.verbose = verbose
+        self.ingested = 0
+        # One pooled client for the whole run: uploads are multiplexed over a
+        # single HTTP/2 connection when h2 is installed, and connection errors
+        # are retried. Pool options live on the transport since we supply it.
+        # Request bodies are always pre-encoded JSON (see _json_body)
+        transport = httpx.AsyncHTTPTransport(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+            retries=2
+        )
+        headers = {"Content-Type": "application/json"}
         if api_token:
-            self.client.headers.update({"Authorization": f"Bearer {api_token}"})
+            headers["Authorization"] = f"Bearer {api_token}"
+        # Requests use the relative paths below; httpx merges them onto the
+        # already-parsed base URL
+        self.client = httpx.AsyncClient(
+            base_url=api_base_url,
+            timeout=30.0,
+            transport=transport,
+            headers=headers
+        )
     
     async def close(self):
         """Close the HTTP client."""
-        await self.client.acquire()
+        await self.client.aclose()
     
     async def ingest_directory(self, directory_path: str, org_id: int = 1) -> List[Dict[str, Any]]:
         """
         Ingest all documents from a directory.
         
+        The directory walk feeds a queue drained by MAX_CONCURRENCY workers, so
+        enumeration, file reads and uploads overlap. Each worker sends its
+        documents to the batch endpoint BATCH_SIZE at a time; servers without
+        that endpoint get one request per document.
+        
         Args:
             directory_path: Path to directory containing documents
             org_id: Organization ID to associate documents with
@@ -53,183 +200,267 @@ class CorpusIngester:
             raise FileNotFoundError(f"Directory not found: {directory_path}")
         
         results = []
+        queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_CONCURRENCY * BATCH_SIZE)
+        batch_supported = True
         
-        # Process different file types
-        for file_path in directory.rglob("*"):
-            if file_path.is_file():
+        async def send(batch: List[Tuple[Path, Dict[str, Any]]]):
+            """Ingest a batch; never raises, so a worker can't die and leave the bounded queue full."""
+            nonlocal batch_supported
+            try:
+                if batch_supported:
+                    try:
+                        results.extend(await self._ingest_batch(batch))
+                        return
+                    except BatchEndpointUnavailable:
+                        batch_supported = False
+                for file_path, payload in batch:
+                    results.append(await self._ingest_file(file_path, payload))
+            except Exception as e:
+                # e.g. a malformed batch response; nothing of this batch was recorded yet
+                results.extend(self._failure(file_path, e) for file_path, _ in batch)
+        
+        async def worker():
+            batch = []
+            while True:
+                entry = await queue.get()
+                if entry is None:
+                    break
+                file_path = Path(entry.path)
                 try:
-                    result = await self._ingest_file(file_path, org_id)
-                    results.append(result)
-                    print(f"✓ Ingested: {file_path.name}")
+                    # DirEntry caches its stat, so size and mtime cost no extra syscall
+                    batch.append((file_path, self._document_payload(file_path, org_id, entry.stat())))
                 except Exception as e:
-                    error_result = {
-                        "file": str(file_path),
-                        "success": False,
-                        "error": str(e)
-                    }
-                    results.append(error_result)
-                    print(f"✗ Failed: {file_path.name} - {e}")
+                    results.append(self._failure(file_path, e))
+                if len(batch) >= BATCH_SIZE:
+                    await send(batch)
+                    batch = []
+            if batch:
+                await send(batch)
+        
+        workers = [asyncio.create_task(worker()) for _ in range(MAX_CONCURRENCY)]
+        try:
+            for entry in iter_files(directory):
+                await queue.put(entry)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
         
         return results
     
-    async def _ingest_file(self, file_path: Path, org_id: int) -> Dict[str, Any]:
-        """Ingest a single file."""
-        file_extension = file_path.suffix.lower()
-        
-        if file_extension == ".json":
-            return await self._ingest_json_file(file_path, org_id)
-        elif file_extension in [".txt", ".md"]:
-            return await self._ingest_text_file(file_path, org_id)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+    def _ingested(self, file_path: Path, destination: str = ""):
+        """Report progress: every file when verbose, else every PROGRESS_EVERY."""
+        self.ingested += 1
+        if self.verbose:
+            log.info(f"✓ Ingested{destination}: {file_path.name}")
+        elif self.ingested % PROGRESS_EVERY == 0:
+            log.info(f"✓ Ingested {self.ingested} documents")
     
-    async def _ingest_json_file(self, file_path: Path, org_id: int) -> Dict[str, Any]:
-        """Ingest a JSON file containing document data."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Validate required fields
-        required_fields = ["title", "text"]
-        for field in required_fields:
-            if field not in data:
-                raise ValueError(f"Missing required field: {field}")
-        
-        # Prepare document data
-        document_data = {
-            "source": str(file_path),
-            "uri": data.get("uri"),
-            "title": data["title"],
-            "text": data["text"],
-            "metadata": data.get("metadata", {}),
-            "org_id": org_id
+    def _failure(self, file_path: Path, error: Exception) -> Dict[str, Any]:
+        """Result entry for a file that could not be ingested."""
+        log.warning(f"✗ Failed: {file_path.name} - {error}")
+        return {
+            "file": str(file_path),
+            "success": False,
+            "error": str(error)
         }
+    
+    async def _ingest_batch(self, batch: List[Tuple[Path, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Create several documents with one request to the batch endpoint."""
+        try:
+            response = await self.client.post(
+                BATCH_PATH,
+                content=_json_body({"docs": [payload for _, payload in batch]})
+            )
+        except httpx.HTTPError as e:
+            # Connection failures and timeouts fail just this batch's files
+            return [self._failure(file_path, e) for file_path, _ in batch]
         
-        # Ingest via API
-        response = await self.client.post(
-            f"{self.api_base_url}/corpus/doc",
-            json=document_data
-        )
+        if response.status_code in (404, 405):
+            raise BatchEndpointUnavailable()
+        if response.status_code != 200:
+            error = Exception(f"API error: {response.status_code} - {response.text}")
+            return [self._failure(file_path, error) for file_path, _ in batch]
         
-        if response.status_code == 200:
-            return {
+        results = []
+        for (file_path, _), document in zip(batch, response.json()):
+            self._ingested(file_path)
+            results.append({
                 "file": str(file_path),
                 "success": True,
-                "document_id": response.json()["data"]["id"]
-            }
-        else:
-            raise Exception(f"API error: {response.status_code} - {response.text}")
+                "document_id": document["id"]
+            })
+        return results
     
-    async def _ingest_text_file(self, file_path: Path, org_id: int) -> Dict[str, Any]:
-        """Ingest a plain text or markdown file."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+    async def _ingest_file(self, file_path: Path, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a single document through the API."""
+        try:
+            response = await self.client.post(
+                DOC_PATH,
+                content=_json_body(payload)
+            )
+            if response.status_code != 200:
+                raise Exception(f"API error: {response.status_code} - {response.text}")
+        except Exception as e:
+            return self._failure(file_path, e)
         
-        # Extract title from filename or first line
-        title = file_path.stem.replace('_', ' ').title()
+        self._ingested(file_path)
+        return {
+            "file": str(file_path),
+            "success": True,
+            "document_id": response.json()["id"]
+        }
+    
+    def _document_payload(self, file_path: Path, org_id: int, stat: Optional[os.stat_result] = None) -> Dict[str, Any]:
+        """Build the document-creation payload for a file."""
+        if stat is None:
+            stat = file_path.stat()
+        title, text, metadata, uri = _load_file(str(file_path), stat.st_mtime_ns, stat.st_size)
         
-        # Prepare document data
-        document_data = {
+        return {
             "source": str(file_path),
+            "uri": uri,
             "title": title,
-            "text": content,
-            "metadata": {
-                "file_type": file_path.suffix,
-                "file_size": len(content),
-                "ingested_by": "corpus_ingester"
-            },
+            "text": text,
+            "metadata": metadata,
             "org_id": org_id
         }
-        
-        # Ingest via API
-        response = await self.client.post(
-            f"{self.api_base_url}/corpus/doc",
-            json=document_data
-        )
-        
-        if response.status_code == 200:
-            return {
-                "file": str(file_path),
-                "success": True,
-                "document_id": response.json()["data"]["id"]
-            }
-        else:
-            raise Exception(f"API error: {response.status_code} - {response.text}")
     
     async def ingest_direct_to_db(self, directory_path: str, org_id: int = 1) -> List[Dict[str, Any]]:
         """
         Ingest documents directly to database (bypassing API).
         
         This is useful for bulk ingestion or when the API is not available.
+        Each batch of documents is embedded with batched forward passes before
+        its commit; if embedding fails the documents are still stored and the
+        worker embeds them later.
         """
         directory = Path(directory_path)
         if not directory.exists():
             raise FileNotFoundError(f"Directory not found: {directory_path}")
         
+        from api.models.db import get_db_session
+        
         results = []
+        pending: List[Tuple[Path, "Doc"]] = []
         db = get_db_session()
         
+        async def flush_batch():
+            """Insert and embed the pending documents with one commit; a failed batch is rolled back and reported per file."""
+            documents = [document for _, document in pending]
+            try:
+                db.add_all(documents)
+                db.flush()  # Assigns ids (INSERT ... RETURNING)
+                await self._embed_documents(db, documents)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                results.extend(self._failure(file_path, e) for file_path, _ in pending)
+            else:
+                for file_path, document in pending:
+                    results.append({
+                        "file": str(file_path),
+                        "success": True,
+                        "document_id": document.id
+                    })
+                    self._ingested(file_path, " to DB")
+            finally:
+                pending.clear()
+        
         try:
-            for file_path in directory.rglob("*"):
-                if file_path.is_file():
-                    try:
-                        result = await self._ingest_file_to_db(file_path, org_id, db)
-                        results.append(result)
-                        print(f"✓ Ingested to DB: {file_path.name}")
-                    except Exception as e:
-                        error_result = {
-                            "file": str(file_path),
-                            "success": False,
-                            "error": str(e)
-                        }
-                        results.append(error_result)
-                        print(f"✗ Failed: {file_path.name} - {e}")
+            for entry in iter_files(directory):
+                file_path = Path(entry.path)
+                try:
+                    pending.append((file_path, self._document_for_db(file_path, org_id, entry.stat())))
+                except Exception as e:
+                    results.append(self._failure(file_path, e))
+                
+                if len(pending) >= DB_BATCH_SIZE:
+                    await flush_batch()
+            
+            if pending:
+                await flush_batch()
         finally:
             db.close()
         
         return results
     
-    async def _ingest_file_to_db(self, file_path: Path, org_id: int, db: Any) -> Dict[str, Any]:
-        """Ingest a file directly to the database."""
-        file_extension = file_path.suffix.lower()
+    async def _embed_documents(self, db, documents: List["Doc"]):
+        """Chunk and embed freshly inserted documents, inserting their Embedding rows."""
+        from sqlalchemy import insert
+        from api.models.entities import Embedding
+        from api.services.search import search_service
+        from api.services.vectorizer import chunk_spans, vectorizer_service
+        from api.utils.config import settings
         
-        if file_extension == ".json":
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            title = data["title"]
-            text = data["text"]
-            metadata = data.get("metadata", {})
-        elif file_extension in [".txt", ".md"]:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            title = file_path.stem.replace('_', ' ').title()
-            metadata = {
-                "file_type": file_path.suffix,
-                "file_size": len(text),
-                "ingested_by": "corpus_ingester"
-            }
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+        chunks = []
+        for document in documents:
+            for start, end in chunk_spans(document.text, chunk_size=800, overlap=100):
+                chunks.append((document, start, end, document.text[start:end]))
+        if not chunks:
+            return
         
-        # Create document
-        document = Doc(
-            org_id=org_id,
-            source=str(file_path),
-            title=title,
-            text=text,
-            metadata=metadata
-        )
+        try:
+            # One call for the whole batch; the model encodes it embed_batch_size at a time
+            vectors = await vectorizer_service.get_embeddings_batch([chunk for *_, chunk in chunks])
+        except Exception as e:
+            log.warning(f"⚠ Embedding skipped, the worker will pick these documents up: {e}")
+            return
         
-        db.add(document)
-        db.commit()
-        db.refresh(document)
+        # Plain rows through one Core INSERT; no ORM objects or identity map
+        created_at = datetime.now(timezone.utc)
+        rows = []
+        embedded = {}
+        for (document, start, end, chunk), vector in zip(chunks, vectors):
+            if vector is None:
+                continue
+            rows.append({
+                "doc_id": document.id,
+                "chunk_text": chunk,
+                "chunk_start": start,
+                "chunk_end": end,
+                "vector": vector,
+                "model": settings.embed_model,
+                "created_at": created_at
+            })
+            embedded[document.id] = document.org_id
+        if rows:
+            db.execute(insert(Embedding), rows)
         
-        return {
-            "file": str(file_path),
-            "success": True,
-            "document_id": document.id
-        }
+        # Cached searches near the new content may now be stale
+        for doc_id, org_id in embedded.items():
+            search_service.invalidate_semantic_cache_for_doc(db, doc_id, org_id)
+    
+    def _document_for_db(self, file_path: Path, org_id: int, stat: Optional[os.stat_result] = None) -> "Doc":
+        """Build a Doc row for a file."""
+        from api.models.entities import Doc
+        
+        payload = self._document_payload(file_path, org_id, stat)
+        return Doc(
+            org_id=org_id,
+            source=payload["source"],
+            uri=payload.get("uri"),
+            title=payload["title"],
+            text=payload["text"],
+            doc_metadata=_json_body(payload["metadata"] or {}).decode()
+        )
+
+
+def _start_logging() -> logging.handlers.QueueListener:
+    """
+    Route the ingest logger through a queue to a background thread writing
+    stderr, so terminal I/O never blocks the event loop.
+    """
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(records, stream)
+    listener.start()
+    return listener
 
 
 async def main():
@@ -242,6 +473,7 @@ async def main():
     parser.add_argument("--token", help="API authentication token")
     parser.add_argument("--org-id", type=int, default=1, help="Organization ID")
     parser.add_argument("--direct-db", action="store_true", help="Ingest directly to database")
+    parser.add_argument("--verbose", action="store_true", help="Log every ingested file")
     
     args = parser.parse_args()
     
@@ -250,8 +482,10 @@ async def main():
         print(f"Error: Directory '{args.directory}' does not exist")
         sys.exit(1)
     
+    listener = _start_logging()
+    
     # Create ingester
-    ingester = CorpusIngester(args.api_url, args.token)
+    ingester = CorpusIngester(args.api_url, args.token, verbose=args.verbose)
     
     try:
         if args.direct_db:
@@ -280,6 +514,7 @@ async def main():
         sys.exit(1)
     finally:
         await ingester.close()
+        listener.stop()  # Flushes queued records
 
 
 if __name__ == "__main__":
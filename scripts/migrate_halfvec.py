@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Migrate stored embeddings from vector(384) to halfvec(384) in place.
+
+Requires pgvector >= 0.7 in the database.
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from api.models.db import migrate_embeddings_to_halfvec
+
+
+if __name__ == "__main__":
+    print("Converting embedding.vector to halfvec and rebuilding the HNSW index...")
+    migrate_embeddings_to_halfvec()
+    print("Done.")
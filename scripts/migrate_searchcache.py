@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Add the k and mmr_lambda columns to an existing searchcache table in place.
+
+Entries cached before the migration never match a lookup and age out.
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from api.models.db import migrate_searchcache_params
+
+
+if __name__ == "__main__":
+    print("Adding k and mmr_lambda to searchcache...")
+    migrate_searchcache_params()
+    print("Done.")
@@ -0,0 +1,111 @@
+"""
+Shared HTTP client for the security test scripts.
+One AuthedClient per test user: a long-lived async client that carries the
+user's bearer token after signup, retries transient gateway errors and sends
+pre-encoded JSON bodies.
+"""
+
+import asyncio
+import httpx
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_response(response: httpx.Response):
+    """Decode a response body, with orjson when it is installed."""
+    return orjson.loads(response.content) if orjson else response.json()
+
+def json_body(data: Any) -> bytes:
+    """Encode a request body straight to bytes."""
+    return orjson.dumps(data) if orjson else json.dumps(data).encode()
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Transient gateway errors are retried with exponential backoff so a blip doesn't
+# force a full rerun (re-registering users and re-uploading documents)
+RETRY_STATUSES = {502, 503, 504}
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.2
+
+# Per-user connection pool; keep-alive matches the cap so no idle socket is
+# dropped and re-handshaked when concurrent tests and HTTP/1.1 fall-back overlap
+POOL_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+
+class _RetryTransport(httpx.AsyncHTTPTransport):
+    """HTTP transport that retries 502/503/504 responses, like urllib3's Retry."""
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(RETRY_TOTAL):
+            response = await super().handle_async_request(request)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            await response.aclose()
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        return await super().handle_async_request(request)
+
+class AuthedClient:
+    """A test user's client; with h2 installed its concurrent requests share one multiplexed socket."""
+
+    def __init__(self, base_url: str = "http://localhost:8000"):
+        # retries= on the transport covers failed connects; the subclass covers 5xx
+        transport = _RetryTransport(http2=HTTP2_AVAILABLE, limits=POOL_LIMITS, retries=RETRY_TOTAL)
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=30.0)
+        self.token: Optional[str] = None
+        self.org_id: Optional[int] = None
+
+    async def aclose(self):
+        """Close the HTTP client."""
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, data: Any = None, **kwargs) -> httpx.Response:
+        """Send a request; data is a JSON-able object or an already encoded body."""
+        if data is not None:
+            kwargs["content"] = data if isinstance(data, bytes) else json_body(data)
+            kwargs["headers"] = JSON_HEADERS
+        return await self.client.request(method, path, **kwargs)
+
+    async def signup(self, user_data: Dict[str, Any]) -> httpx.Response:
+        """Register a user; on success the client carries its token and knows its org id."""
+        response = await self.request("POST", "/auth/signup", user_data)
+        if response.status_code not in [200, 201]:
+            return response
+
+        # Signup already logs the user in
+        result = json_response(response)
+        self.token = result["access_token"]
+        self.client.headers["Authorization"] = f"Bearer {self.token}"
+        self.org_id = result.get("organization_id")
+
+        # Signup reports the org id; older servers need a separate lookup
+        if self.org_id is None:
+            orgs_response = await self.request("GET", "/admin/organizations")
+            if orgs_response.status_code == 200:
+                orgs = json_response(orgs_response).get("data", [])
+                if orgs:
+                    self.org_id = orgs[0]["id"]
+        return response
+
+    async def batch(self, pipeline: bytes):
+        """Run an encoded {"pipeline": [...]} as one POST /batch; returns [{"status", "body"}, ...] in order."""
+        response = await self.request("POST", "/batch", pipeline)
+        response.raise_for_status()
+        return json_response(response)
+
+async def request_pair(c1: AuthedClient, c2: AuthedClient, method: str, path: str, data1: Any = None, data2: Any = None):
+    """Send a request as two users at once; returns both responses."""
+    # Encode each body once up front; a body both users share is encoded only once
+    body1 = None if data1 is None else json_body(data1)
+    body2 = body1 if data2 is data1 else (None if data2 is None else json_body(data2))
+    return await asyncio.gather(
+        c1.request(method, path, body1),
+        c2.request(method, path, body2)
+    )
@@ -4,15 +4,37 @@ Security Test Suite for AI Voice Policy Assistant
 Tests user isolation, document access control, and organization-level security.
 """
 
-import requests
-import json
+import asyncio
+import io
+import sys
 import time
-from typing import Dict, Any
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+from security_client import AuthedClient, json_response as _json, request_pair
+
+# Output of the test running in the current task, written out in one go when it
+# finishes so concurrent tests neither interleave nor flush line by line
+_test_output: ContextVar[Optional[io.StringIO]] = ContextVar("_test_output", default=None)
+
+class _BufferedStdout:
+    """Routes print() to the current test's buffer when it has one."""
+    def __init__(self, stream):
+        self._stream = stream
+    
+    def write(self, text: str) -> int:
+        return (_test_output.get() or self._stream).write(text)
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
 
 class SecurityTester:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
-        self.session = requests.Session()
+        # One long-lived client per user, carrying that user's token
+        self.c1 = AuthedClient(base_url)
+        self.c2 = AuthedClient(base_url)
         self.user1_token = None
         self.user2_token = None
         self.user1_org_id = None
@@ -20,82 +42,67 @@ class SecurityTester:
         self.test_emails = []
         self.test_org_names = []
         
-    def test_user_registration_and_isolation(self) -> bool:
+    async def close(self):
+        """Close both users' clients."""
+        await asyncio.gather(self.c1.aclose(), self.c2.aclose())
+    
+    async def _pair(self, method: str, path: str, json1: Any = None, json2: Any = None):
+        """Send a request as User 1 and User 2 at once; returns both responses."""
+        return await request_pair(self.c1, self.c2, method, path, json1, json2)
+    
+    async def test_user_registration_and_isolation(self) -> bool:
         """Test that users can register and are properly isolated."""
         print("🔐 Testing User Registration and Isolation...")
         
+        # One stamp per run keeps both users' emails and org names unique,
+        # even across runs started in the same second
+        stamp = f"{int(time.time())}_{uuid.uuid4().hex[:6]}"
+        
         # Register User 1
         user1_data = {
-            "email": f"security_user1_{int(time.time())}@test.com",
+            "email": f"security_user1_{stamp}@test.com",
             "password": "securepass123",
-            "org_name": f"Security Test Org 1_{int(time.time())}"
+            "org_name": f"Security Test Org 1_{stamp}"
         }
         
         # Track test data for cleanup
         self.test_emails.append(user1_data["email"])
         self.test_org_names.append(user1_data["org_name"])
         
-        response = self.session.post(f"{self.base_url}/auth/signup", json=user1_data)
+        response = await self.c1.signup(user1_data)
         if response.status_code not in [200, 201]:
             print(f"❌ User 1 registration failed: {response.status_code} - {response.text}")
             return False
         
-        # Login User 1
-        login_data = {"email": user1_data["email"], "password": user1_data["password"]}
-        response = self.session.post(f"{self.base_url}/auth/login", json=login_data)
-        if response.status_code != 200:
-            print(f"❌ User 1 login failed: {response.status_code} - {response.text}")
-            return False
-        
-        self.user1_token = response.json()["access_token"]
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-        
-        # Get User 1's organization info
-        response = self.session.get(f"{self.base_url}/admin/organizations")
-        if response.status_code == 200:
-            orgs = response.json().get("data", [])
-            if orgs:
-                self.user1_org_id = orgs[0]["id"]
-                print(f"✅ User 1 registered and logged in. Org ID: {self.user1_org_id}")
+        self.user1_token = self.c1.token
+        self.user1_org_id = self.c1.org_id
+        if self.user1_org_id is not None:
+            print(f"✅ User 1 registered and logged in. Org ID: {self.user1_org_id}")
         
         # Register User 2 (different organization)
         user2_data = {
-            "email": f"security_user2_{int(time.time())}@test.com", 
+            "email": f"security_user2_{stamp}@test.com", 
             "password": "securepass456",
-            "org_name": f"Security Test Org 2_{int(time.time())}"
+            "org_name": f"Security Test Org 2_{stamp}"
         }
         
         # Track test data for cleanup
         self.test_emails.append(user2_data["email"])
         self.test_org_names.append(user2_data["org_name"])
         
-        response = self.session.post(f"{self.base_url}/auth/signup", json=user2_data)
+        response = await self.c2.signup(user2_data)
         if response.status_code not in [200, 201]:
             print(f"❌ User 2 registration failed: {response.status_code} - {response.text}")
             return False
         
-        # Login User 2
-        login_data = {"email": user2_data["email"], "password": user2_data["password"]}
-        response = self.session.post(f"{self.base_url}/auth/login", json=login_data)
-        if response.status_code != 200:
-            print(f"❌ User 2 login failed: {response.status_code} - {response.text}")
-            return False
-        
-        self.user2_token = response.json()["access_token"]
-        
-        # Get User 2's organization info
-        temp_session = requests.Session()
-        temp_session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = temp_session.get(f"{self.base_url}/admin/organizations")
-        if response.status_code == 200:
-            orgs = response.json().get("data", [])
-            if orgs:
-                self.user2_org_id = orgs[0]["id"]
-                print(f"✅ User 2 registered and logged in. Org ID: {self.user2_org_id}")
+        self.user2_token = self.c2.token
+        self.user2_org_id = self.c2.org_id
+        if self.user2_org_id is not None:
+            print(f"✅ User 2 registered and logged in. Org ID: {self.user2_org_id}")
         
         return True
     
-    def test_document_isolation(self) -> bool:
+    async def test_document_isolation(self) -> bool:
         """Test that users can only see their own documents."""
         print("📄 Testing Document Isolation...")
         
@@ -103,26 +110,13 @@ class SecurityTester:
             print("❌ Users not properly authenticated")
             return False
         
-        # User 1 uploads a document
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
+        # Both users upload a document
         doc1_data = {
             "title": "User 1 Secret Document",
             "text": "This document contains sensitive information for User 1 only.",
             "source": "internal",
             "metadata": {"security_level": "high", "owner": "user1"}
         }
-        
-        response = self.session.post(f"{self.base_url}/corpus/doc", json=doc1_data)
-        if response.status_code not in [200, 201]:
-            print(f"❌ User 1 document upload failed: {response.status_code} - {response.text}")
-            return False
-        
-        doc1_id = response.json()["id"]
-        print(f"✅ User 1 uploaded document: {doc1_id}")
-        
-        # User 2 uploads a document
-        temp_session = requests.Session()
-        temp_session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
         doc2_data = {
             "title": "User 2 Secret Document", 
             "text": "This document contains sensitive information for User 2 only.",
@@ -130,32 +124,35 @@ class SecurityTester:
             "metadata": {"security_level": "high", "owner": "user2"}
         }
         
-        response = temp_session.post(f"{self.base_url}/corpus/doc", json=doc2_data)
-        if response.status_code not in [200, 201]:
-            print(f"❌ User 2 document upload failed: {response.status_code} - {response.text}")
+        response1, response2 = await self._pair("POST", "/corpus/doc", doc1_data, doc2_data)
+        if response1.status_code not in [200, 201]:
+            print(f"❌ User 1 document upload failed: {response1.status_code} - {response1.text}")
             return False
         
-        doc2_id = response.json()["id"]
+        doc1_id = _json(response1)["id"]
+        print(f"✅ User 1 uploaded document: {doc1_id}")
+        
+        if response2.status_code not in [200, 201]:
+            print(f"❌ User 2 document upload failed: {response2.status_code} - {response2.text}")
+            return False
+        
+        doc2_id = _json(response2)["id"]
         print(f"✅ User 2 uploaded document: {doc2_id}")
         
-        # User 1 lists documents (should only see their own)
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-        response = self.session.get(f"{self.base_url}/corpus/docs")
-        if response.status_code != 200:
-            print(f"❌ User 1 document list failed: {response.status_code} - {response.text}")
+        # Both users list documents (each should only see their own)
+        response1, response2 = await self._pair("GET", "/corpus/docs")
+        if response1.status_code != 200:
+            print(f"❌ User 1 document list failed: {response1.status_code} - {response1.text}")
             return False
         
-        user1_docs = response.json()
+        user1_docs = _json(response1)
         user1_doc_ids = [doc["id"] for doc in user1_docs]
         
-        # User 2 lists documents (should only see their own)
-        temp_session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = temp_session.get(f"{self.base_url}/corpus/docs")
-        if response.status_code != 200:
-            print(f"❌ User 2 document list failed: {response.status_code} - {response.text}")
+        if response2.status_code != 200:
+            print(f"❌ User 2 document list failed: {response2.status_code} - {response2.text}")
             return False
         
-        user2_docs = response.json()
+        user2_docs = _json(response2)
         user2_doc_ids = [doc["id"] for doc in user2_docs]
         
         # Verify isolation
@@ -170,7 +167,7 @@ class SecurityTester:
         print(f"✅ Document isolation verified: User 1 sees {len(user1_docs)} docs, User 2 sees {len(user2_docs)} docs")
         return True
     
-    def test_search_isolation(self) -> bool:
+    async def test_search_isolation(self) -> bool:
         """Test that search results are isolated by organization."""
         print("🔍 Testing Search Isolation...")
         
@@ -178,27 +175,22 @@ class SecurityTester:
             print("❌ Users not properly authenticated")
             return False
         
-        # User 1 searches for documents
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
+        # Both users run the same search
         search_data = {"query": "secret document", "k": 10}
         
-        response = self.session.post(f"{self.base_url}/corpus/search", json=search_data)
-        if response.status_code != 200:
-            print(f"❌ User 1 search failed: {response.status_code} - {response.text}")
+        response1, response2 = await self._pair("POST", "/corpus/search", search_data, search_data)
+        if response1.status_code != 200:
+            print(f"❌ User 1 search failed: {response1.status_code} - {response1.text}")
             return False
         
-        user1_results = response.json()["results"]
+        user1_results = _json(response1)["results"]
         user1_doc_ids = [result["doc_id"] for result in user1_results]
         
-        # User 2 searches for documents
-        temp_session = requests.Session()
-        temp_session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = temp_session.post(f"{self.base_url}/corpus/search", json=search_data)
-        if response.status_code != 200:
-            print(f"❌ User 2 search failed: {response.status_code} - {response.text}")
+        if response2.status_code != 200:
+            print(f"❌ User 2 search failed: {response2.status_code} - {response2.text}")
             return False
         
-        user2_results = response.json()["results"]
+        user2_results = _json(response2)["results"]
         user2_doc_ids = [result["doc_id"] for result in user2_results]
         
         # Verify search isolation
@@ -209,7 +201,7 @@ class SecurityTester:
         print(f"✅ Search isolation verified: User 1 found {len(user1_results)} results, User 2 found {len(user2_results)} results")
         return True
     
-    def test_chat_context_isolation(self) -> bool:
+    async def test_chat_context_isolation(self) -> bool:
         """Test that chat responses only reference user's own documents."""
         print("💬 Testing Chat Context Isolation...")
         
@@ -217,26 +209,21 @@ class SecurityTester:
             print("❌ Users not properly authenticated")
             return False
         
-        # User 1 asks a question about their document
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
+        # Both users ask the same question about their document
         chat_data = {"text": "What does my secret document contain?"}
         
-        response = self.session.post(f"{self.base_url}/chat/", json=chat_data)
-        if response.status_code != 200:
-            print(f"❌ User 1 chat failed: {response.status_code} - {response.text}")
+        response1, response2 = await self._pair("POST", "/chat/", chat_data, chat_data)
+        if response1.status_code != 200:
+            print(f"❌ User 1 chat failed: {response1.status_code} - {response1.text}")
             return False
         
-        user1_response = response.json()["response"]
+        user1_response = _json(response1)["response"]
         
-        # User 2 asks the same question
-        temp_session = requests.Session()
-        temp_session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = temp_session.post(f"{self.base_url}/chat/", json=chat_data)
-        if response.status_code != 200:
-            print(f"❌ User 2 chat failed: {response.status_code} - {response.text}")
+        if response2.status_code != 200:
+            print(f"❌ User 2 chat failed: {response2.status_code} - {response2.text}")
             return False
         
-        user2_response = response.json()["response"]
+        user2_response = _json(response2)["response"]
         
         # Verify responses are different (different context)
         if user1_response == user2_response:
@@ -246,7 +233,7 @@ class SecurityTester:
         print(f"✅ Chat context isolation verified: Users got different responses based on their own documents")
         return True
     
-    def test_admin_isolation(self) -> bool:
+    async def test_admin_isolation(self) -> bool:
         """Test that admin endpoints only show user's organization data."""
         print("👑 Testing Admin Endpoint Isolation...")
         
@@ -254,24 +241,19 @@ class SecurityTester:
             print("❌ Users not properly authenticated")
             return False
         
-        # User 1 gets system status
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-        response = self.session.get(f"{self.base_url}/admin/system-status")
-        if response.status_code != 200:
-            print(f"❌ User 1 system status failed: {response.status_code} - {response.text}")
+        # Both users get system status
+        response1, response2 = await self._pair("GET", "/admin/system-status")
+        if response1.status_code != 200:
+            print(f"❌ User 1 system status failed: {response1.status_code} - {response1.text}")
             return False
         
-        user1_status = response.json()["data"]
+        user1_status = _json(response1)["data"]
         
-        # User 2 gets system status
-        temp_session = requests.Session()
-        temp_session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = temp_session.get(f"{self.base_url}/admin/system-status")
-        if response.status_code != 200:
-            print(f"❌ User 2 system status failed: {response.status_code} - {response.text}")
+        if response2.status_code != 200:
+            print(f"❌ User 2 system status failed: {response2.status_code} - {response2.text}")
             return False
         
-        user2_status = response.json()["data"]
+        user2_status = _json(response2)["data"]
         
         # Verify admin isolation
         if user1_status.get("database", {}).get("organization_id") == user2_status.get("database", {}).get("organization_id"):
@@ -286,7 +268,25 @@ class SecurityTester:
         print("🧹 Using unique identifiers to avoid conflicts with previous test runs...")
         # We'll use timestamp-based unique identifiers instead of trying to delete data
     
-    def run_all_security_tests(self) -> bool:
+    async def _run_test(self, test_name: str, test_func) -> bool:
+        """Run one test and report its outcome; returns whether it passed."""
+        buffer = io.StringIO()
+        token = _test_output.set(buffer)
+        try:
+            print(f"\n🧪 Running: {test_name}")
+            try:
+                if await test_func():
+                    print(f"✅ {test_name}: PASSED")
+                    return True
+                print(f"❌ {test_name}: FAILED")
+            except Exception as e:
+                print(f"❌ {test_name}: ERROR - {str(e)}")
+            return False
+        finally:
+            _test_output.reset(token)
+            sys.stdout.write(buffer.getvalue())
+    
+    async def run_all_security_tests(self) -> bool:
         """Run all security tests."""
         print("🔒 AI Voice Policy Assistant - Security Test Suite")
         print("=" * 60)
@@ -294,27 +294,26 @@ class SecurityTester:
         # Clean up test data from previous runs
         self.cleanup_test_data()
         
-        tests = [
+        # Registration sets up the users and the document test uploads the
+        # data the rest check; after that the tests only read, so they run together
+        setup_tests = [
             ("User Registration and Isolation", self.test_user_registration_and_isolation),
-            ("Document Isolation", self.test_document_isolation),
+            ("Document Isolation", self.test_document_isolation)
+        ]
+        read_only_tests = [
             ("Search Isolation", self.test_search_isolation),
             ("Chat Context Isolation", self.test_chat_context_isolation),
             ("Admin Endpoint Isolation", self.test_admin_isolation)
         ]
         
+        total = len(setup_tests) + len(read_only_tests)
         passed = 0
-        total = len(tests)
-        
-        for test_name, test_func in tests:
-            print(f"\n🧪 Running: {test_name}")
-            try:
-                if test_func():
-                    print(f"✅ {test_name}: PASSED")
-                    passed += 1
-                else:
-                    print(f"❌ {test_name}: FAILED")
-            except Exception as e:
-                print(f"❌ {test_name}: ERROR - {str(e)}")
+        for test_name, test_func in setup_tests:
+            passed += await self._run_test(test_name, test_func)
+        results = await asyncio.gather(*(
+            self._run_test(test_name, test_func) for test_name, test_func in read_only_tests
+        ))
+        passed += sum(results)
         
         print("\n" + "=" * 60)
         print(f"🔒 SECURITY TEST RESULTS: {passed}/{total} PASSED")
@@ -327,7 +326,16 @@ class SecurityTester:
         
         return passed == total
 
-if __name__ == "__main__":
+async def main() -> bool:
     tester = SecurityTester()
-    success = tester.run_all_security_tests()
+    stdout = sys.stdout
+    sys.stdout = _BufferedStdout(stdout)
+    try:
+        return await tester.run_all_security_tests()
+    finally:
+        sys.stdout = stdout
+        await tester.close()
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
     exit(0 if success else 1)
@@ -4,42 +4,82 @@ Comprehensive Security Test with Substantial Documents
 Tests user isolation with real, searchable content.
 """
 
-import requests
-import json
+import asyncio
+import httpx
+import re
 import time
+import uuid
+
+from security_client import AuthedClient, json_body, json_response as _json, request_pair
+
+# Title markers of each admin's document; matched against all of a user's
+# titles joined into one string instead of scanning title by title
+HEALTHCARE_TITLE = re.compile("Healthcare")
+TECH_TITLE = re.compile("Software Development")
+
+# Search terms that should only match one organization's documents
+SEARCH_CASES = (
+    ("HIPAA compliance", "healthcare"),
+    ("microservices architecture", "technology"),
+    ("patient privacy", "healthcare"),
+    ("CI/CD pipeline", "technology")
+)
+
+# The /batch body running every search in SEARCH_CASES, encoded once
+SEARCH_PIPELINE = json_body({"pipeline": [
+    {"method": "POST", "path": "/corpus/search", "body": {"query": search_term, "k": 5}}
+    for search_term, _ in SEARCH_CASES
+]})
+
+# Questions that should get different responses based on each user's documents
+CHAT_QUESTIONS = (
+    "What are our organization's main policies and procedures?",
+    "What security measures do we have in place?",
+    "What are our quality standards and protocols?"
+)
 
 class SecurityManualTester:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
-        self.session = requests.Session()
+        # One long-lived client per user, carrying that user's token
+        self.c1 = AuthedClient(base_url)
+        self.c2 = AuthedClient(base_url)
         self.user1_token = None
         self.user2_token = None
         self.user1_org_id = None
         self.user2_org_id = None
         
-    def test_comprehensive_security(self):
+    async def close(self):
+        """Close both users' clients."""
+        await asyncio.gather(self.c1.aclose(), self.c2.aclose())
+    
+    async def _pair(self, method: str, path: str, json1=None, json2=None):
+        """Send a request as both users at once; returns both responses."""
+        return await request_pair(self.c1, self.c2, method, path, json1, json2)
+    
+    async def test_comprehensive_security(self):
         """Run comprehensive security test with substantial documents."""
         print("🔒 Comprehensive Security Test with Substantial Documents")
         print("=" * 70)
         
         # Step 1: Create and authenticate users
-        if not self._setup_users():
+        if not await self._setup_users():
             return False
         
         # Step 2: Upload substantial, distinct documents
-        if not self._upload_documents():
+        if not await self._upload_documents():
             return False
         
         # Step 3: Test document isolation
-        if not self._test_document_isolation():
+        if not await self._test_document_isolation():
             return False
         
         # Step 4: Test search isolation
-        if not self._test_search_isolation():
+        if not await self._test_search_isolation():
             return False
         
         # Step 5: Test chat context isolation
-        if not self._test_chat_isolation():
+        if not await self._test_chat_isolation():
             return False
         
         print("\n" + "=" * 70)
@@ -47,12 +87,12 @@ class SecurityManualTester:
         print("=" * 70)
         return True
     
-    def _setup_users(self):
+    async def _setup_users(self):
         """Create and authenticate two users in different organizations."""
         print("\n👥 Step 1: Setting up users...")
         
-        # Create unique identifiers
-        timestamp = int(time.time())
+        # Create unique identifiers (the suffix avoids clashes between runs in the same second)
+        timestamp = f"{int(time.time())}_{uuid.uuid4().hex[:6]}"
         
         # User 1 - Healthcare Organization
         user1_data = {
@@ -68,35 +108,21 @@ class SecurityManualTester:
             "org_name": f"Tech Solutions {timestamp}"
         }
         
-        # Register and login users
-        for i, (user_data, user_name) in enumerate([(user1_data, "Healthcare Admin"), (user2_data, "Tech Admin")]):
-            print(f"\n  Creating {user_name}...")
-            
-            # Register
-            response = self.session.post(f"{self.base_url}/auth/signup", json=user_data)
+        # Register both users at once (signup also returns the access token, so no separate login)
+        print("\n  Creating Healthcare Admin and Tech Admin...")
+        responses = await asyncio.gather(self.c1.signup(user1_data), self.c2.signup(user2_data))
+        
+        for user_name, response in zip(("Healthcare Admin", "Tech Admin"), responses):
             if response.status_code not in [200, 201]:
-                print(f"    ❌ Registration failed: {response.status_code}")
+                print(f"    ❌ {user_name} registration failed: {response.status_code}")
                 return False
-            
-            # Login
-            login_data = {"email": user_data["email"], "password": user_data["password"]}
-            response = self.session.post(f"{self.base_url}/auth/login", json=login_data)
-            if response.status_code != 200:
-                print(f"    ❌ Login failed: {response.status_code}")
-                return False
-            
-            token = response.json()["access_token"]
-            
-            if i == 0:
-                self.user1_token = token
-                print(f"    ✅ {user_name} created and logged in")
-            else:
-                self.user2_token = token
-                print(f"    ✅ {user_name} created and logged in")
+            print(f"    ✅ {user_name} created and logged in")
         
+        self.user1_token = self.c1.token
+        self.user2_token = self.c2.token
         return True
     
-    def _upload_documents(self):
+    async def _upload_documents(self):
         """Upload substantial, distinct documents for each user."""
         print("\n📄 Step 2: Uploading substantial documents...")
         
@@ -116,120 +142,128 @@ class SecurityManualTester:
             "metadata": {"department": "engineering", "security_level": "high", "category": "technology"}
         }
         
-        # Upload Healthcare Document
-        print("\n  Uploading Healthcare Policy Manual...")
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-        response = self.session.post(f"{self.base_url}/corpus/doc", json=healthcare_doc)
-        if response.status_code not in [200, 201]:
-            print(f"    ❌ Healthcare document upload failed: {response.status_code}")
+        # Upload both documents at once
+        print("\n  Uploading Healthcare Policy Manual and Tech Development Standards...")
+        response1, response2 = await self._pair("POST", "/corpus/doc", healthcare_doc, tech_doc)
+        if response1.status_code not in [200, 201]:
+            print(f"    ❌ Healthcare document upload failed: {response1.status_code}")
             return False
-        print(f"    ✅ Healthcare document uploaded (ID: {response.json()['id']})")
-        
-        # Upload Tech Document
-        print("\n  Uploading Tech Development Standards...")
-        self.session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = self.session.post(f"{self.base_url}/corpus/doc", json=tech_doc)
-        if response.status_code not in [200, 201]:
-            print(f"    ❌ Tech document upload failed: {response.status_code}")
+        print(f"    ✅ Healthcare document uploaded (ID: {_json(response1)['id']})")
+        
+        if response2.status_code not in [200, 201]:
+            print(f"    ❌ Tech document upload failed: {response2.status_code}")
             return False
-        print(f"    ✅ Tech document uploaded (ID: {response.json()['id']})")
+        print(f"    ✅ Tech document uploaded (ID: {_json(response2)['id']})")
         
-        # Wait for processing
+        # Wait until both documents are listed rather than sleeping a fixed time
         print("\n  ⏳ Waiting for document processing...")
-        time.sleep(3)
+        ready1, ready2 = await asyncio.gather(
+            self._wait_indexed(self.c1, healthcare_doc["title"]),
+            self._wait_indexed(self.c2, tech_doc["title"])
+        )
+        if not (ready1 and ready2):
+            print("    ❌ Documents did not become available in time")
+            return False
         
         return True
     
-    def _test_document_isolation(self):
+    async def _wait_indexed(self, client: AuthedClient, expected_title: str, timeout: float = 5.0):
+        """Poll the document list with exponential backoff until expected_title shows up."""
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while time.monotonic() < deadline:
+            response = await client.request("GET", "/corpus/docs", params={"text_chars": 0})
+            if response.status_code == 200 and any(doc["title"] == expected_title for doc in _json(response)):
+                return True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.4)
+        return False
+    
+    async def _test_document_isolation(self):
         """Test that users can only see their own documents."""
         print("\n🔒 Step 3: Testing document isolation...")
         
-        # User 1 lists documents
+        # Both users list documents
+        response1, response2 = await self._pair("GET", "/corpus/docs")
+        
         print("\n  Healthcare Admin listing documents...")
-        self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-        response = self.session.get(f"{self.base_url}/corpus/docs")
-        if response.status_code != 200:
-            print(f"    ❌ Healthcare Admin document list failed: {response.status_code}")
+        if response1.status_code != 200:
+            print(f"    ❌ Healthcare Admin document list failed: {response1.status_code}")
             return False
         
-        user1_docs = response.json()
+        user1_docs = _json(response1)
         user1_titles = [doc["title"] for doc in user1_docs]
         print(f"    ✅ Healthcare Admin sees {len(user1_docs)} documents")
         print(f"    📋 Document titles: {user1_titles}")
         
-        # User 2 lists documents
         print("\n  Tech Admin listing documents...")
-        self.session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-        response = self.session.get(f"{self.base_url}/corpus/docs")
-        if response.status_code != 200:
-            print(f"    ❌ Tech Admin document list failed: {response.status_code}")
+        if response2.status_code != 200:
+            print(f"    ❌ Tech Admin document list failed: {response2.status_code}")
             return False
         
-        user2_docs = response.json()
+        user2_docs = _json(response2)
         user2_titles = [doc["title"] for doc in user2_docs]
         print(f"    ✅ Tech Admin sees {len(user2_docs)} documents")
         print(f"    📋 Document titles: {user2_titles}")
+        user1_text, user2_text = "\n".join(user1_titles), "\n".join(user2_titles)
         
         # Verify isolation
-        if any("Healthcare" in title for title in user2_titles):
+        if HEALTHCARE_TITLE.search(user2_text):
             print("    ❌ SECURITY BREACH: Tech Admin can see Healthcare documents!")
             return False
         
-        if any("Software Development" in title for title in user1_titles):
+        if TECH_TITLE.search(user1_text):
             print("    ❌ SECURITY BREACH: Healthcare Admin can see Tech documents!")
             return False
         
         print("    ✅ Document isolation verified - users only see their own documents")
         return True
     
-    def _test_search_isolation(self):
+    async def _test_search_isolation(self):
         """Test that search results are isolated by organization."""
         print("\n🔍 Step 4: Testing search isolation...")
         
-        # Test search terms that should only match one organization's documents
-        search_tests = [
-            ("HIPAA compliance", "healthcare"),
-            ("microservices architecture", "technology"),
-            ("patient privacy", "healthcare"),
-            ("CI/CD pipeline", "technology")
-        ]
+        # Every search for each admin goes out as one batch; the two admins'
+        # batches run concurrently. Results are then checked in order.
+        try:
+            batch1, batch2 = await asyncio.gather(
+                self.c1.batch(SEARCH_PIPELINE),
+                self.c2.batch(SEARCH_PIPELINE)
+            )
+        except httpx.HTTPError as e:
+            print(f"    ❌ Batched search failed: {e}")
+            return False
         
-        for search_term, expected_org in search_tests:
+        for (search_term, expected_org), result1, result2 in zip(SEARCH_CASES, batch1, batch2):
             print(f"\n  Testing search: '{search_term}' (should find {expected_org} docs)")
             
-            # Healthcare Admin search
-            self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-            response = self.session.post(f"{self.base_url}/corpus/search", json={"query": search_term, "k": 5})
-            if response.status_code != 200:
-                print(f"    ❌ Healthcare Admin search failed: {response.status_code}")
+            if result1["status"] != 200:
+                print(f"    ❌ Healthcare Admin search failed: {result1['status']}")
                 return False
             
-            user1_results = response.json()["results"]
-            user1_titles = [result["title"] for result in user1_results]
+            user1_results = result1["body"]["results"]
+            user1_text = "\n".join(result["title"] for result in user1_results)
             
-            # Tech Admin search
-            self.session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-            response = self.session.post(f"{self.base_url}/corpus/search", json={"query": search_term, "k": 5})
-            if response.status_code != 200:
-                print(f"    ❌ Tech Admin search failed: {response.status_code}")
+            if result2["status"] != 200:
+                print(f"    ❌ Tech Admin search failed: {result2['status']}")
                 return False
             
-            user2_results = response.json()["results"]
-            user2_titles = [result["title"] for result in user2_results]
+            user2_results = result2["body"]["results"]
+            user2_text = "\n".join(result["title"] for result in user2_results)
             
             # Verify search isolation
             if expected_org == "healthcare":
-                if not any("Healthcare" in title for title in user1_titles):
+                if not HEALTHCARE_TITLE.search(user1_text):
                     print(f"    ❌ Healthcare Admin didn't find expected healthcare document for '{search_term}'")
                     return False
-                if any("Healthcare" in title for title in user2_titles):
+                if HEALTHCARE_TITLE.search(user2_text):
                     print(f"    ❌ SECURITY BREACH: Tech Admin found healthcare document for '{search_term}'")
                     return False
             else:  # technology
-                if not any("Software Development" in title for title in user2_titles):
+                if not TECH_TITLE.search(user2_text):
                     print(f"    ❌ Tech Admin didn't find expected tech document for '{search_term}'")
                     return False
-                if any("Software Development" in title for title in user1_titles):
+                if TECH_TITLE.search(user1_text):
                     print(f"    ❌ SECURITY BREACH: Healthcare Admin found tech document for '{search_term}'")
                     return False
             
@@ -237,38 +271,28 @@ class SecurityManualTester:
         
         return True
     
-    def _test_chat_isolation(self):
+    async def _test_chat_isolation(self):
         """Test that chat responses are isolated by organization."""
         print("\n💬 Step 5: Testing chat context isolation...")
         
-        # Test questions that should get different responses based on user's documents
-        test_questions = [
-            "What are our organization's main policies and procedures?",
-            "What security measures do we have in place?",
-            "What are our quality standards and protocols?"
-        ]
-        
-        for question in test_questions:
+        for question in CHAT_QUESTIONS:
             print(f"\n  Testing question: '{question}'")
             
-            # Healthcare Admin asks question
-            self.session.headers.update({"Authorization": f"Bearer {self.user1_token}"})
-            response = self.session.post(f"{self.base_url}/chat/", json={"text": question})
-            if response.status_code != 200:
-                print(f"    ❌ Healthcare Admin chat failed: {response.status_code}")
+            # Both admins ask the same question at once
+            chat_data = {"text": question}
+            response1, response2 = await self._pair("POST", "/chat/", chat_data, chat_data)
+            if response1.status_code != 200:
+                print(f"    ❌ Healthcare Admin chat failed: {response1.status_code}")
                 return False
             
-            user1_response = response.json()["response"]
+            user1_response = _json(response1)["response"]
             print(f"    🏥 Healthcare Admin response: {user1_response[:100]}...")
             
-            # Tech Admin asks same question
-            self.session.headers.update({"Authorization": f"Bearer {self.user2_token}"})
-            response = self.session.post(f"{self.base_url}/chat/", json={"text": question})
-            if response.status_code != 200:
-                print(f"    ❌ Tech Admin chat failed: {response.status_code}")
+            if response2.status_code != 200:
+                print(f"    ❌ Tech Admin chat failed: {response2.status_code}")
                 return False
             
-            user2_response = response.json()["response"]
+            user2_response = _json(response2)["response"]
             print(f"    💻 Tech Admin response: {user2_response[:100]}...")
             
             # Verify responses are different
@@ -290,9 +314,12 @@ class SecurityManualTester:
         
         return True
 
-def main():
+async def main():
     tester = SecurityManualTester()
-    success = tester.test_comprehensive_security()
+    try:
+        success = await tester.test_comprehensive_security()
+    finally:
+        await tester.close()
     
     if success:
         print("\n🎯 Manual Testing Instructions:")
@@ -307,4 +334,4 @@ def main():
     exit(0 if success else 1)
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
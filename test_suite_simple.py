@@ -7,20 +7,21 @@ Tests all Python files for basic syntax and import errors.
 import sys
 import os
 import ast
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator, List, Tuple
 
 class SimpleFileTester:
     def __init__(self):
         self.results = {}
         self.errors = []
+        # Parsed module per file; test_basic_imports reuses test_syntax's parse
+        self._ast_cache: Dict[str, ast.Module] = {}
         
     def test_syntax(self, file_path: str) -> bool:
         """Test if a Python file has valid syntax."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                source = f.read()
-            ast.parse(source)
+            self._ast_cache[file_path] = ast.parse(Path(file_path).read_bytes(), filename=file_path)
             return True
         except SyntaxError as e:
             self.errors.append(f"Syntax error in {file_path}: {e}")
@@ -32,48 +33,45 @@ class SimpleFileTester:
     def test_basic_imports(self, file_path: str) -> bool:
         """Test if a Python file has basic import issues."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                source = f.read()
+            tree = self._ast_cache[file_path]
             
-            # Check for common import issues
-            lines = source.split('\n')
-            for i, line in enumerate(lines, 1):
-                line = line.strip()
-                if line.startswith('import ') or line.startswith('from '):
-                    # Basic syntax check for import statements
-                    try:
-                        ast.parse(line)
-                    except SyntaxError as e:
-                        self.errors.append(f"Import syntax error in {file_path}:{i}: {e}")
-                        return False
+            # Compiling the already parsed module catches the import errors the
+            # parser lets through (misplaced __future__ imports, star imports
+            # inside functions) without reading or parsing the file again
+            try:
+                compile(tree, file_path, "exec")
+            except SyntaxError as e:
+                self.errors.append(f"Import syntax error in {file_path}:{e.lineno}: {e.msg}")
+                return False
             
             return True
         except Exception as e:
             self.errors.append(f"Error checking imports in {file_path}: {e}")
             return False
     
-    def test_file(self, file_path: str) -> Dict[str, bool]:
-        """Test a single Python file."""
-        print(f"🔍 Testing {file_path}...")
-        
-        # Test syntax first
+    def check_file(self, file_path: str) -> Dict[str, bool]:
+        """Run the syntax and import checks on a single Python file."""
+        # Test syntax first, then basic imports if syntax is ok
         syntax_ok = self.test_syntax(file_path)
+        imports_ok = syntax_ok and self.test_basic_imports(file_path)
         
-        # Test basic imports if syntax is ok
-        imports_ok = False
-        if syntax_ok:
-            imports_ok = self.test_basic_imports(file_path)
-        
-        result = {
+        return {
             'syntax': syntax_ok,
             'imports': imports_ok,
             'overall': syntax_ok and imports_ok
         }
-        
+    
+    def print_result(self, file_path: str, result: Dict[str, bool]):
+        """Print the outcome for one file."""
+        print(f"🔍 Testing {file_path}...")
         status = "✅" if result['overall'] else "❌"
-        print(f"   {status} Syntax: {'OK' if syntax_ok else 'FAIL'}")
-        print(f"   {status} Imports: {'OK' if imports_ok else 'FAIL'}")
-        
+        print(f"   {status} Syntax: {'OK' if result['syntax'] else 'FAIL'}")
+        print(f"   {status} Imports: {'OK' if result['imports'] else 'FAIL'}")
+    
+    def test_file(self, file_path: str) -> Dict[str, bool]:
+        """Test a single Python file."""
+        result = self.check_file(file_path)
+        self.print_result(file_path, result)
         return result
     
     def run_tests(self) -> Dict[str, Dict[str, bool]]:
@@ -81,45 +79,17 @@ class SimpleFileTester:
         print("🧪 Running simple test suite...")
         print("=" * 60)
         
-        # Define all Python files to test
-        python_files = [
-            # Main application files
-            'api/app.py',
-            'worker/main.py',
-            
-            # Models
-            'api/models/entities.py',
-            'api/models/db.py',
-            'api/models/schemas.py',
-            
-            # Routes
-            'api/routes/auth.py',
-            'api/routes/chat.py',
-            'api/routes/corpus.py',
-            'api/routes/admin.py',
-            'api/routes/ws_audio.py',
-            
-            # Services
-            'api/services/orchestrator.py',
-            'api/services/stt.py',
-            'api/services/llm.py',
-            'api/services/vectorizer.py',
-            'api/services/search.py',
-            'api/services/rate_limit.py',
-            'api/services/cache.py',
-            
-            # Utils
-            'api/utils/config.py',
-        ]
+        # Every Python file in the application and worker packages
+        python_files = [path for top in ('api', 'worker') for path in _iter_py_files(top)]
         
-        # Test each file
-        for file_path in python_files:
-            if os.path.exists(file_path):
-                self.results[file_path] = self.test_file(file_path)
+        # Parsing holds the GIL, so files are checked in worker processes;
+        # results come back in list order and are printed here
+        with ProcessPoolExecutor() as executor:
+            for file_path, result, errors in executor.map(_test_one, python_files, chunksize=4):
+                self.results[file_path] = result
+                self.errors.extend(errors)
+                self.print_result(file_path, result)
                 print()  # Empty line for readability
-            else:
-                print(f"⚠️  File not found: {file_path}")
-                self.results[file_path] = {'syntax': False, 'imports': False, 'overall': False}
         
         return self.results
     
@@ -148,6 +118,25 @@ class SimpleFileTester:
         
         print(f"\nOverall Status: {'✅ PASSED' if overall_ok == total_files else '❌ FAILED'}")
 
+def _iter_py_files(root: str) -> Iterator[str]:
+    """Yield .py paths under root in sorted order, skipping symlinks, dotted and __pycache__ dirs."""
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    # is_file/is_dir without following symlinks answer from the readdir entry
+    # type, so no entry costs an extra stat
+    for entry in entries:
+        if entry.name.endswith('.py'):
+            if entry.is_file(follow_symlinks=False):
+                yield entry.path
+        elif entry.is_dir(follow_symlinks=False):
+            if not entry.name.startswith('.') and entry.name != '__pycache__':
+                yield from _iter_py_files(entry.path)
+
+def _test_one(file_path: str) -> Tuple[str, Dict[str, bool], List[str]]:
+    """Check one file in a worker process; returns its path, result and errors."""
+    tester = SimpleFileTester()
+    return file_path, tester.check_file(file_path), tester.errors
+
 def main():
     """Run the test suite."""
     tester = SimpleFileTester()
@@ -12,6 +12,19 @@ import websockets
 import base64
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _ws_dumps(data) -> str:
+    """Encode a WebSocket message; decoded to str so it goes out as a text frame, not audio bytes."""
+    return orjson.dumps(data).decode() if orjson else json.dumps(data)
+
+def _ws_loads(message):
+    """Decode a WebSocket message, with orjson when it is installed."""
+    return orjson.loads(message) if orjson else json.loads(message)
+
 class VoiceTester:
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
@@ -97,7 +110,7 @@ class VoiceTester:
                 # Wait for connection message
                 try:
                     message = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                    data = json.loads(message)
+                    data = _ws_loads(message)
                     if data.get("type") == "connection_established":
                         print(f"   ✅ Connection established: {data['data']}")
                     else:
@@ -109,15 +122,15 @@ class VoiceTester:
                 ping_msg = {
                     "type": "ping",
                     "data": "test",
-                    "timestamp": time.time()
+                    "timestamp": time.monotonic_ns()
                 }
-                await websocket.send(json.dumps(ping_msg))
+                await websocket.send(_ws_dumps(ping_msg))
                 print("   📤 Sent ping message")
                 
                 # Wait for pong response
                 try:
                     message = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                    data = json.loads(message)
+                    data = _ws_loads(message)
                     if data.get("type") == "pong":
                         print("   ✅ Received pong response")
                     else:
@@ -2,18 +2,31 @@
 
 import asyncio
 import logging
+import os
 import signal
+import socket
 import sys
-from typing import Optional
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
 import redis.asyncio as redis
+from redis.exceptions import ResponseError
+from sqlalchemy import delete, exists, insert
 from sqlalchemy.orm import Session
 
 from api.models.db import get_db_session
 from api.models.entities import Doc, Embedding
-from api.services.vectorizer import vectorizer_service
+from api.services.vectorizer import chunk_spans, vectorizer_service
 from api.services.cache import cache_service
+from api.services.search import search_service
 from api.utils.config import get_redis_url, settings
 
+try:
+    import psycopg
+    from pgvector.psycopg import register_vector
+except ImportError:
+    psycopg = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,6 +34,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Task ids arrive on a Redis stream read through a consumer group, so each task
+# goes to one worker and is acknowledged once handled
+TASK_STREAM = "embed:tasks"
+TASK_GROUP = "workers"
+
+# Embedding rows are bulk loaded with binary COPY when the driver is psycopg 3;
+# types are given per column since binary COPY carries no type information
+COPY_COLUMNS = ("doc_id", "chunk_text", "chunk_start", "chunk_end", "vector", "model", "created_at")
+COPY_TYPES = ["int4", "varchar", "int4", "int4", "halfvec", "varchar", "timestamp"]
+COPY_EMBEDDINGS = f"COPY embedding ({', '.join(COPY_COLUMNS)}) FROM STDIN (FORMAT BINARY)"
+
 
 class Worker:
     """Background worker for processing tasks."""
@@ -29,7 +53,16 @@ class Worker:
         self.redis_url = get_redis_url()
         self.redis: Optional[redis.Redis] = None
         self.running = False
-        self.tasks = []
+        self.tasks: Set[asyncio.Task] = set()
+        # Documents chunked and embedded together per pass
+        self.doc_batch_size = 10
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+        self.pending_interval = 1.0  # seconds between scans for unembedded docs
+        # Stream entries left unacknowledged this long (e.g. by a crashed
+        # worker) are claimed and rerun; checked every claim_interval seconds
+        self.claim_idle_ms = 600_000
+        self.claim_interval = 60.0
+        self.in_flight: Set[str] = set()  # Stream entry ids being handled here
         
     async def start(self):
         """Start the worker."""
@@ -78,37 +111,93 @@ class Worker:
         self.redis = redis.from_url(self.redis_url, decode_responses=True)
         await self.redis.ping()
         logger.info("Connected to Redis")
+        
+        try:
+            # From the start of the stream, so tasks added before the group existed aren't lost
+            await self.redis.xgroup_create(TASK_STREAM, TASK_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
     
     async def _process_tasks(self):
         """Main task processing loop."""
         logger.info("Starting task processing loop...")
         
+        # Unembedded documents and abandoned stream entries are picked up on
+        # their own schedules
+        self._spawn(self._pending_embeddings_loop())
+        self._spawn(self._reclaim_loop())
+        
         while self.running:
             try:
-                # Check for new tasks
-                task_data = await self.redis.blpop("worker:embed_tasks", timeout=1)
+                # Wait for new tasks; returns as soon as any arrive, the block
+                # timeout only lets the loop notice shutdown
+                response = await self.redis.xreadgroup(
+                    TASK_GROUP, self.consumer_name, {TASK_STREAM: ">"}, count=32, block=5000
+                )
                 
-                if task_data:
-                    task_type, task_id = task_data
-                    logger.info(f"Processing task: {task_id}")
+                for _, messages in response or []:
+                    logger.info(f"Processing {len(messages)} task(s)")
                     
-                    # Process the task
-                    task = asyncio.create_task(self._process_embed_task(task_id))
-                    self.tasks.append(task)
-                    
-                    # Clean up completed tasks
-                    self.tasks = [t for t in self.tasks if not t.done()]
-                
-                # Process any pending embedding jobs
-                await self._process_pending_embeddings()
-                
-                # Small delay to prevent busy waiting
-                await asyncio.sleep(0.1)
+                    # Each task runs on its own, so a long reindex doesn't hold up
+                    # the embeds read alongside or after it
+                    for message_id, fields in messages:
+                        self._spawn_message(message_id, fields)
                 
             except Exception as e:
                 logger.error(f"Error in task processing loop: {e}")
                 await asyncio.sleep(1)
     
+    def _spawn_message(self, message_id: str, fields: Optional[dict]):
+        """Handle a stream entry in the background unless it is already being handled here."""
+        if message_id not in self.in_flight:
+            self.in_flight.add(message_id)
+            self._spawn(self._handle_message(message_id, fields))
+    
+    async def _handle_message(self, message_id: str, fields: Optional[dict]):
+        """Run a stream entry's task, then acknowledge it; a cancelled one stays pending for reclaim."""
+        try:
+            # Entries deleted from the stream come back from XAUTOCLAIM without fields
+            if fields and "task_id" in fields:
+                await self._process_embed_task(fields["task_id"])
+            await self.redis.xack(TASK_STREAM, TASK_GROUP, message_id)
+        finally:
+            self.in_flight.discard(message_id)
+    
+    async def _reclaim_loop(self):
+        """Periodically take over entries another consumer read but never acknowledged."""
+        while self.running:
+            try:
+                start = "0-0"
+                while True:
+                    result = await self.redis.xautoclaim(
+                        TASK_STREAM, TASK_GROUP, self.consumer_name,
+                        min_idle_time=self.claim_idle_ms, start_id=start, count=32
+                    )
+                    start, messages = result[0], result[1]
+                    if messages:
+                        logger.info(f"Reclaimed {len(messages)} abandoned task(s)")
+                    for message_id, fields in messages:
+                        self._spawn_message(message_id, fields)
+                    if start == "0-0":
+                        break
+            except Exception as e:
+                logger.error(f"Error reclaiming abandoned tasks: {e}")
+            await asyncio.sleep(self.claim_interval)
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """Start a background task that stop() cancels; it drops out of the set once done."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+    
+    async def _pending_embeddings_loop(self):
+        """Periodically embed documents that have no embeddings yet."""
+        while self.running:
+            await self._process_pending_embeddings()
+            await asyncio.sleep(self.pending_interval)
+    
     async def _process_embed_task(self, task_id: str):
         """Process an embedding task."""
         try:
@@ -130,34 +219,53 @@ class Worker:
             else:
                 logger.warning(f"Unknown task type: {task_type}")
             
-            # Mark task as completed
-            await self.redis.hset(f"worker:task:{task_id}", "status", "completed")
-            await self.redis.expire(f"worker:task:{task_id}", 3600)  # 1 hour TTL
+            # Mark task as completed, in one round trip
+            await self._finish_task(task_id, {"status": "completed"})
             
             logger.info(f"Task {task_id} completed successfully")
             
         except Exception as e:
             logger.error(f"Error processing task {task_id}: {e}")
             
-            # Mark task as failed
-            await self.redis.hset(f"worker:task:{task_id}", "status", "failed")
-            await self.redis.hset(f"worker:task:{task_id}", "error", str(e))
-            await self.redis.expire(f"worker:task:{task_id}", 3600)  # 1 hour TTL
+            # Mark task as failed, in one round trip
+            await self._finish_task(task_id, {"status": "failed", "error": str(e)})
+    
+    async def _finish_task(self, task_id: str, fields: dict):
+        """Record a task's outcome and give its hash a 1 hour TTL, pipelined."""
+        key = f"worker:task:{task_id}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, 3600)
+            await pipe.execute()
+    
+    @contextmanager
+    def _session(self) -> Iterator[Session]:
+        """A pooled database session for one unit of work; rolled back on error and always closed."""
+        db = get_db_session()
+        try:
+            yield db
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
     
     async def _process_pending_embeddings(self):
         """Process any documents that need embeddings."""
         try:
-            db = get_db_session()
-            
-            # Find documents without embeddings
-            docs_without_embeddings = db.query(Doc).outerjoin(Embedding).filter(
-                Embedding.id.is_(None)
-            ).limit(10).all()  # Process in batches
-            
-            for doc in docs_without_embeddings:
-                await self._embed_document(doc.id)
-            
-            db.close()
+            with self._session() as db:
+                # Claim documents without embeddings, skipping any that another
+                # worker or a reindex holds locked
+                pending = db.query(Doc.id).outerjoin(
+                    Embedding, Embedding.doc_id == Doc.id
+                ).filter(
+                    Embedding.id.is_(None)
+                ).limit(self.doc_batch_size).with_for_update(skip_locked=True, of=Doc).all()  # Process in batches
+                
+                if pending:
+                    docs = self._unembedded(db, [doc_id for doc_id, in pending])
+                    if docs:
+                        await self._embed_documents(db, docs)
             
         except Exception as e:
             logger.error(f"Error processing pending embeddings: {e}")
@@ -165,113 +273,174 @@ class Worker:
     async def _embed_document(self, doc_id: int):
         """Generate embeddings for a document."""
         try:
-            db = get_db_session()
-            
-            # Get the document
-            doc = db.query(Doc).filter(Doc.id == doc_id).first()
-            if not doc:
-                logger.warning(f"Document {doc_id} not found")
-                return
-            
-            # Check if document already has embeddings
-            existing_embeddings = db.query(Embedding).filter(Embedding.doc_id == doc_id).count()
-            if existing_embeddings > 0:
-                logger.info(f"Document {doc_id} already has embeddings, skipping")
-                return
-            
-            # Chunk the document
-            chunks = self._chunk_text(doc.text, chunk_size=800, overlap=100)
-            
-            # Generate embeddings for each chunk
-            embeddings = []
-            for i, chunk in enumerate(chunks):
-                embedding_vector = await vectorizer_service.get_embedding(chunk)
+            with self._session() as db:
+                # Lock the document first; a locked one is already being embedded.
+                # Never wait on the lock: its holder may be a task on this event loop
+                if not db.query(Doc.id).filter(Doc.id == doc_id).with_for_update(skip_locked=True).first():
+                    logger.info(f"Document {doc_id} not found or being embedded elsewhere, skipping")
+                    return
                 
-                if embedding_vector:
-                    embedding = Embedding(
-                        doc_id=doc_id,
-                        chunk_text=chunk,
-                        chunk_start=i * 800,
-                        chunk_end=min((i + 1) * 800, len(doc.text)),
-                        vector=embedding_vector,
-                        model=settings.embed_model
-                    )
-                    embeddings.append(embedding)
-            
-            # Save embeddings to database
-            if embeddings:
-                db.add_all(embeddings)
-                db.commit()
-                logger.info(f"Generated {len(embeddings)} embeddings for document {doc_id}")
+                docs = self._unembedded(db, [doc_id])
+                if not docs:
+                    logger.info(f"Document {doc_id} already has embeddings, skipping")
+                    return
                 
-                # Clear document cache
-                await cache_service.invalidate_cache(f"doc:{doc_id}:*")
-            else:
-                logger.warning(f"No embeddings generated for document {doc_id}")
-            
-            db.close()
+                await self._embed_documents(db, docs)
             
         except Exception as e:
             logger.error(f"Error embedding document {doc_id}: {e}")
-            if 'db' in locals():
-                db.rollback()
-                db.close()
+    
+    def _unembedded(self, db: Session, doc_ids: List[int]) -> List:
+        """
+        (id, org_id, text) rows of the given documents that have no embeddings.
+        
+        Call with the documents' row locks held: every embedding write holds
+        them until it commits, and this query's fresh snapshot sees any write
+        that committed before the locks were taken.
+        """
+        return db.query(Doc.id, Doc.org_id, Doc.text).filter(
+            Doc.id.in_(doc_ids),
+            ~exists().where(Embedding.doc_id == Doc.id)
+        ).all()
+    
+    async def _embed_documents(self, db: Session, docs: Sequence) -> int:
+        """
+        Chunk and embed documents together and insert their embeddings.
+        
+        docs are (id, org_id, text) rows. All chunks go through one embedding
+        call and one multi-row INSERT; returns the number of rows written.
+        """
+        # Each chunk's text is sliced once and shared by the embedding call and its row
+        chunks = [
+            (doc, start, end, doc.text[start:end])
+            for doc in docs
+            for start, end in chunk_spans(doc.text, chunk_size=800, overlap=100)
+        ]
+        if not chunks:
+            return 0
+        
+        # Embed every document's chunks in one batched forward pass
+        vectors = await vectorizer_service.get_embeddings_batch([chunk for *_, chunk in chunks])
+        created_at = datetime.now(timezone.utc)
+        rows = [
+            {
+                "doc_id": doc.id,
+                "chunk_text": chunk,
+                "chunk_start": start,
+                "chunk_end": end,
+                "vector": vector,
+                "model": settings.embed_model,
+                "created_at": created_at
+            }
+            for (doc, start, end, chunk), vector in zip(chunks, vectors)
+            if vector is not None
+        ]
+        if not rows:
+            logger.warning(f"No embeddings generated for documents {[doc.id for doc in docs]}")
+            return 0
+        
+        # Save embeddings to database
+        if not self._copy_embeddings(db, rows):
+            db.execute(insert(Embedding), rows)
+        db.commit()
+        
+        org_ids = {doc.id: doc.org_id for doc in docs}
+        embedded = {row["doc_id"] for row in rows}
+        logger.info(f"Generated {len(rows)} embeddings for {len(embedded)} document(s)")
+        
+        # Cached searches near the new content may now be stale
+        removed = sum(
+            search_service.invalidate_semantic_cache_for_doc(db, doc_id, org_ids[doc_id])
+            for doc_id in embedded
+        )
+        db.commit()
+        if removed:
+            logger.info(f"Invalidated {removed} semantic search cache entries")
+        
+        # Clear document caches
+        for doc_id in embedded:
+            await cache_service.invalidate_cache(f"doc:{doc_id}:*")
+        
+        return len(rows)
+    
+    def _copy_embeddings(self, db: Session, rows: List[Dict[str, Any]]) -> bool:
+        """
+        Stream embedding rows into the session's transaction with binary COPY.
+        
+        Vectors go over the wire as packed halfvecs in one stream rather than
+        a statement per row. Returns False, having written nothing, when the
+        connection isn't psycopg 3 with pgvector available.
+        """
+        conn = db.connection().connection.driver_connection
+        if psycopg is None or not isinstance(conn, psycopg.Connection):
+            return False
+        
+        with conn.cursor() as cur:
+            # Registered on the cursor only, so the session's own queries are unaffected
+            register_vector(cur)
+            with cur.copy(COPY_EMBEDDINGS) as copy:
+                copy.set_types(COPY_TYPES)
+                for row in rows:
+                    values = [row[column] for column in COPY_COLUMNS]
+                    # The column is timestamp without time zone; store the UTC wall time
+                    values[-1] = values[-1].astimezone(timezone.utc).replace(tzinfo=None)
+                    copy.write_row(values)
+        return True
     
     async def _reindex_organization(self, org_id: int):
         """Reindex all documents for an organization."""
         try:
-            db = get_db_session()
+            with self._session() as db:
+                # Get all documents for the organization
+                doc_ids = [
+                    doc_id for doc_id, in
+                    db.query(Doc.id).filter(Doc.org_id == org_id).all()
+                ]
             
-            # Get all documents for the organization
-            docs = db.query(Doc).filter(Doc.org_id == org_id).all()
+            logger.info(f"Reindexing {len(doc_ids)} documents for organization {org_id}")
             
-            logger.info(f"Reindexing {len(docs)} documents for organization {org_id}")
+            # Regenerate embeddings a batch of documents at a time, several batches
+            # in flight so one batch's writes overlap the next one's inference
+            semaphore = asyncio.Semaphore(settings.max_concurrent_embeds)
             
-            # Delete existing embeddings
-            db.query(Embedding).join(Doc).filter(Doc.org_id == org_id).delete()
+            async def embed_batch(batch_ids):
+                async with semaphore:
+                    while batch_ids:
+                        with self._session() as batch_db:
+                            # Delete and re-insert in one transaction under the documents'
+                            # locks, so the pending loop never sees them unembedded
+                            batch = batch_db.query(Doc.id, Doc.org_id, Doc.text).filter(
+                                Doc.id.in_(batch_ids)
+                            ).with_for_update(skip_locked=True, of=Doc).all()
+                            locked = {doc.id for doc in batch}
+                            if batch:
+                                batch_db.execute(delete(Embedding).where(Embedding.doc_id.in_(locked)))
+                                await self._embed_documents(batch_db, batch)
+                                batch_db.commit()
+                            
+                            # Documents another task was embedding are retried after it
+                            # commits (waiting on the lock would block this event loop);
+                            # documents deleted meanwhile drop out
+                            rest = [doc_id for doc_id in batch_ids if doc_id not in locked]
+                            batch_ids = [
+                                doc_id for doc_id, in
+                                batch_db.query(Doc.id).filter(Doc.id.in_(rest)).all()
+                            ] if rest else []
+                        if batch_ids:
+                            await asyncio.sleep(self.pending_interval)
             
-            # Regenerate embeddings
-            for doc in docs:
-                await self._embed_document(doc.id)
+            await asyncio.gather(*(
+                embed_batch(doc_ids[i:i + self.doc_batch_size])
+                for i in range(0, len(doc_ids), self.doc_batch_size)
+            ))
             
             # Clear organization cache
             await cache_service.invalidate_cache(f"org:{org_id}:*")
             
             logger.info(f"Reindexing completed for organization {org_id}")
-            db.close()
             
         except Exception as e:
             logger.error(f"Error reindexing organization {org_id}: {e}")
-            if 'db' in locals():
-                db.rollback()
-                db.close()
-    
-    def _chunk_text(self, text: str, chunk_size: int = 800, overlap: int = 100) -> list:
-        """Split text into overlapping chunks."""
-        if len(text) <= chunk_size:
-            return [text]
-        
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            
-            # Try to break at word boundary
-            if end < len(text):
-                # Find last space before chunk_size
-                last_space = text.rfind(' ', start, end)
-                if last_space > start:
-                    end = last_space + 1
-            
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            
-            # Move start position with overlap
-            start = max(start + 1, end - overlap)
-        
-        return chunks
 
 
 async def main():